@@ -0,0 +1,76 @@
+"""Compress original documents
+
+Revision ID: a3c1e7b9d2f4
+Revises: f8719b5ebefe
+Create Date: 2026-10-19 10:12:41.218733
+
+"""
+from typing import Sequence, Union
+
+from alembic import op, context
+import sqlalchemy as sa
+
+from app.documents.utils import compress_document, decompress_document
+
+
+# pylint: disable=E1101
+
+# revision identifiers, used by Alembic.
+revision: str = 'a3c1e7b9d2f4'
+down_revision: Union[str, None] = 'f8719b5ebefe'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+TABLES = ('xliff_document', 'txt_document')
+
+
+def upgrade() -> None:
+    for table in TABLES:
+        op.add_column(
+            table, sa.Column('original_data', sa.LargeBinary(), nullable=True)
+        )
+
+        if not context.is_offline_mode():
+            connection = op.get_bind()
+            result = connection.execute(
+                sa.text(f'SELECT id, original_document FROM {table}')
+            )
+            for doc_id, original_document in result:
+                connection.execute(
+                    sa.text(
+                        f'UPDATE {table} SET original_data = :data WHERE id = :id'
+                    ),
+                    {
+                        'data': compress_document(original_document.encode('utf-8')),
+                        'id': doc_id,
+                    },
+                )
+
+        op.alter_column(table, 'original_data', nullable=False)
+        op.drop_column(table, 'original_document')
+
+
+def downgrade() -> None:
+    for table in TABLES:
+        op.add_column(
+            table, sa.Column('original_document', sa.String(), nullable=True)
+        )
+
+        if not context.is_offline_mode():
+            connection = op.get_bind()
+            result = connection.execute(
+                sa.text(f'SELECT id, original_data FROM {table}')
+            )
+            for doc_id, original_data in result:
+                connection.execute(
+                    sa.text(
+                        f'UPDATE {table} SET original_document = :data WHERE id = :id'
+                    ),
+                    {
+                        'data': decompress_document(original_data).decode('utf-8'),
+                        'id': doc_id,
+                    },
+                )
+
+        op.alter_column(table, 'original_document', nullable=False)
+        op.drop_column(table, 'original_data')
@@ -0,0 +1,61 @@
+"""Add document record match table
+
+Revision ID: a7c3e9f15b28
+Revises: e4b8c1d7f3a6
+Create Date: 2026-10-19 16:42:08.913527
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# pylint: disable=E1101
+
+# revision identifiers, used by Alembic.
+revision: str = 'a7c3e9f15b28'
+down_revision: Union[str, None] = 'e4b8c1d7f3a6'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.create_table(
+        'document_record_match',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('record_id', sa.Integer(), nullable=False),
+        sa.Column('tm_record_id', sa.Integer(), nullable=False),
+        sa.Column('similarity', sa.Float(), nullable=False),
+        sa.PrimaryKeyConstraint('id'),
+        sa.ForeignKeyConstraint(
+            ['record_id'], ['document_record.id'], ondelete='CASCADE'
+        ),
+    )
+    op.create_index(
+        'document_record_match_record_id_idx',
+        'document_record_match',
+        ['record_id'],
+    )
+    op.add_column(
+        'document',
+        sa.Column('matches_updated_at', sa.DateTime(), nullable=True),
+    )
+    op.create_index(
+        'translation_memory_record_creation_date_idx',
+        'translation_memory_record',
+        ['document_id', 'creation_date'],
+    )
+
+
+def downgrade() -> None:
+    op.drop_index(
+        'translation_memory_record_creation_date_idx',
+        table_name='translation_memory_record',
+    )
+    op.drop_column('document', 'matches_updated_at')
+    op.drop_index(
+        'document_record_match_record_id_idx',
+        table_name='document_record_match',
+    )
+    op.drop_table('document_record_match')
@@ -0,0 +1,48 @@
+"""Add document TM analysis table
+
+Revision ID: b2d8f4a06c91
+Revises: a7c3e9f15b28
+Create Date: 2026-10-19 18:10:45.276304
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# pylint: disable=E1101
+
+# revision identifiers, used by Alembic.
+revision: str = 'b2d8f4a06c91'
+down_revision: Union[str, None] = 'a7c3e9f15b28'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+BANDS = ('repetitions', 'exact', 'fuzzy_95', 'fuzzy_85', 'fuzzy_75', 'no_match')
+
+
+def upgrade() -> None:
+    op.create_table(
+        'document_tm_analysis',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('document_id', sa.Integer(), nullable=False),
+        sa.Column('status', sa.String(), nullable=False),
+        sa.Column('processed_records', sa.Integer(), nullable=False),
+        sa.Column('total_records', sa.Integer(), nullable=False),
+        sa.Column('updated_at', sa.DateTime(), nullable=False),
+        *[
+            sa.Column(f'{band}_{unit}', sa.Integer(), nullable=False)
+            for band in BANDS
+            for unit in ('segments', 'words')
+        ],
+        sa.PrimaryKeyConstraint('id'),
+        sa.UniqueConstraint('document_id'),
+        sa.ForeignKeyConstraint(
+            ['document_id'], ['document.id'], ondelete='CASCADE'
+        ),
+    )
+
+
+def downgrade() -> None:
+    op.drop_table('document_tm_analysis')
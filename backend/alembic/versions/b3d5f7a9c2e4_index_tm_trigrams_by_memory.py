@@ -0,0 +1,40 @@
+"""Index trigrams of translation memory records by memory
+
+Revision ID: b3d5f7a9c2e4
+Revises: f2b7d9c4e1a3
+Create Date: 2026-10-20 10:12:37.402118
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+
+
+# pylint: disable=E1101
+
+# revision identifiers, used by Alembic.
+revision: str = 'b3d5f7a9c2e4'
+down_revision: Union[str, None] = 'f2b7d9c4e1a3'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    # With the memory ID in the index a KNN scan ordered by trigram distance
+    # only walks records of the searched memory, instead of filtering the
+    # nearest records of all memories. btree_gist provides GiST operators
+    # of integers.
+    op.execute('CREATE EXTENSION IF NOT EXISTS btree_gist')
+    op.execute('DROP INDEX trgm_tm_src_idx')
+    op.execute(
+        'CREATE INDEX trgm_tm_memory_src_idx ON translation_memory_record '
+        'USING gist (document_id, source gist_trgm_ops)'
+    )
+
+
+def downgrade() -> None:
+    op.execute('DROP INDEX trgm_tm_memory_src_idx')
+    op.execute(
+        'CREATE INDEX trgm_tm_src_idx ON translation_memory_record '
+        'USING gist (source gist_trgm_ops)'
+    )
@@ -0,0 +1,39 @@
+"""Add document record paging indexes
+
+Revision ID: b7e2d4f61a08
+Revises: a3c1e7b9d2f4
+Create Date: 2026-10-19 11:03:27.541902
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+
+
+# pylint: disable=E1101
+
+# revision identifiers, used by Alembic.
+revision: str = 'b7e2d4f61a08'
+down_revision: Union[str, None] = 'a3c1e7b9d2f4'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.create_index(
+        'document_record_document_id_idx',
+        'document_record',
+        ['document_id', 'id'],
+        unique=False,
+    )
+    op.create_index(
+        'record_comment_record_id_idx',
+        'record_comment',
+        ['record_id'],
+        unique=False,
+    )
+
+
+def downgrade() -> None:
+    op.drop_index('record_comment_record_id_idx', table_name='record_comment')
+    op.drop_index('document_record_document_id_idx', table_name='document_record')
@@ -0,0 +1,55 @@
+"""Add repetition group to document record
+
+Revision ID: c5f8a2e90d13
+Revises: b7e2d4f61a08
+Create Date: 2026-10-19 11:48:05.716240
+
+"""
+from typing import Sequence, Union
+
+from alembic import op, context
+import sqlalchemy as sa
+
+from app.documents.utils import repetition_group
+
+
+# pylint: disable=E1101
+
+# revision identifiers, used by Alembic.
+revision: str = 'c5f8a2e90d13'
+down_revision: Union[str, None] = 'b7e2d4f61a08'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.add_column(
+        'document_record',
+        sa.Column('repetition_group', sa.String(), nullable=True),
+    )
+
+    if not context.is_offline_mode():
+        connection = op.get_bind()
+        result = connection.execute(sa.text('SELECT id, source FROM document_record'))
+        for record_id, source in result:
+            connection.execute(
+                sa.text(
+                    'UPDATE document_record SET repetition_group = :group WHERE id = :record_id'
+                ),
+                {'group': repetition_group(source), 'record_id': record_id},
+            )
+
+    op.alter_column('document_record', 'repetition_group', nullable=False)
+    op.create_index(
+        'document_record_repetition_group_idx',
+        'document_record',
+        ['document_id', 'repetition_group'],
+        unique=False,
+    )
+
+
+def downgrade() -> None:
+    op.drop_index(
+        'document_record_repetition_group_idx', table_name='document_record'
+    )
+    op.drop_column('document_record', 'repetition_group')
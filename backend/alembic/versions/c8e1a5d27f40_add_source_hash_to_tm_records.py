@@ -0,0 +1,44 @@
+"""Add source hash to translation memory records
+
+Revision ID: c8e1a5d27f40
+Revises: b2d8f4a06c91
+Create Date: 2026-10-19 19:25:31.604418
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# pylint: disable=E1101
+
+# revision identifiers, used by Alembic.
+revision: str = 'c8e1a5d27f40'
+down_revision: Union[str, None] = 'b2d8f4a06c91'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.add_column(
+        'translation_memory_record',
+        sa.Column('source_hash', sa.String(), nullable=True),
+    )
+    # same as app.translation_memory.utils.source_hash()
+    op.execute('UPDATE translation_memory_record SET source_hash = md5(source)')
+    op.alter_column('translation_memory_record', 'source_hash', nullable=False)
+    op.create_index(
+        'translation_memory_record_source_hash_idx',
+        'translation_memory_record',
+        ['document_id', 'source_hash'],
+        unique=False,
+    )
+
+
+def downgrade() -> None:
+    op.drop_index(
+        'translation_memory_record_source_hash_idx',
+        table_name='translation_memory_record',
+    )
+    op.drop_column('translation_memory_record', 'source_hash')
@@ -0,0 +1,29 @@
+"""Keep sources of translation memory records non-unique
+
+Revision ID: d3f9b6e2a1c8
+Revises: c8e1a5d27f40
+Create Date: 2026-10-19 20:41:07.218530
+
+"""
+from typing import Sequence, Union
+
+
+# pylint: disable=E1101
+
+# revision identifiers, used by Alembic.
+revision: str = 'd3f9b6e2a1c8'
+down_revision: Union[str, None] = 'c8e1a5d27f40'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    # This revision used to delete all but the newest record of every source
+    # and make the source hash index unique. Records of a source are kept,
+    # a memory may have several translations of it, and writes merge them
+    # in the application, see TranslationMemoryQuery.upsert_records().
+    pass
+
+
+def downgrade() -> None:
+    pass
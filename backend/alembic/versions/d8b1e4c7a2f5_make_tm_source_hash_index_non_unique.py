@@ -0,0 +1,34 @@
+"""Make the source hash index of translation memory records non-unique
+
+Revision ID: d8b1e4c7a2f5
+Revises: b3d5f7a9c2e4
+Create Date: 2026-10-20 14:05:51.630274
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+
+
+# pylint: disable=E1101
+
+# revision identifiers, used by Alembic.
+revision: str = 'd8b1e4c7a2f5'
+down_revision: Union[str, None] = 'b3d5f7a9c2e4'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    # databases upgraded by an earlier version of d3f9b6e2a1c8 have a unique
+    # index, a memory may have several records of a source
+    op.execute('DROP INDEX IF EXISTS translation_memory_record_source_hash_idx')
+    op.execute(
+        'CREATE INDEX translation_memory_record_source_hash_idx '
+        'ON translation_memory_record (document_id, source_hash)'
+    )
+
+
+def downgrade() -> None:
+    # the index is not made unique again, sources may be duplicated by now
+    pass
@@ -0,0 +1,33 @@
+"""Add snapshot to segment history
+
+Revision ID: d9a4b6c3e215
+Revises: c5f8a2e90d13
+Create Date: 2026-10-19 12:37:52.904117
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# pylint: disable=E1101
+
+# revision identifiers, used by Alembic.
+revision: str = 'd9a4b6c3e215'
+down_revision: Union[str, None] = 'c5f8a2e90d13'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    # existing chains have no snapshots, reconstruction falls back to a full
+    # replay for them until new entries are written
+    op.add_column(
+        'document_record_history',
+        sa.Column('snapshot', sa.String(), nullable=True),
+    )
+
+
+def downgrade() -> None:
+    op.drop_column('document_record_history', 'snapshot')
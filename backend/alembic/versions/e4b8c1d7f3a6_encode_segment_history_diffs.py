@@ -0,0 +1,69 @@
+"""Encode segment history diffs
+
+Revision ID: e4b8c1d7f3a6
+Revises: d9a4b6c3e215
+Create Date: 2026-10-19 14:05:17.442081
+
+"""
+from typing import Sequence, Union
+
+from alembic import op, context
+import sqlalchemy as sa
+
+from app.documents.utils import decode_diff, encode_diff
+
+
+# pylint: disable=E1101
+
+# revision identifiers, used by Alembic.
+revision: str = 'e4b8c1d7f3a6'
+down_revision: Union[str, None] = 'd9a4b6c3e215'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.add_column(
+        'document_record_history',
+        sa.Column('diff_data', sa.LargeBinary(), nullable=True),
+    )
+
+    if not context.is_offline_mode():
+        connection = op.get_bind()
+        result = connection.execute(
+            sa.text('SELECT id, diff FROM document_record_history')
+        )
+        for history_id, diff in result:
+            connection.execute(
+                sa.text(
+                    'UPDATE document_record_history SET diff_data = :data '
+                    'WHERE id = :id'
+                ),
+                {'data': encode_diff(diff), 'id': history_id},
+            )
+
+    op.alter_column('document_record_history', 'diff_data', nullable=False)
+    op.drop_column('document_record_history', 'diff')
+
+
+def downgrade() -> None:
+    op.add_column(
+        'document_record_history',
+        sa.Column('diff', sa.String(), nullable=True),
+    )
+
+    if not context.is_offline_mode():
+        connection = op.get_bind()
+        result = connection.execute(
+            sa.text('SELECT id, diff_data FROM document_record_history')
+        )
+        for history_id, diff_data in result:
+            connection.execute(
+                sa.text(
+                    'UPDATE document_record_history SET diff = :data WHERE id = :id'
+                ),
+                {'data': decode_diff(diff_data), 'id': history_id},
+            )
+
+    op.alter_column('document_record_history', 'diff', nullable=False)
+    op.drop_column('document_record_history', 'diff_data')
@@ -0,0 +1,52 @@
+"""Add language pairs of projects and translation memories
+
+Revision ID: e6a2c4f8b913
+Revises: d3f9b6e2a1c8
+Create Date: 2026-10-19 22:04:52.371096
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# pylint: disable=E1101
+
+# revision identifiers, used by Alembic.
+revision: str = 'e6a2c4f8b913'
+down_revision: Union[str, None] = 'd3f9b6e2a1c8'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    # everything before was English to Russian
+    for table in ('translation_memory', 'projects'):
+        op.add_column(
+            table,
+            sa.Column(
+                'source_language', sa.String(), server_default='en', nullable=False
+            ),
+        )
+        op.add_column(
+            table,
+            sa.Column(
+                'target_language', sa.String(), server_default='ru', nullable=False
+            ),
+        )
+    op.create_index(
+        'translation_memory_language_pair_idx',
+        'translation_memory',
+        ['source_language', 'target_language'],
+        unique=False,
+    )
+
+
+def downgrade() -> None:
+    op.drop_index(
+        'translation_memory_language_pair_idx', table_name='translation_memory'
+    )
+    for table in ('translation_memory', 'projects'):
+        op.drop_column(table, 'target_language')
+        op.drop_column(table, 'source_language')
@@ -0,0 +1,111 @@
+"""Partition translation memory records by memory
+
+Revision ID: f2b7d9c4e1a3
+Revises: e6a2c4f8b913
+Create Date: 2026-10-19 23:41:08.529310
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+
+
+# pylint: disable=E1101
+
+# revision identifiers, used by Alembic.
+revision: str = 'f2b7d9c4e1a3'
+down_revision: Union[str, None] = 'e6a2c4f8b913'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def create_indexes() -> None:
+    # created on the parent, every partition gets its own copy
+    op.execute(
+        'CREATE INDEX trgm_tm_src_idx ON translation_memory_record '
+        'USING gist (source gist_trgm_ops)'
+    )
+    op.execute(
+        'CREATE INDEX translation_memory_record_source_hash_idx '
+        'ON translation_memory_record (document_id, source_hash)'
+    )
+    op.execute(
+        'CREATE INDEX translation_memory_record_creation_date_idx '
+        'ON translation_memory_record (document_id, creation_date)'
+    )
+    op.execute(
+        'ALTER TABLE translation_memory_record '
+        'ADD CONSTRAINT translation_memory_record_document_id_fkey '
+        'FOREIGN KEY (document_id) REFERENCES translation_memory (id)'
+    )
+
+
+def own_sequence(old_table: str) -> None:
+    # the table was renamed from tmx_record, its sequence kept the old name
+    op.execute(
+        f"""
+        DO $$
+        BEGIN
+            EXECUTE format(
+                'ALTER SEQUENCE %s OWNED BY translation_memory_record.id',
+                pg_get_serial_sequence('{old_table}', 'id')
+            );
+        END $$
+        """
+    )
+
+
+def upgrade() -> None:
+    # Records are partitioned by LIST of memory IDs. All memories are in the
+    # default partition until a large one is moved to a partition of its own
+    # with `manage.py partition-tm`. The primary key has to include
+    # the partition key.
+    op.execute(
+        'ALTER TABLE translation_memory_record '
+        'RENAME TO translation_memory_record_unpartitioned'
+    )
+    op.execute(
+        'CREATE TABLE translation_memory_record '
+        '(LIKE translation_memory_record_unpartitioned INCLUDING DEFAULTS) '
+        'PARTITION BY LIST (document_id)'
+    )
+    op.execute(
+        'CREATE TABLE translation_memory_record_default '
+        'PARTITION OF translation_memory_record DEFAULT'
+    )
+    op.execute(
+        'INSERT INTO translation_memory_record '
+        'SELECT * FROM translation_memory_record_unpartitioned'
+    )
+    own_sequence('translation_memory_record_unpartitioned')
+    op.execute('DROP TABLE translation_memory_record_unpartitioned')
+    op.execute(
+        'ALTER TABLE translation_memory_record '
+        'ADD CONSTRAINT translation_memory_record_pkey PRIMARY KEY (id, document_id)'
+    )
+    create_indexes()
+    op.execute('ANALYZE translation_memory_record')
+
+
+def downgrade() -> None:
+    op.execute(
+        'ALTER TABLE translation_memory_record '
+        'RENAME TO translation_memory_record_partitioned'
+    )
+    op.execute(
+        'CREATE TABLE translation_memory_record '
+        '(LIKE translation_memory_record_partitioned INCLUDING DEFAULTS)'
+    )
+    op.execute(
+        'INSERT INTO translation_memory_record '
+        'SELECT * FROM translation_memory_record_partitioned'
+    )
+    own_sequence('translation_memory_record_partitioned')
+    # drops all partitions as well
+    op.execute('DROP TABLE translation_memory_record_partitioned')
+    op.execute(
+        'ALTER TABLE translation_memory_record '
+        'ADD CONSTRAINT translation_memory_record_pkey PRIMARY KEY (id)'
+    )
+    create_indexes()
+    op.execute('ANALYZE translation_memory_record')
@@ -0,0 +1,58 @@
+"""Helpers shared by query classes."""
+
+import json
+
+from sqlalchemy import Select, func, select
+from sqlalchemy.orm import Session
+
+from app.base.schema import CountMode
+
+# rows counted at most when a count is not exact
+COUNT_CAP = 10000
+
+
+def count_rows(db: Session, query: Select, mode: CountMode) -> tuple[int, bool]:
+    """
+    Count rows returned by a query.
+
+    Args:
+        db: Database session
+        query: Query to count rows of
+        mode: How to count them
+
+    Returns:
+        Number of rows and whether it is estimated, a capped count larger
+        than COUNT_CAP is reported as COUNT_CAP
+    """
+    if mode == CountMode.exact:
+        total = db.execute(
+            select(func.count()).select_from(query.order_by(None).subquery())
+        ).scalar_one()
+        return total, False
+
+    if mode == CountMode.estimate and db.get_bind().dialect.name == "postgresql":
+        estimate = plan_rows(db, query)
+        if estimate > COUNT_CAP:
+            return estimate, True
+
+    capped = db.execute(
+        select(func.count()).select_from(
+            query.order_by(None).limit(COUNT_CAP + 1).subquery()
+        )
+    ).scalar_one()
+    if capped > COUNT_CAP:
+        return COUNT_CAP, True
+    return capped, False
+
+
+def plan_rows(db: Session, query: Select) -> int:
+    """Get the number of rows the PostgreSQL planner expects from a query."""
+    compiled = query.order_by(None).compile(
+        dialect=db.get_bind().dialect, compile_kwargs={"literal_binds": True}
+    )
+    plan = db.connection().exec_driver_sql(f"EXPLAIN (FORMAT JSON) {compiled}")
+    output = plan.scalar_one()
+    # psycopg parses json, other drivers may return text
+    if isinstance(output, str):
+        output = json.loads(output)
+    return int(output[0]["Plan"]["Plan Rows"])
@@ -1,6 +1,17 @@
 import datetime
+from enum import Enum
+from typing import Annotated
 
-from pydantic import BaseModel
+from pydantic import BaseModel, StringConstraints
+
+# language code like en or pt-BR, kept lowercase to compare codes of TMX
+# files, memories and projects
+LanguageCode = Annotated[
+    str,
+    StringConstraints(
+        pattern=r"^[A-Za-z]{2,3}(-[A-Za-z0-9]{1,8})*$", max_length=35, to_lower=True
+    ),
+]
 
 
 class Identified(BaseModel):
@@ -10,3 +21,12 @@ class Identified(BaseModel):
 class IdentifiedTimestampedModel(Identified):
     created_at: datetime.datetime
     updated_at: datetime.datetime
+
+
+class CountMode(Enum):
+    # COUNT(*) of all matching rows
+    exact = "exact"
+    # rows are counted up to a cap, larger totals are reported as the cap
+    capped = "capped"
+    # row estimate of the query plan in PostgreSQL, small totals are counted
+    estimate = "estimate"
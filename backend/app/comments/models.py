@@ -1,7 +1,7 @@
 from datetime import UTC, datetime
 from typing import TYPE_CHECKING
 
-from sqlalchemy import ForeignKey
+from sqlalchemy import ForeignKey, Index
 from sqlalchemy.orm import Mapped, mapped_column, relationship
 
 from app.db import Base
@@ -26,3 +26,6 @@ class Comment(Base):
 
     created_by_user: Mapped["User"] = relationship("User", back_populates="comments")
     document_record: Mapped["DocumentRecord"] = relationship(back_populates="comments")
+
+
+Index("record_comment_record_id_idx", Comment.record_id)
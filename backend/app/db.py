@@ -1,11 +1,146 @@
-from sqlalchemy import create_engine
-from sqlalchemy.orm import declarative_base, sessionmaker
+import threading
+import time
+import uuid
+from typing import Annotated, AsyncIterator, Callable, TypeVar, cast
 
-from app.settings import settings
+from fastapi import Depends
+from fastapi.concurrency import run_in_threadpool
+from sqlalchemy import Engine, create_engine, event
+from sqlalchemy.exc import TimeoutError as PoolTimeoutError
+from sqlalchemy.ext.asyncio import (
+    AsyncEngine,
+    AsyncSession,
+    async_sessionmaker,
+    create_async_engine,
+)
+from sqlalchemy.orm import Session, declarative_base, sessionmaker
+from sqlalchemy.pool import QueuePool
+from sqlalchemy.util import await_only
+from sqlalchemy.util.concurrency import in_greenlet
 
-engine = create_engine(settings.database_url)
+from app.settings import Settings, settings
+
+T = TypeVar("T")
+
+
+class MeasuredQueuePool(QueuePool):
+    """Queue pool which keeps statistics of waiting for a connection."""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._stats_lock = threading.Lock()
+        self.checkouts = 0
+        self.timeouts = 0
+        self.wait_time = 0.0
+        self.max_wait_time = 0.0
+
+    def _do_get(self):
+        start = time.perf_counter()
+        try:
+            connection = super()._do_get()
+        except PoolTimeoutError:
+            # failing connections are not waiting for the pool
+            with self._stats_lock:
+                self.timeouts += 1
+            raise
+        elapsed = time.perf_counter() - start
+        with self._stats_lock:
+            self.checkouts += 1
+            self.wait_time += elapsed
+            self.max_wait_time = max(self.max_wait_time, elapsed)
+        return connection
+
+    def metrics(self) -> dict[str, int | float]:
+        with self._stats_lock:
+            return {
+                "size": self.size(),
+                "checked_in": self.checkedin(),
+                "checked_out": self.checkedout(),
+                "overflow": self.overflow(),
+                "checkouts": self.checkouts,
+                "timeouts": self.timeouts,
+                "wait_time": self.wait_time,
+                "max_wait_time": self.max_wait_time,
+            }
+
+
+def _pool_options(config: Settings) -> dict:
+    return {
+        "pool_size": config.db_pool_size,
+        "max_overflow": config.db_max_overflow,
+        "pool_timeout": config.db_pool_timeout,
+        "pool_recycle": config.db_pool_recycle,
+        "pool_pre_ping": config.db_pool_pre_ping,
+    }
+
+
+def _set_local_statement_timeout(db_engine: Engine, timeout: int):
+    @event.listens_for(db_engine, "begin")
+    def set_statement_timeout(conn):
+        conn.exec_driver_sql(f"SET LOCAL statement_timeout = {timeout}")
+
+
+def create_db_engine(config: Settings) -> Engine:
+    connect_args = {}
+    if config.db_statement_timeout and not config.db_pgbouncer:
+        connect_args["options"] = f"-c statement_timeout={config.db_statement_timeout}"
+
+    db_engine = create_engine(
+        config.database_url,
+        poolclass=MeasuredQueuePool,
+        connect_args=connect_args,
+        **_pool_options(config),
+    )
+
+    if config.db_statement_timeout and config.db_pgbouncer:
+        _set_local_statement_timeout(db_engine, config.db_statement_timeout)
+
+    return db_engine
+
+
+def create_async_db_engine(config: Settings) -> AsyncEngine | None:
+    if not config.async_database_url:
+        return None
+
+    connect_args: dict = {}
+    if config.db_pgbouncer:
+        # statements prepared on one server connection are not visible on
+        # another one PgBouncer may route the next transaction to
+        connect_args["statement_cache_size"] = 0
+        connect_args["prepared_statement_cache_size"] = 0
+        connect_args["prepared_statement_name_func"] = (
+            lambda: f"__asyncpg_{uuid.uuid4()}__"
+        )
+    elif config.db_statement_timeout:
+        connect_args["server_settings"] = {
+            "statement_timeout": str(config.db_statement_timeout)
+        }
+
+    db_engine = create_async_engine(
+        config.async_database_url, connect_args=connect_args, **_pool_options(config)
+    )
+
+    if config.db_statement_timeout and config.db_pgbouncer:
+        _set_local_statement_timeout(db_engine.sync_engine, config.db_statement_timeout)
+
+    return db_engine
+
+
+engine = create_db_engine(settings)
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
+async_engine = create_async_db_engine(settings)
+AsyncSessionLocal = (
+    async_sessionmaker(async_engine, autoflush=False, expire_on_commit=False)
+    if async_engine
+    else None
+)
+
+
+def pool_metrics() -> dict[str, int | float]:
+    return cast(MeasuredQueuePool, engine.pool).metrics()
+
+
 Base = declarative_base()
 
 
@@ -15,3 +150,50 @@ def get_db():
         yield db
     finally:
         db.close()
+
+
+async def get_async_db() -> AsyncIterator[AsyncSession | None]:
+    if AsyncSessionLocal is None:
+        yield None
+        return
+    async with AsyncSessionLocal() as db:
+        yield db
+
+
+class DbRunner:
+    """
+    Runs sync database code either on an async session, without occupying
+    a threadpool worker while waiting on the database, or on a sync session
+    in the threadpool if the async database is not configured.
+
+    The async session runs the code on the event loop thread, CPU-bound
+    parts of it, such as fuzzy matching or stemming, go through
+    run_cpu_bound() to get off the loop.
+    """
+
+    def __init__(self, db: Session, async_db: AsyncSession | None) -> None:
+        self.__db = db
+        self.__async_db = async_db
+
+    async def run(self, fn: Callable[[Session], T]) -> T:
+        if self.__async_db is not None:
+            return await self.__async_db.run_sync(fn)
+        return await run_in_threadpool(fn, self.__db)
+
+
+def run_cpu_bound(fn: Callable[..., T], *args) -> T:
+    """
+    Run CPU-bound code without database access. Code run by DbRunner on an
+    async session waits for it in the threadpool, leaving the event loop to
+    other requests, elsewhere it is called directly.
+    """
+    if in_greenlet():
+        return await_only(run_in_threadpool(fn, *args))
+    return fn(*args)
+
+
+def get_db_runner(
+    db: Annotated[Session, Depends(get_db)],
+    async_db: Annotated[AsyncSession | None, Depends(get_async_db)],
+) -> DbRunner:
+    return DbRunner(db, async_db)
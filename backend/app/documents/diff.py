@@ -0,0 +1,157 @@
+"""Diff engines producing opcodes for segment history diffs."""
+
+import difflib
+import re
+from typing import Callable, Sequence
+
+# Same shape as difflib.SequenceMatcher.get_opcodes()
+Opcode = tuple[str, int, int, int, int]
+DiffEngine = Callable[[str, str], list[Opcode]]
+
+# Number of edits after which Myers gives up and replaces the whole changed
+# span, this keeps the worst case of completely rewritten segments linear
+MYERS_MAX_COST = 300
+
+_TOKEN_RE = re.compile(r"\w+|\s+|[^\w\s]", re.UNICODE)
+
+
+def _trim(a: Sequence, b: Sequence) -> tuple[int, int]:
+    """Get lengths of common prefix and suffix of two sequences."""
+    limit = min(len(a), len(b))
+    prefix = 0
+    while prefix < limit and a[prefix] == b[prefix]:
+        prefix += 1
+    suffix = 0
+    limit -= prefix
+    while suffix < limit and a[-1 - suffix] == b[-1 - suffix]:
+        suffix += 1
+    return prefix, suffix
+
+
+def _myers_blocks(
+    a: Sequence, b: Sequence, max_cost: int
+) -> list[tuple[int, int, int]] | None:
+    """
+    Find matching blocks (i, j, size) of two sequences with the Myers O(ND)
+    algorithm. Returns None if more than max_cost edits are needed.
+    """
+    n, m = len(a), len(b)
+    v = {1: 0}
+    trace: list[dict[int, int]] = []
+    for d in range(min(n + m, max_cost) + 1):
+        trace.append(v.copy())
+        for k in range(-d, d + 1, 2):
+            if k == -d or (k != d and v[k - 1] < v[k + 1]):
+                x = v[k + 1]
+            else:
+                x = v[k - 1] + 1
+            y = x - k
+            while x < n and y < m and a[x] == b[y]:
+                x += 1
+                y += 1
+            v[k] = x
+            if x >= n and y >= m:
+                return _backtrack(trace, n, m)
+    return None
+
+
+def _backtrack(
+    trace: list[dict[int, int]], x: int, y: int
+) -> list[tuple[int, int, int]]:
+    blocks: list[tuple[int, int, int]] = []
+    for d in range(len(trace) - 1, -1, -1):
+        v = trace[d]
+        k = x - y
+        if k == -d or (k != d and v[k - 1] < v[k + 1]):
+            prev_k = k + 1
+        else:
+            prev_k = k - 1
+        prev_x = v[prev_k]
+        prev_y = prev_x - prev_k
+        # the snake starts after a single deletion or insertion move
+        if d == 0:
+            start_x = 0
+        elif prev_k == k + 1:
+            start_x = prev_x
+        else:
+            start_x = prev_x + 1
+        size = x - start_x
+        if size > 0:
+            blocks.append((x - size, y - size, size))
+        x, y = prev_x, prev_y
+    blocks.reverse()
+    return blocks
+
+
+def _opcodes(blocks: list[tuple[int, int, int]], n: int, m: int) -> list[Opcode]:
+    """Convert matching blocks to opcodes, see SequenceMatcher.get_opcodes()."""
+    opcodes: list[Opcode] = []
+    i = j = 0
+    for ai, bj, size in [*blocks, (n, m, 0)]:
+        if i < ai and j < bj:
+            opcodes.append(("replace", i, ai, j, bj))
+        elif i < ai:
+            opcodes.append(("delete", i, ai, j, bj))
+        elif j < bj:
+            opcodes.append(("insert", i, ai, j, bj))
+        if size:
+            if opcodes and opcodes[-1][0] == "equal":
+                _, i1, _, j1, _ = opcodes.pop()
+                opcodes.append(("equal", i1, ai + size, j1, bj + size))
+            else:
+                opcodes.append(("equal", ai, ai + size, bj, bj + size))
+        i, j = ai + size, bj + size
+    return opcodes
+
+
+def _myers_opcodes(a: Sequence, b: Sequence) -> list[Opcode]:
+    prefix, suffix = _trim(a, b)
+    middle_a = a[prefix : len(a) - suffix]
+    middle_b = b[prefix : len(b) - suffix]
+    blocks = _myers_blocks(middle_a, middle_b, MYERS_MAX_COST) or []
+    blocks = [(i + prefix, j + prefix, size) for i, j, size in blocks]
+    if prefix:
+        blocks.insert(0, (0, 0, prefix))
+    if suffix:
+        blocks.append((len(a) - suffix, len(b) - suffix, suffix))
+    return _opcodes(blocks, len(a), len(b))
+
+
+def difflib_opcodes(old_text: str, new_text: str) -> list[Opcode]:
+    """Character level opcodes from difflib.SequenceMatcher."""
+    return difflib.SequenceMatcher(None, old_text, new_text).get_opcodes()
+
+
+def char_opcodes(old_text: str, new_text: str) -> list[Opcode]:
+    """Character level opcodes from the Myers algorithm."""
+    return _myers_opcodes(old_text, new_text)
+
+
+def word_opcodes(old_text: str, new_text: str) -> list[Opcode]:
+    """
+    Word level opcodes from the Myers algorithm. Texts are split into words,
+    whitespace runs and punctuation, positions are mapped back to characters.
+    """
+    old_tokens = _TOKEN_RE.findall(old_text)
+    new_tokens = _TOKEN_RE.findall(new_text)
+    old_offsets = _offsets(old_tokens)
+    new_offsets = _offsets(new_tokens)
+    return [
+        (tag, old_offsets[i1], old_offsets[i2], new_offsets[j1], new_offsets[j2])
+        for tag, i1, i2, j1, j2 in _myers_opcodes(old_tokens, new_tokens)
+    ]
+
+
+def _offsets(tokens: list[str]) -> list[int]:
+    offsets = [0]
+    for token in tokens:
+        offsets.append(offsets[-1] + len(token))
+    return offsets
+
+
+DIFF_ENGINES: dict[str, DiffEngine] = {
+    "difflib": difflib_opcodes,
+    "char": char_opcodes,
+    "word": word_opcodes,
+}
+DEFAULT_DIFF_ENGINE = "word"
@@ -1,12 +1,21 @@
 from datetime import UTC, datetime
 from enum import Enum
-from typing import TYPE_CHECKING
+from typing import TYPE_CHECKING, Iterator
 
 from sqlalchemy import Enum as SqlEnum
-from sqlalchemy import ForeignKey, Index
-from sqlalchemy.orm import Mapped, mapped_column, relationship
+from sqlalchemy import ForeignKey, Index, LargeBinary
+from sqlalchemy.engine.default import DefaultExecutionContext
+from sqlalchemy.orm import Mapped, mapped_column, relationship, validates
 
 from app.db import Base
+from app.documents.utils import (
+    compress_document,
+    decode_diff,
+    decompress_document,
+    encode_diff,
+    iter_decompressed,
+    repetition_group,
+)
 
 if TYPE_CHECKING:
     from app.comments.models import Comment
@@ -18,6 +27,10 @@ def utc_time():
     return datetime.now(UTC)
 
 
+def source_repetition_group(context: DefaultExecutionContext) -> str:
+    return repetition_group(context.get_current_parameters()["source"])
+
+
 class DocumentRecordHistoryChangeType(Enum):
     initial_import = "initial_import"
     machine_translation = "machine_translation"
@@ -33,6 +46,24 @@ class TmMode(Enum):
     write = "write"
 
 
+class TmAnalysisStatus(Enum):
+    pending = "pending"
+    processing = "processing"
+    done = "done"
+
+
+# Bands of TM leverage analysis, columns of DocumentTmAnalysis are named
+# <band>_segments and <band>_words
+TM_ANALYSIS_BANDS = (
+    "repetitions",
+    "exact",
+    "fuzzy_95",
+    "fuzzy_85",
+    "fuzzy_75",
+    "no_match",
+)
+
+
 class DocumentType(Enum):
     xliff = "xliff"
     txt = "txt"
@@ -48,6 +79,8 @@ class Document(Base):
     processing_status: Mapped[str] = mapped_column()
     upload_time: Mapped[datetime] = mapped_column(default=utc_time)
     project_id: Mapped[int] = mapped_column(ForeignKey("projects.id"))
+    # when fuzzy TM matches of records were computed, None if they are missing
+    matches_updated_at: Mapped[datetime | None] = mapped_column(default=None)
 
     records: Mapped[list["DocumentRecord"]] = relationship(
         back_populates="document",
@@ -62,6 +95,9 @@ class Document(Base):
     txt: Mapped["TxtDocument"] = relationship(
         back_populates="parent", cascade="all, delete-orphan"
     )
+    tm_analysis: Mapped["DocumentTmAnalysis | None"] = relationship(
+        cascade="all, delete-orphan", passive_deletes=True
+    )
 
 
 class DocumentRecord(Base):
@@ -73,6 +109,9 @@ class DocumentRecord(Base):
     target: Mapped[str] = mapped_column()
     approved: Mapped[bool] = mapped_column(default=False)
     word_count: Mapped[int] = mapped_column(default=0)
+    # of the source, kept up to date when the source is assigned, Core
+    # statements changing sources have to set it too
+    repetition_group: Mapped[str] = mapped_column(default=source_repetition_group)
 
     document: Mapped["Document"] = relationship(back_populates="records")
     comments: Mapped[list["Comment"]] = relationship(
@@ -85,14 +124,42 @@ class DocumentRecord(Base):
         cascade="all, delete-orphan",
         order_by="DocumentRecordHistory.timestamp.desc()",
     )
+    matches: Mapped[list["DocumentRecordMatch"]] = relationship(
+        cascade="all, delete-orphan", passive_deletes=True
+    )
+
+    @validates("source")
+    def validate_source(self, _key: str, source: str) -> str:
+        self.repetition_group = repetition_group(source)
+        return source
+
+
+class OriginalDocumentMixin:
+    # Original file is stored gzip-compressed and is never loaded together with
+    # the row, only when it is explicitly accessed.
+    original_data: Mapped[bytes] = mapped_column(LargeBinary, deferred=True)
+
+    @property
+    def original_document(self) -> str:
+        return self.original_bytes.decode("utf-8")
+
+    @original_document.setter
+    def original_document(self, value: str) -> None:
+        self.original_data = compress_document(value.encode("utf-8"))
+
+    @property
+    def original_bytes(self) -> bytes:
+        return decompress_document(self.original_data)
+
+    def iter_original(self) -> Iterator[bytes]:
+        return iter_decompressed(self.original_data)
 
 
-class TxtDocument(Base):
+class TxtDocument(OriginalDocumentMixin, Base):
     __tablename__ = "txt_document"
 
     id: Mapped[int] = mapped_column(primary_key=True)
     parent_id: Mapped[int] = mapped_column(ForeignKey("document.id"))
-    original_document: Mapped[str] = mapped_column()
 
     records: Mapped[list["TxtRecord"]] = relationship(
         back_populates="document",
@@ -114,12 +181,11 @@ class TxtRecord(Base):
     document: Mapped["TxtDocument"] = relationship(back_populates="records")
 
 
-class XliffDocument(Base):
+class XliffDocument(OriginalDocumentMixin, Base):
     __tablename__ = "xliff_document"
 
     id: Mapped[int] = mapped_column(primary_key=True)
     parent_id: Mapped[int] = mapped_column(ForeignKey("document.id"))
-    original_document: Mapped[str] = mapped_column()
 
     records: Mapped[list["XliffRecord"]] = relationship(
         back_populates="document",
@@ -148,7 +214,10 @@ class DocumentRecordHistory(Base):
 
     id: Mapped[int] = mapped_column(primary_key=True)
     record_id: Mapped[int] = mapped_column(ForeignKey("document_record.id"))
-    diff: Mapped[str] = mapped_column()
+    # binary encoded diff, see app.documents.utils.compute_encoded_diff
+    diff_data: Mapped[bytes] = mapped_column(LargeBinary)
+    # full text after this change, stored periodically to bound reconstruction
+    snapshot: Mapped[str | None] = mapped_column(default=None)
     author_id: Mapped[int | None] = mapped_column(ForeignKey("user.id"), nullable=True)
     timestamp: Mapped[datetime] = mapped_column(default=utc_time)
     change_type: Mapped[DocumentRecordHistoryChangeType] = mapped_column(
@@ -158,5 +227,72 @@ class DocumentRecordHistory(Base):
     record: Mapped["DocumentRecord"] = relationship(back_populates="history")
     author: Mapped["User"] = relationship()
 
+    @property
+    def diff(self) -> str:
+        return decode_diff(self.diff_data)
+
+    @diff.setter
+    def diff(self, value: str) -> None:
+        self.diff_data = encode_diff(value)
+
+
+class DocumentRecordMatch(Base):
+    """Precomputed fuzzy match of a document record in a translation memory"""
+
+    __tablename__ = "document_record_match"
+
+    id: Mapped[int] = mapped_column(primary_key=True)
+    record_id: Mapped[int] = mapped_column(
+        ForeignKey("document_record.id", ondelete="CASCADE")
+    )
+    # not a foreign key, matches of deleted TM records are skipped on read
+    tm_record_id: Mapped[int] = mapped_column()
+    similarity: Mapped[float] = mapped_column()
+
+
+class DocumentTmAnalysis(Base):
+    """
+    Leverage of project memories for a document: segments and words falling
+    into in-document repetitions and TM match bands. Counters grow while the
+    worker processes the document, see app.services.analysis_service.
+    """
+
+    __tablename__ = "document_tm_analysis"
+
+    id: Mapped[int] = mapped_column(primary_key=True)
+    document_id: Mapped[int] = mapped_column(
+        ForeignKey("document.id", ondelete="CASCADE"), unique=True
+    )
+    status: Mapped[TmAnalysisStatus] = mapped_column(
+        SqlEnum(TmAnalysisStatus, native_enum=False)
+    )
+    processed_records: Mapped[int] = mapped_column(default=0)
+    total_records: Mapped[int] = mapped_column(default=0)
+    updated_at: Mapped[datetime] = mapped_column(default=utc_time)
+
+    repetitions_segments: Mapped[int] = mapped_column(default=0)
+    repetitions_words: Mapped[int] = mapped_column(default=0)
+    exact_segments: Mapped[int] = mapped_column(default=0)
+    exact_words: Mapped[int] = mapped_column(default=0)
+    fuzzy_95_segments: Mapped[int] = mapped_column(default=0)
+    fuzzy_95_words: Mapped[int] = mapped_column(default=0)
+    fuzzy_85_segments: Mapped[int] = mapped_column(default=0)
+    fuzzy_85_words: Mapped[int] = mapped_column(default=0)
+    fuzzy_75_segments: Mapped[int] = mapped_column(default=0)
+    fuzzy_75_words: Mapped[int] = mapped_column(default=0)
+    no_match_segments: Mapped[int] = mapped_column(default=0)
+    no_match_words: Mapped[int] = mapped_column(default=0)
+
 
 Index("document_record_history_record_id_idx", DocumentRecordHistory.record_id)
+Index(
+    "document_record_document_id_idx",
+    DocumentRecord.document_id,
+    DocumentRecord.id,
+)
+Index(
+    "document_record_repetition_group_idx",
+    DocumentRecord.document_id,
+    DocumentRecord.repetition_group,
+)
+Index("document_record_match_record_id_idx", DocumentRecordMatch.record_id)
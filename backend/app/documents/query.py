@@ -1,21 +1,36 @@
-from datetime import datetime
-from typing import Iterable
+from datetime import UTC, datetime
+from typing import Iterable, NamedTuple, Sequence
 
-from sqlalchemy import Row, and_, case, func, select
-from sqlalchemy.orm import Session
+from sqlalchemy import Row, and_, case, delete, func, insert, select, update
+from sqlalchemy.orm import Session, raiseload, selectinload, undefer
 
 from app.base.exceptions import BaseQueryException
 from app.comments.models import Comment
 from app.documents.models import DocumentRecordHistory, DocumentRecordHistoryChangeType
-from app.documents.schema import DocumentRecordFilter
-from app.models import DocumentStatus
+from app.documents.schema import (
+    AnalyzeTmLeverageTaskData,
+    CacheTmMatchesTaskData,
+    DocumentRecordExtended,
+    DocumentRecordFilter,
+    DocumentTaskDescription,
+)
+from app.models import DocumentStatus, TaskStatus
+from app.projects.models import ProjectTmAssociation
+from app.schema import DocumentTask
+from app.translation_memory.models import TranslationMemoryRecord
 
 from .models import (
+    TM_ANALYSIS_BANDS,
     Document,
     DocumentRecord,
+    DocumentRecordMatch,
+    DocumentTmAnalysis,
     DocumentType,
+    TmAnalysisStatus,
     TxtDocument,
+    TxtRecord,
     XliffDocument,
+    XliffRecord,
 )
 
 
@@ -23,6 +38,18 @@ class NotFoundDocumentExc(BaseQueryException):
     """Exception raised when document not found"""
 
 
+class DocumentHeader(NamedTuple):
+    """Lightweight projection of document metadata without any relationships"""
+
+    id: int
+    name: str
+    type: DocumentType
+    processing_status: str
+    created_by: int
+    project_id: int
+    matches_updated_at: datetime | None
+
+
 class GenericDocsQuery:
     """Contain query to Document"""
 
@@ -34,6 +61,54 @@ class GenericDocsQuery:
             select(Document).filter(Document.id == document_id)
         ).scalar_one_or_none()
 
+    def get_document_header(self, document_id: int) -> DocumentHeader | None:
+        row = self.__db.execute(
+            select(
+                Document.id,
+                Document.name,
+                Document.type,
+                Document.processing_status,
+                Document.created_by,
+                Document.project_id,
+                Document.matches_updated_at,
+            ).filter(Document.id == document_id)
+        ).one_or_none()
+        return DocumentHeader(*row) if row else None
+
+    def get_document_with_records(self, document_id: int) -> Document | None:
+        return self.__db.execute(
+            select(Document)
+            .filter(Document.id == document_id)
+            .options(
+                selectinload(Document.records),
+                selectinload(Document.project),
+                raiseload("*"),
+            )
+        ).scalar_one_or_none()
+
+    def get_document_for_export(self, document_id: int) -> Document | None:
+        """
+        Load a document with its original file and format-specific records
+        (together with their parent records) required to build an output file.
+        """
+        return self.__db.execute(
+            select(Document)
+            .filter(Document.id == document_id)
+            .options(
+                selectinload(Document.xliff).options(
+                    undefer(XliffDocument.original_data),
+                    selectinload(XliffDocument.records).selectinload(
+                        XliffRecord.parent
+                    ),
+                ),
+                selectinload(Document.txt).options(
+                    undefer(TxtDocument.original_data),
+                    selectinload(TxtDocument.records).selectinload(TxtRecord.parent),
+                ),
+                raiseload("*"),
+            )
+        ).scalar_one_or_none()
+
     def get_documents_list(self) -> Iterable[Document]:
         return self.__db.execute(
             select(Document)
@@ -57,11 +132,12 @@ class GenericDocsQuery:
             self.__db.delete(document)
         self.__db.commit()
 
-    def add_document(self, document: Document, original_document: str):
+    def add_document(self, document: Document, original_data: bytes):
+        """Add a document with its original file already compressed."""
         self.__db.add(document)
         self.__db.commit()
 
-        args = {"parent_id": document.id, "original_document": original_document}
+        args = {"parent_id": document.id, "original_data": original_data}
 
         if document.type == DocumentType.xliff:
             self.__db.add(XliffDocument(**args))
@@ -69,12 +145,16 @@ class GenericDocsQuery:
             self.__db.add(TxtDocument(**args))
         self.__db.commit()
 
-    def enqueue_document(self, document: Document):
-        document.processing_status = DocumentStatus.PENDING.value
+    def enqueue_document(self, document_id: int):
+        self.__db.execute(
+            update(Document)
+            .where(Document.id == document_id)
+            .values(processing_status=DocumentStatus.PENDING.value)
+        )
         self.__db.commit()
 
     def get_document_records_count_with_approved(
-        self, doc: Document
+        self, doc: Document | DocumentHeader
     ) -> tuple[int, int]:
         stmt = select(
             func.count(case((DocumentRecord.approved.is_(True), 1))),
@@ -83,7 +163,9 @@ class GenericDocsQuery:
         result = self.__db.execute(stmt).one()
         return result[0], result[1]
 
-    def get_document_word_count_with_approved(self, doc: Document) -> tuple[int, int]:
+    def get_document_word_count_with_approved(
+        self, doc: Document | DocumentHeader
+    ) -> tuple[int, int]:
         """
         Returns tuple of (approved_word_count, total_word_count) for a document.
         """
@@ -115,7 +197,9 @@ class GenericDocsQuery:
         return query
 
     def get_document_records_count_filtered(
-        self, doc: Document, filters: DocumentRecordFilter | None = None
+        self,
+        doc: Document | DocumentHeader,
+        filters: DocumentRecordFilter | None = None,
     ) -> int:
         base_query = select(func.count(DocumentRecord.id)).filter(
             DocumentRecord.document_id == doc.id
@@ -127,82 +211,162 @@ class GenericDocsQuery:
 
     def get_document_records_paged(
         self,
-        doc: Document,
+        doc: Document | DocumentHeader,
         page: int,
         page_records=100,
         filters: DocumentRecordFilter | None = None,
-    ) -> Iterable[Row[tuple[int, str, str, bool, int, int, bool]]]:
-        # Subquery to count repetitions for each source text within the document
-        repetitions_subquery = (
-            select(
-                DocumentRecord.source,
-                func.count(DocumentRecord.id).label("repetitions_count"),
-            )
-            .filter(DocumentRecord.document_id == doc.id)
-            .group_by(DocumentRecord.source)
-            .subquery()
-        )
-
-        # Subquery to count comments for each document record
-        comments_subquery = (
-            select(
-                Comment.record_id,
-                func.count(Comment.id).label("comments_count"),
-            )
-            .group_by(Comment.record_id)
-            .subquery()
-        )
-
-        # The base query with row numbers
-        base_subquery = (
+    ) -> list[DocumentRecordExtended]:
+        query = self._apply_filters(
             select(
                 DocumentRecord.id,
                 DocumentRecord.source,
                 DocumentRecord.target,
                 DocumentRecord.approved,
-                func.row_number().over(order_by=DocumentRecord.id).label("row_number"),
-            )
-            .filter(DocumentRecord.document_id == doc.id)
-            .subquery()
+                DocumentRecord.repetition_group,
+            ).filter(DocumentRecord.document_id == doc.id),
+            filters,
+            DocumentRecord.source,
+            DocumentRecord.target,
         )
-
-        # Build the base query
         query = (
-            select(
-                *base_subquery.c._all_columns,
-                func.coalesce(repetitions_subquery.c.repetitions_count, 0).label(
-                    "repetitions_count"
-                ),
-                (func.coalesce(comments_subquery.c.comments_count, 0) > 0).label(
-                    "has_comments"
-                ),
+            query.order_by(DocumentRecord.id)
+            .offset(page_records * page)
+            .limit(page_records)
+        )
+        return self._extend_records(doc, self.__db.execute(query).all())
+
+    def get_document_records_after(
+        self,
+        doc: Document | DocumentHeader,
+        after_id: int | None,
+        page_records=100,
+        filters: DocumentRecordFilter | None = None,
+    ) -> list[DocumentRecordExtended]:
+        """
+        Keyset pagination over document records: returns records following
+        the given record ID, so a page costs the same regardless of its depth.
+        """
+        query = select(
+            DocumentRecord.id,
+            DocumentRecord.source,
+            DocumentRecord.target,
+            DocumentRecord.approved,
+            DocumentRecord.repetition_group,
+        ).filter(DocumentRecord.document_id == doc.id)
+        if after_id is not None:
+            query = query.filter(DocumentRecord.id > after_id)
+        query = self._apply_filters(
+            query, filters, DocumentRecord.source, DocumentRecord.target
+        )
+        query = query.order_by(DocumentRecord.id).limit(page_records)
+        return self._extend_records(doc, self.__db.execute(query).all())
+
+    def get_document_record_ids(
+        self,
+        doc: Document | DocumentHeader,
+        page: int,
+        page_records=100,
+        filters: DocumentRecordFilter | None = None,
+        after_id: int | None = None,
+    ) -> list[int]:
+        """
+        Get IDs of records on a page, the same as get_document_records_paged()
+        returns, or as get_document_records_after() if after_id is given.
+        """
+        query = self._apply_filters(
+            select(DocumentRecord.id).filter(DocumentRecord.document_id == doc.id),
+            filters,
+            DocumentRecord.source,
+            DocumentRecord.target,
+        ).order_by(DocumentRecord.id)
+        if after_id is not None:
+            query = query.filter(DocumentRecord.id > after_id)
+        else:
+            query = query.offset(page_records * page)
+        return list(self.__db.execute(query.limit(page_records)).scalars())
+
+    def get_document_record_sources(
+        self, doc: Document | DocumentHeader, record_ids: Iterable[int]
+    ) -> dict[int, str]:
+        return {
+            row.id: row.source
+            for row in self.__db.execute(
+                select(DocumentRecord.id, DocumentRecord.source).filter(
+                    DocumentRecord.document_id == doc.id,
+                    DocumentRecord.id.in_(record_ids),
+                )
             )
-            .select_from(base_subquery)
-            .outerjoin(
-                repetitions_subquery,
-                base_subquery.c.source == repetitions_subquery.c.source,
+        }
+
+    def _extend_records(
+        self,
+        doc: Document | DocumentHeader,
+        rows: Sequence[Row[tuple[int, str, str, bool, str]]],
+    ) -> list[DocumentRecordExtended]:
+        # Everything here is restricted to the records of a single page, so
+        # neither the whole document nor the whole comment table is grouped.
+        if not rows:
+            return []
+
+        first_id, last_id = rows[0].id, rows[-1].id
+        preceding_count = self.__db.execute(
+            select(func.count(DocumentRecord.id)).filter(
+                DocumentRecord.document_id == doc.id,
+                DocumentRecord.id < first_id,
             )
-            .outerjoin(
-                comments_subquery,
-                base_subquery.c.id == comments_subquery.c.record_id,
+        ).scalar_one()
+        row_numbers = {
+            row.id: preceding_count + row.row_number
+            for row in self.__db.execute(
+                select(
+                    DocumentRecord.id,
+                    func.row_number()
+                    .over(order_by=DocumentRecord.id)
+                    .label("row_number"),
+                ).filter(
+                    DocumentRecord.document_id == doc.id,
+                    DocumentRecord.id.between(first_id, last_id),
+                )
             )
-        )
+        }
 
-        query = self._apply_filters(
-            query, filters, base_subquery.c.source, base_subquery.c.target
+        repetitions = dict(
+            self.__db.execute(
+                select(DocumentRecord.repetition_group, func.count(DocumentRecord.id))
+                .filter(
+                    DocumentRecord.document_id == doc.id,
+                    DocumentRecord.repetition_group.in_(
+                        {row.repetition_group for row in rows}
+                    ),
+                )
+                .group_by(DocumentRecord.repetition_group)
+            ).all()
         )
 
-        query = (
-            query.order_by(base_subquery.c.id)
-            .offset(page_records * page)
-            .limit(page_records)
+        commented_ids = set(
+            self.__db.execute(
+                select(Comment.record_id)
+                .filter(Comment.record_id.in_([row.id for row in rows]))
+                .distinct()
+            ).scalars()
         )
 
-        return self.__db.execute(query).all()
+        return [
+            DocumentRecordExtended(
+                id=row.id,
+                source=row.source,
+                target=row.target,
+                approved=row.approved,
+                repetitions_count=repetitions.get(row.repetition_group, 0),
+                has_comments=row.id in commented_ids,
+                row_number=row_numbers[row.id],
+            )
+            for row in rows
+        ]
 
     def get_record_filtered_page(
         self,
-        doc: Document,
+        doc: Document | DocumentHeader,
         record_id: int,
         filters: DocumentRecordFilter | None = None,
         page_records: int = 100,
@@ -231,6 +395,48 @@ class GenericDocsQuery:
         position = self.__db.execute(count_query).scalar_one()
         return position // page_records
 
+    def get_matched_document_ids_by_memory(self, tm_id: int) -> list[int]:
+        """Get documents with precomputed matches of projects using a memory."""
+        return list(
+            self.__db.execute(
+                select(Document.id)
+                .join(
+                    ProjectTmAssociation,
+                    ProjectTmAssociation.project_id == Document.project_id,
+                )
+                .where(
+                    ProjectTmAssociation.tm_id == tm_id,
+                    Document.matches_updated_at.is_not(None),
+                )
+            ).scalars()
+        )
+
+    def enqueue_matches_refresh(self, document_ids: Iterable[int]):
+        """
+        Drop precomputed TM matches of documents and add worker tasks to find
+        them again, e.g. after translation memories of a project changed.
+        """
+        document_ids = list(document_ids)
+        if not document_ids:
+            return
+
+        self.__db.execute(
+            update(Document)
+            .where(Document.id.in_(document_ids))
+            .values(matches_updated_at=None)
+        )
+        self.__db.add_all(
+            DocumentTask(
+                data=DocumentTaskDescription(
+                    document_id=document_id,
+                    task_data=CacheTmMatchesTaskData(task_type="cache_tm_matches"),
+                ).model_dump_json(),
+                status=TaskStatus.PENDING.value,
+            )
+            for document_id in document_ids
+        )
+        self.__db.commit()
+
     def update_document(
         self, doc_id: int, name: str | None, project_id: int | None
     ) -> Document:
@@ -246,7 +452,9 @@ class GenericDocsQuery:
         self.__db.refresh(document)
         return document
 
-    def get_first_unapproved_record(self, doc: Document) -> DocumentRecord | None:
+    def get_first_unapproved_record(
+        self, doc: Document | DocumentHeader
+    ) -> DocumentRecord | None:
         return self.__db.execute(
             select(DocumentRecord)
             .filter(
@@ -257,17 +465,156 @@ class GenericDocsQuery:
             .limit(1)
         ).scalar_one_or_none()
 
-    def get_record_ids_by_source(self, doc_id: int, source: str) -> list[int]:
+
+class DocumentRecordMatchQuery:
+    """Query class for precomputed TM matches of document records."""
+
+    def __init__(self, db: Session) -> None:
+        self.__db = db
+
+    def get_matches(
+        self, record_ids: Iterable[int], tm_ids: list[int], threshold: float
+    ) -> Sequence[Row]:
+        """
+        Get matches of records in the given memories with current source and
+        target of matched TM records. Rows have the same shape as
+        TranslationMemoryQuery.get_matches_for_records() returns.
+        """
+        return self.__db.execute(
+            select(
+                DocumentRecordMatch.record_id,
+                TranslationMemoryRecord.id.label("tm_record_id"),
+                TranslationMemoryRecord.source,
+                TranslationMemoryRecord.target,
+                DocumentRecordMatch.similarity,
+            )
+            .join(
+                TranslationMemoryRecord,
+                TranslationMemoryRecord.id == DocumentRecordMatch.tm_record_id,
+            )
+            .filter(
+                DocumentRecordMatch.record_id.in_(record_ids),
+                DocumentRecordMatch.similarity >= threshold,
+                TranslationMemoryRecord.document_id.in_(tm_ids),
+            )
+            .order_by(
+                DocumentRecordMatch.record_id, DocumentRecordMatch.similarity.desc()
+            )
+        ).all()
+
+    def delete_document_matches(self, document_id: int):
+        self.__db.execute(
+            delete(DocumentRecordMatch).where(
+                DocumentRecordMatch.record_id.in_(
+                    select(DocumentRecord.id).filter(
+                        DocumentRecord.document_id == document_id
+                    )
+                )
+            )
+        )
+        self.__db.commit()
+
+    def add_matches(self, matches: Iterable[tuple[int, int, float]]):
+        """Add matches as (record ID, TM record ID, similarity) tuples."""
+        values = [
+            {
+                "record_id": record_id,
+                "tm_record_id": tm_record_id,
+                "similarity": similarity,
+            }
+            for record_id, tm_record_id, similarity in matches
+        ]
+        if values:
+            self.__db.execute(insert(DocumentRecordMatch), values)
+            self.__db.commit()
+
+
+class DocumentTmAnalysisQuery:
+    """Query class for TM leverage analyses of documents."""
+
+    def __init__(self, db: Session) -> None:
+        self.__db = db
+
+    def get_analysis(self, document_id: int) -> DocumentTmAnalysis | None:
+        return self.__db.execute(
+            select(DocumentTmAnalysis).filter(
+                DocumentTmAnalysis.document_id == document_id
+            )
+        ).scalar_one_or_none()
+
+    def get_project_analyses(self, project_id: int) -> list[DocumentTmAnalysis]:
         return list(
             self.__db.execute(
-                select(DocumentRecord.id).where(
-                    DocumentRecord.document_id == doc_id,
-                    DocumentRecord.source == source,
+                select(DocumentTmAnalysis)
+                .join(Document, Document.id == DocumentTmAnalysis.document_id)
+                .filter(Document.project_id == project_id)
+                .order_by(DocumentTmAnalysis.document_id)
+            ).scalars()
+        )
+
+    def enqueue_analysis(self, document_ids: Iterable[int]) -> None:
+        """
+        Reset analyses of documents to the pending state and add worker tasks
+        computing them.
+        """
+        for document_id in document_ids:
+            analysis = self.get_analysis(document_id)
+            if not analysis:
+                analysis = DocumentTmAnalysis(document_id=document_id)
+                self.__db.add(analysis)
+            self.reset_analysis(analysis, TmAnalysisStatus.pending, 0)
+            self.__db.add(
+                DocumentTask(
+                    data=DocumentTaskDescription(
+                        document_id=document_id,
+                        task_data=AnalyzeTmLeverageTaskData(
+                            task_type="analyze_tm_leverage"
+                        ),
+                    ).model_dump_json(),
+                    status=TaskStatus.PENDING.value,
                 )
             )
-            .scalars()
-            .all()
-        )
+        self.__db.commit()
+
+    def reset_analysis(
+        self,
+        analysis: DocumentTmAnalysis,
+        status: TmAnalysisStatus,
+        total_records: int,
+    ) -> None:
+        analysis.status = status
+        analysis.processed_records = 0
+        analysis.total_records = total_records
+        analysis.updated_at = datetime.now(UTC)
+        for band in TM_ANALYSIS_BANDS:
+            setattr(analysis, f"{band}_segments", 0)
+            setattr(analysis, f"{band}_words", 0)
+        self.__db.commit()
+
+    def add_progress(
+        self,
+        analysis: DocumentTmAnalysis,
+        records: int,
+        bands: dict[str, tuple[int, int]],
+    ) -> None:
+        """Add processed records and their (segments, words) in bands."""
+        for band, (segments, words) in bands.items():
+            setattr(
+                analysis,
+                f"{band}_segments",
+                getattr(analysis, f"{band}_segments") + segments,
+            )
+            setattr(
+                analysis, f"{band}_words", getattr(analysis, f"{band}_words") + words
+            )
+        analysis.processed_records += records
+        analysis.updated_at = datetime.now(UTC)
+        self.__db.commit()
+
+    def finish_analysis(self, analysis: DocumentTmAnalysis) -> None:
+        analysis.status = TmAnalysisStatus.done
+        analysis.updated_at = datetime.now(UTC)
+        self.__db.commit()
 
 
 class DocumentRecordHistoryQuery:
@@ -283,12 +630,62 @@ class DocumentRecordHistoryQuery:
             self.__db.execute(
                 select(DocumentRecordHistory)
                 .filter(DocumentRecordHistory.record_id == record_id)
+                .options(selectinload(DocumentRecordHistory.author))
                 .order_by(DocumentRecordHistory.timestamp.desc())
             )
             .scalars()
             .all()
         )
 
+    def get_history_by_record_ids(
+        self, record_ids: Iterable[int], load_authors: bool = False
+    ) -> dict[int, list[DocumentRecordHistory]]:
+        """Get full history of several records, newest entries first."""
+        query = (
+            select(DocumentRecordHistory)
+            .filter(DocumentRecordHistory.record_id.in_(record_ids))
+            .order_by(
+                DocumentRecordHistory.timestamp.desc(),
+                DocumentRecordHistory.id.desc(),
+            )
+        )
+        if load_authors:
+            query = query.options(selectinload(DocumentRecordHistory.author))
+        result: dict[int, list[DocumentRecordHistory]] = {}
+        for history in self.__db.execute(query).scalars():
+            result.setdefault(history.record_id, []).append(history)
+        return result
+
+    def get_recent_history_by_record_ids(
+        self, record_ids: Iterable[int], limit: int
+    ) -> dict[int, list[DocumentRecordHistory]]:
+        """Get up to `limit` latest history entries of several records, newest first."""
+        ranked = (
+            select(
+                DocumentRecordHistory.id,
+                func.row_number()
+                .over(
+                    partition_by=DocumentRecordHistory.record_id,
+                    order_by=(
+                        DocumentRecordHistory.timestamp.desc(),
+                        DocumentRecordHistory.id.desc(),
+                    ),
+                )
+                .label("rank"),
+            )
+            .filter(DocumentRecordHistory.record_id.in_(record_ids))
+            .subquery()
+        )
+        result: dict[int, list[DocumentRecordHistory]] = {}
+        for history in self.__db.execute(
+            select(DocumentRecordHistory)
+            .join(ranked, ranked.c.id == DocumentRecordHistory.id)
+            .filter(ranked.c.rank <= limit)
+            .order_by(ranked.c.rank)
+        ).scalars():
+            result.setdefault(history.record_id, []).append(history)
+        return result
+
     def get_last_history_by_record_id(
         self, record_id: int
     ) -> DocumentRecordHistory | None:
@@ -302,13 +699,13 @@ class DocumentRecordHistoryQuery:
     def create_history_entry(
         self,
         record_id: int,
-        diff: str,
+        diff: bytes,
         author_id: int | None,
         change_type: DocumentRecordHistoryChangeType,
     ) -> DocumentRecordHistory:
         history = DocumentRecordHistory(
             record_id=record_id,
-            diff=diff,
+            diff_data=diff,
             author_id=author_id,
             change_type=change_type,
         )
@@ -318,26 +715,29 @@ class DocumentRecordHistoryQuery:
 
     def bulk_create_history_entry(
         self,
-        record_id_to_diff: list[tuple[int, str]],
+        record_id_to_diff: list[tuple[int, bytes]],
         author_id: int | None,
         change_type: DocumentRecordHistoryChangeType,
+        snapshots: dict[int, str] | None = None,
     ):
+        """Add history entries of several records, changes are not committed."""
+        snapshots = snapshots or {}
         histories = [
             DocumentRecordHistory(
                 record_id=history[0],
-                diff=history[1],
+                diff_data=history[1],
+                snapshot=snapshots.get(history[0]),
                 author_id=author_id,
                 change_type=change_type,
             )
             for history in record_id_to_diff
         ]
         self.__db.add_all(histories)
-        self.__db.commit()
 
     def update_history_entry(
-        self, history: DocumentRecordHistory, diff: str, timestamp: datetime
+        self, history: DocumentRecordHistory, diff: bytes, timestamp: datetime
     ) -> DocumentRecordHistory:
-        history.diff = diff
+        history.diff_data = diff
         history.timestamp = timestamp
         self.__db.commit()
         return history
@@ -3,10 +3,14 @@ from typing import Literal, Optional
 
 from pydantic import BaseModel, ConfigDict, Field
 
-from app.documents.models import DocumentRecordHistoryChangeType, TmMode
-from app.glossary.schema import GlossaryResponse
+from app.documents.models import (
+    DocumentRecordHistoryChangeType,
+    TmAnalysisStatus,
+    TmMode,
+)
+from app.glossary.schema import GlossaryRecordSchema, GlossaryResponse
 from app.models import DocumentStatus, Identified, MachineTranslationSettings, ShortUser
-from app.translation_memory.schema import TranslationMemory
+from app.translation_memory.schema import MemorySubstitution, TranslationMemory
 
 
 class DocumentRecordFilter(BaseModel):
@@ -47,8 +51,9 @@ class DocumentRecordExtended(DocumentRecord):
 
 class DocumentRecordListResponse(BaseModel):
     records: list[DocumentRecordExtended]
-    page: int
+    page: int | None
     total_records: int
+    next_after_id: int | None = None
 
 
 class RowPageResponse(BaseModel):
@@ -109,6 +114,18 @@ class MatchSegmentsTaskData(BaseModel):
     settings: MatchSegmentsSettings
 
 
+class CacheTmMatchesTaskData(BaseModel):
+    task_type: Literal["cache_tm_matches"]
+
+
+class AnalyzeTmLeverageTaskData(BaseModel):
+    task_type: Literal["analyze_tm_leverage"]
+
+
+class FlushApprovedTaskData(BaseModel):
+    task_type: Literal["flush_approved"]
+
+
 class FinalizeDocumentTaskData(BaseModel):
     task_type: Literal["finalize_document"]
 
@@ -120,6 +137,9 @@ class DocumentTaskDescription(BaseModel):
         | SubstituteSegmentsTaskData
         | TranslateSegmentsTaskData
         | MatchSegmentsTaskData
+        | CacheTmMatchesTaskData
+        | AnalyzeTmLeverageTaskData
+        | FlushApprovedTaskData
         | FinalizeDocumentTaskData
     )
 
@@ -154,11 +174,55 @@ class DocumentRecordHistory(BaseModel):
     timestamp: datetime
     change_type: DocumentRecordHistoryChangeType
 
+    model_config = ConfigDict(from_attributes=True)
+
 
 class DocumentRecordHistoryListResponse(BaseModel):
     history: list[DocumentRecordHistory]
 
 
+class DocumentRecordHistoryBatchItem(BaseModel):
+    record_id: int
+    history: list[DocumentRecordHistory]
+
+
+class DocumentRecordHistoryBatchResponse(BaseModel):
+    records: list[DocumentRecordHistoryBatchItem]
+
+
+class DocumentRecordSuggestions(BaseModel):
+    record_id: int
+    substitutions: list[MemorySubstitution]
+    glossary_records: list[GlossaryRecordSchema]
+
+
+class DocumentRecordSuggestionsResponse(BaseModel):
+    records: list[DocumentRecordSuggestions]
+
+
+class TmAnalysisBand(BaseModel):
+    segments: int
+    words: int
+
+
+class TmAnalysisBands(BaseModel):
+    repetitions: TmAnalysisBand
+    exact: TmAnalysisBand = Field(description="100% matches")
+    fuzzy_95: TmAnalysisBand = Field(description="95-99% matches")
+    fuzzy_85: TmAnalysisBand = Field(description="85-94% matches")
+    fuzzy_75: TmAnalysisBand = Field(description="75-84% matches")
+    no_match: TmAnalysisBand
+
+
+class DocumentTmAnalysis(BaseModel):
+    document_id: int
+    status: TmAnalysisStatus
+    processed_records: int
+    total_records: int
+    updated_at: datetime
+    bands: TmAnalysisBands
+
+
 class DocumentUpdate(BaseModel):
     name: str | None = Field(
         default=None,
@@ -1,27 +1,20 @@
 """Utility functions for document operations."""
 
-import difflib
+import hashlib
 import json
-from typing import Iterable
+import unicodedata
+import zlib
+from typing import Iterable, Iterator
 
+from app.documents.diff import DEFAULT_DIFF_ENGINE, DIFF_ENGINES
 
-def compute_diff(old_text: str, new_text: str) -> str:
-    """
-    Compute a compact JSON diff between two text strings using SequenceMatcher opcodes.
+# gzip container, so stored blobs can be inspected with standard tools
+GZIP_WBITS = 31
+BLOB_CHUNK_SIZE = 64 * 1024
 
-    The diff format stores only the changes, not full context, making it more
-    storage-efficient than the unified diff format.
 
-    Args:
-        old_text: The original text
-        new_text: The new text
-
-    Returns:
-        A JSON string containing opcodes that represent the changes
-    """
-
-    matcher = difflib.SequenceMatcher(None, old_text, new_text)
-    opcodes = matcher.get_opcodes()
+def _diff_ops(old_text: str, new_text: str, engine: str) -> list[list]:
+    opcodes = DIFF_ENGINES[engine](old_text, new_text)
 
     # Convert opcodes to compact JSON format
     ops = []
@@ -39,30 +32,73 @@ def compute_diff(old_text: str, new_text: str) -> str:
             # Insert new_text[j1:j2] at position i1
             new_segment = new_text[j1:j2]
             ops.append([tag, i1, i2, new_segment])
+    return ops
 
-    diff_data = {"ops": ops, "old_len": len(old_text)}
+
+def compute_diff(
+    old_text: str, new_text: str, engine: str = DEFAULT_DIFF_ENGINE
+) -> str:
+    """
+    Compute a compact JSON diff between two text strings.
+
+    The diff format stores only the changes, not full context, making it more
+    storage-efficient than the unified diff format.
+
+    Args:
+        old_text: The original text
+        new_text: The new text
+        engine: Name of the diff engine from DIFF_ENGINES
+
+    Returns:
+        A JSON string containing opcodes that represent the changes
+    """
+    diff_data = {
+        "ops": _diff_ops(old_text, new_text, engine),
+        "old_len": len(old_text),
+    }
 
     return json.dumps(diff_data)
 
 
-def apply_diff(old_text: str, diff_json: str) -> str:
+def compute_encoded_diff(
+    old_text: str, new_text: str, engine: str = DEFAULT_DIFF_ENGINE
+) -> bytes:
     """
-    Apply a compact JSON diff to reconstruct new text from old text.
+    Compute a diff between two text strings in the binary storage format.
 
     Args:
         old_text: The original text
-        diff_json: JSON string containing opcodes from compute_diff()
+        new_text: The new text
+        engine: Name of the diff engine from DIFF_ENGINES
+
+    Returns:
+        Encoded diff, see encode_diff()
+    """
+    return _encode_ops(_diff_ops(old_text, new_text, engine), len(old_text))
+
+
+def apply_diff(old_text: str, diff: str | bytes) -> str:
+    """
+    Apply a diff to reconstruct new text from old text.
+
+    Args:
+        old_text: The original text
+        diff: JSON string containing opcodes from compute_diff() or an encoded
+            diff from compute_encoded_diff()
 
     Returns:
         The reconstructed new text
     """
-    if not diff_json:
+    if not diff:
         return old_text
 
-    diff = json.loads(diff_json)
+    if isinstance(diff, bytes):
+        return _apply_encoded_diff(old_text, diff)
+
+    diff_data = json.loads(diff)
     result = []
 
-    for op in diff["ops"]:
+    for op in diff_data["ops"]:
         op_type = op[0]
 
         if op_type == "equal":
@@ -84,10 +120,253 @@ def apply_diff(old_text: str, diff_json: str) -> str:
     return "".join(result)
 
 
-def reconstruct_from_diffs(diff_jsons: Iterable[str]) -> str:
-    cumulative_str = ""
+def reconstruct_from_diffs(diffs: Iterable[str | bytes], base: str = "") -> str:
+    cumulative_str = base
 
-    for diff in diff_jsons:
+    for diff in diffs:
         cumulative_str = apply_diff(cumulative_str, diff)
 
     return cumulative_str
+
+
+# Binary diff format. The first byte holds flags, the rest is the payload
+# (raw deflate stream if DIFF_COMPRESSED is set).
+#
+# DIFF_TEXT payload is the UTF-8 text inserted into an empty string, this is
+# what initial import, MT and TM substitution rows look like.
+#
+# Otherwise the payload is a varint old_len followed by ops. Ops cover the old
+# text one after another, so positions are implicit and each op is a varint
+# (span << 2 | tag), where span is the number of consumed old characters.
+# Insert and replace are followed by a varint byte length and UTF-8 text.
+DIFF_COMPRESSED = 0x01
+DIFF_TEXT = 0x02
+DIFF_COMPRESS_THRESHOLD = 256
+
+_OP_EQUAL = 0
+_OP_DELETE = 1
+_OP_INSERT = 2
+_OP_REPLACE = 3
+_OP_TAGS = {
+    "equal": _OP_EQUAL,
+    "delete": _OP_DELETE,
+    "insert": _OP_INSERT,
+    "replace": _OP_REPLACE,
+}
+_OP_NAMES = {tag: name for name, tag in _OP_TAGS.items()}
+
+
+def _write_varint(out: bytearray, value: int) -> None:
+    while value >= 0x80:
+        out.append((value & 0x7F) | 0x80)
+        value >>= 7
+    out.append(value)
+
+
+def _read_varint(data: bytes, pos: int) -> tuple[int, int]:
+    byte = data[pos]
+    pos += 1
+    if byte < 0x80:
+        return byte, pos
+    value = byte & 0x7F
+    shift = 7
+    while True:
+        byte = data[pos]
+        pos += 1
+        value |= (byte & 0x7F) << shift
+        if byte < 0x80:
+            return value, pos
+        shift += 7
+
+
+def _pack(flags: int, payload: bytes) -> bytes:
+    if len(payload) >= DIFF_COMPRESS_THRESHOLD:
+        compressor = zlib.compressobj(wbits=-15)
+        compressed = compressor.compress(payload) + compressor.flush()
+        if len(compressed) < len(payload):
+            return bytes((flags | DIFF_COMPRESSED,)) + compressed
+    return bytes((flags,)) + payload
+
+
+def _unpack(data: bytes) -> tuple[int, bytes]:
+    flags = data[0]
+    if flags & DIFF_COMPRESSED:
+        return flags, zlib.decompress(data[1:], wbits=-15)
+    return flags, data[1:]
+
+
+def _encode_ops(ops: list[list], old_len: int) -> bytes:
+    if old_len == 0 and len(ops) == 1 and ops[0][0] == "insert":
+        return encode_text_diff(ops[0][3])
+
+    out = bytearray()
+    _write_varint(out, old_len)
+    position = 0
+    for op in ops:
+        tag = _OP_TAGS[op[0]]
+        i1, i2 = op[1], op[2]
+        if i1 != position or i2 < i1:
+            raise ValueError("Diff operations must cover the old text in order")
+        _write_varint(out, (i2 - i1) << 2 | tag)
+        if tag in (_OP_INSERT, _OP_REPLACE):
+            text = op[3].encode("utf-8")
+            _write_varint(out, len(text))
+            out += text
+        position = i2
+    return _pack(0, bytes(out))
+
+
+def encode_text_diff(text: str) -> bytes:
+    """
+    Encode a diff inserting the whole text into an empty string.
+
+    Args:
+        text: Inserted text
+
+    Returns:
+        Encoded diff
+    """
+    return _pack(DIFF_TEXT, text.encode("utf-8"))
+
+
+def encode_diff(diff_json: str) -> bytes:
+    """
+    Convert a JSON diff produced by compute_diff() to the binary format.
+
+    Args:
+        diff_json: JSON string containing opcodes
+
+    Returns:
+        Encoded diff
+    """
+    diff_data = json.loads(diff_json)
+    return _encode_ops(diff_data["ops"], diff_data["old_len"])
+
+
+def decode_diff(data: bytes) -> str:
+    """
+    Convert an encoded diff back to the JSON format of compute_diff().
+
+    Args:
+        data: Encoded diff
+
+    Returns:
+        JSON string containing opcodes
+    """
+    flags, payload = _unpack(data)
+    if flags & DIFF_TEXT:
+        text = payload.decode("utf-8")
+        return json.dumps({"ops": [["insert", 0, 0, text]], "old_len": 0})
+
+    old_len, pos = _read_varint(payload, 0)
+    ops: list[list] = []
+    position = 0
+    while pos < len(payload):
+        value, pos = _read_varint(payload, pos)
+        tag = value & 0x03
+        end = position + (value >> 2)
+        if tag in (_OP_INSERT, _OP_REPLACE):
+            size, pos = _read_varint(payload, pos)
+            text = payload[pos : pos + size].decode("utf-8")
+            pos += size
+            ops.append([_OP_NAMES[tag], position, end, text])
+        else:
+            ops.append([_OP_NAMES[tag], position, end])
+        position = end
+    return json.dumps({"ops": ops, "old_len": old_len})
+
+
+def _apply_encoded_diff(old_text: str, data: bytes) -> str:
+    flags, payload = _unpack(data)
+    if flags & DIFF_TEXT:
+        return payload.decode("utf-8")
+
+    _, pos = _read_varint(payload, 0)
+    result = []
+    position = 0
+    size = len(payload)
+    while pos < size:
+        value, pos = _read_varint(payload, pos)
+        tag = value & 0x03
+        end = position + (value >> 2)
+        if tag == _OP_EQUAL:
+            result.append(old_text[position:end])
+        elif tag != _OP_DELETE:
+            length, pos = _read_varint(payload, pos)
+            result.append(payload[pos : pos + length].decode("utf-8"))
+            pos += length
+        position = end
+    return "".join(result)
+
+
+def document_compressor():
+    """Create a streaming compressor producing blobs for original documents."""
+    return zlib.compressobj(wbits=GZIP_WBITS)
+
+
+def compress_document(data: bytes) -> bytes:
+    """
+    Compress original document content for storage.
+
+    Args:
+        data: Raw document bytes
+
+    Returns:
+        Gzip-compressed bytes
+    """
+    compressor = document_compressor()
+    return compressor.compress(data) + compressor.flush()
+
+
+def iter_decompressed(
+    blob: bytes, chunk_size: int = BLOB_CHUNK_SIZE
+) -> Iterator[bytes]:
+    """
+    Decompress stored document content chunk by chunk.
+
+    Args:
+        blob: Gzip-compressed bytes produced by compress_document()
+        chunk_size: Maximum size of each yielded chunk
+
+    Yields:
+        Chunks of the original document bytes
+    """
+    decompressor = zlib.decompressobj(wbits=GZIP_WBITS)
+    for start in range(0, len(blob), chunk_size):
+        data = decompressor.decompress(blob[start : start + chunk_size], chunk_size)
+        while data:
+            yield data
+            data = decompressor.decompress(decompressor.unconsumed_tail, chunk_size)
+    tail = decompressor.flush()
+    if tail:
+        yield tail
+
+
+def decompress_document(blob: bytes) -> bytes:
+    """
+    Decompress stored document content in one go.
+
+    Args:
+        blob: Gzip-compressed bytes produced by compress_document()
+
+    Returns:
+        Original document bytes
+    """
+    return zlib.decompress(blob, wbits=GZIP_WBITS)
+
+
+def repetition_group(source: str) -> str:
+    """
+    Compute an ID of a repetition group for a segment source.
+
+    Segments with canonically equal sources (after Unicode NFC normalisation)
+    share the same group.
+
+    Args:
+        source: Segment source text
+
+    Returns:
+        Hex digest identifying the group
+    """
+    normalized = unicodedata.normalize("NFC", source)
+    return hashlib.sha1(normalized.encode("utf-8")).hexdigest()
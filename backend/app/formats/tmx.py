@@ -1,6 +1,6 @@
 from datetime import UTC, datetime
 from io import BytesIO
-from typing import NamedTuple
+from typing import Iterator, NamedTuple
 
 from lxml import etree
 
@@ -20,8 +20,15 @@ class TmxData:
     # This class is used to create a new TMX file. It cannot manipulate the
     # existing TMX file.
 
-    def __init__(self, segments: list[TmxSegment]) -> None:
+    def __init__(
+        self,
+        segments: list[TmxSegment],
+        source_language: str = "en",
+        target_language: str = "ru",
+    ) -> None:
         self.__segments = segments
+        self.__source_language = source_language
+        self.__target_language = target_language
         self.__root = etree.fromstring(
             b'<?xml version="1.0" encoding="utf-8"?><tmx version="1.4"></tmx>',
             parser=etree.XMLParser(recover=True),
@@ -39,7 +46,7 @@ class TmxData:
                 "segtype": "sentence",
                 "o-tmf": "ATM",
                 "adminlang": "en-US",
-                "srclang": "en",
+                "srclang": self.__source_language,
                 "datatype": "plaintext",
             },
             nsmap={},
@@ -62,7 +69,7 @@ class TmxData:
             origin = etree.SubElement(
                 tu,
                 "tuv",
-                attrib={"{%s}lang" % DEFAULT_NSMAP["xml"]: "en"},
+                attrib={"{%s}lang" % DEFAULT_NSMAP["xml"]: self.__source_language},
                 nsmap=DEFAULT_NSMAP,
             )
             seg = etree.SubElement(origin, "seg", None, None)
@@ -71,7 +78,7 @@ class TmxData:
             target = etree.SubElement(
                 tu,
                 "tuv",
-                attrib={"{%s}lang" % DEFAULT_NSMAP["xml"]: "ru"},
+                attrib={"{%s}lang" % DEFAULT_NSMAP["xml"]: self.__target_language},
                 nsmap=DEFAULT_NSMAP,
             )
             seg = etree.SubElement(target, "seg", None, None)
@@ -87,68 +94,143 @@ class TmxData:
 def extract_tmx_content(
     content: bytes, orig_lang="en", tran_lang="ru"
 ) -> list[TmxSegment]:
-    root: etree._Element = etree.fromstring(
-        content, parser=etree.XMLParser(recover=True)
-    )
+    return list(iter_tmx_content(content, orig_lang, tran_lang))
 
-    version = root.attrib["version"]
-    if not version or version not in ["1.1", "1.4"]:
-        raise RuntimeError("Unsupported TMX version")
 
-    segments: list[TmxSegment] = []
-    for tu in root.iter("tu"):
-        creation_date = None
-        if "creationdate" in tu.attrib:
-            creation_date = datetime.fromisoformat(tu.attrib["creationdate"])
+def iter_tmx_content(
+    content: bytes, orig_lang="en", tran_lang="ru"
+) -> Iterator[TmxSegment]:
+    """
+    Parse translation units of a TMX file one by one, without building a
+    tree of the whole file.
+    """
+    for _, tu in iter_tu(content):
+        segment = parse_tu(tu, orig_lang, tran_lang)
+        if segment:
+            yield segment
+
+
+def iter_tmx_pairs(content: bytes) -> Iterator[tuple[tuple[str, str], TmxSegment]]:
+    """
+    Parse all language pairs of a multilingual TMX file in a single pass.
+    The source language is srclang of the header, every other language of a
+    translation unit is a target. Language codes are lowercased.
+
+    Yields:
+        (source language, target language) and a segment of the pair
+    """
+    for header, tu in iter_tu(content):
+        texts: dict[str, str] = {}
+        for tuv in tu.iter("tuv"):
+            lang = tuv_lang(tuv)
+            seg = tuv.find("seg")
+            if not lang or seg is None:
+                continue
+            texts.setdefault(lang, get_seg_text(seg))
+
+        srclang = (header.get("srclang") or "").lower() if header is not None else ""
+        if srclang not in texts:
+            continue
 
-        change_date = None
-        if "changedate" in tu.attrib:
-            change_date = datetime.fromisoformat(tu.attrib["changedate"])
+        creation_date, change_date = tu_dates(tu)
+        for lang, text in texts.items():
+            if lang == srclang:
+                continue
+            yield (
+                (srclang, lang),
+                TmxSegment(
+                    original=texts[srclang],
+                    translation=text,
+                    creation_date=creation_date,
+                    change_date=change_date,
+                ),
+            )
 
-        orig_search_string = f".//tuv[@lang='{orig_lang}' or @xml:lang='{orig_lang}']"
-        tran_search_string = f".//tuv[@lang='{tran_lang}' or @xml:lang='{tran_lang}']"
-        orig_tuv: etree._Element | None = tu.xpath(
-            orig_search_string, namespaces=DEFAULT_NSMAP
-        )
-        tran_tuv: etree._Element | None = tu.xpath(
-            tran_search_string, namespaces=DEFAULT_NSMAP
-        )
 
-        if orig_tuv is None:
-            print("Error: original <tu> does not have specified language", tu.text)
+def iter_tu(
+    content: bytes,
+) -> Iterator[tuple[etree._Element | None, etree._Element]]:
+    """
+    Iterate over translation units of a TMX file with its header, dropping
+    every unit after it is processed to keep memory flat.
+    """
+    root: etree._Element | None = None
+    header: etree._Element | None = None
+    for event, element in etree.iterparse(
+        BytesIO(content), events=("start", "end"), recover=True
+    ):
+        if root is None:
+            root = element
+            version = root.attrib.get("version")
+            if not version or version not in ["1.1", "1.4"]:
+                raise RuntimeError("Unsupported TMX version")
             continue
 
-        if tran_tuv is None:
-            print("Error: translation <tu> does not have specified language", tu.text)
+        if event != "end":
             continue
+        if element.tag == "header":
+            header = element
+        elif element.tag == "tu":
+            yield header, element
+            element.clear(keep_tail=True)
+            while element.getprevious() is not None:
+                del element.getparent()[0]
+
+
+def tu_dates(tu: etree._Element) -> tuple[datetime | None, datetime | None]:
+    creation_date = None
+    if "creationdate" in tu.attrib:
+        creation_date = datetime.fromisoformat(tu.attrib["creationdate"])
+
+    change_date = None
+    if "changedate" in tu.attrib:
+        change_date = datetime.fromisoformat(tu.attrib["changedate"])
+    return creation_date, change_date
+
+
+def tuv_lang(tuv: etree._Element) -> str:
+    """Get the lowercased language of a <tuv>, xml:lang or lang of TMX 1.1."""
+    return (tuv.get("{%s}lang" % DEFAULT_NSMAP["xml"]) or tuv.get("lang") or "").lower()
+
+
+def find_tuv(tu: etree._Element, lang: str) -> etree._Element | None:
+    """Find the first <tuv> of a language, codes are compared ignoring case."""
+    lang = lang.lower()
+    for tuv in tu.iter("tuv"):
+        if tuv_lang(tuv) == lang:
+            return tuv
+    return None
+
+
+def parse_tu(tu: etree._Element, orig_lang: str, tran_lang: str) -> TmxSegment | None:
+    """Get a segment of a language pair, None if the unit misses a language."""
+    creation_date, change_date = tu_dates(tu)
+
+    orig_tuv = find_tuv(tu, orig_lang)
+    tran_tuv = find_tuv(tu, tran_lang)
+    if orig_tuv is None or tran_tuv is None:
+        return None
+
+    original, translation = "", ""
+    # find <seg> in orig_tuv
+    seg = orig_tuv.find("seg")
+    if seg is None:
+        raise RuntimeError(
+            f"Malformed XML: original <tuv> does not have <seg>, {tu.text}"
+        )
 
-        orig_tuv = orig_tuv[0]
-        tran_tuv = tran_tuv[0]
-
-        original, translation = "", ""
-        # find <seg> in orig_tuv
-        seg = orig_tuv.find("seg")
-        if seg is None:
-            raise RuntimeError(
-                f"Malformed XML: original <tuv> does not have <seg>, {tu.text}"
-            )
-
-        original = get_seg_text(seg)
+    original = get_seg_text(seg)
 
-        seg = tran_tuv.find("seg")
-        if seg is None:
-            raise RuntimeError(
-                f"Malformed XML: translation <tuv> does not have <seg>, {tu.text}"
-            )
-
-        translation = get_seg_text(seg)
-        segments.append(
-            TmxSegment(
-                original=original,
-                translation=translation,
-                creation_date=creation_date,
-                change_date=change_date,
-            )
+    seg = tran_tuv.find("seg")
+    if seg is None:
+        raise RuntimeError(
+            f"Malformed XML: translation <tuv> does not have <seg>, {tu.text}"
         )
 
-    return segments
+    translation = get_seg_text(seg)
+    return TmxSegment(
+        original=original,
+        translation=translation,
+        creation_date=creation_date,
+        change_date=change_date,
+    )
@@ -142,9 +142,17 @@ class XliffData:
 
 class XliffNewFile:
     # This class is used create a new XLIFF XML file.
-    def __init__(self, segments: list[XliffSegment], original: str) -> None:
+    def __init__(
+        self,
+        segments: list[XliffSegment],
+        original: str,
+        source_language: str = "en",
+        target_language: str = "ru",
+    ) -> None:
         self.__segments = segments
         self.__original = original
+        self.__source_language = source_language
+        self.__target_language = target_language
 
     def serialize(self) -> BytesIO:
         E = ElementMaker(
@@ -190,8 +198,8 @@ class XliffNewFile:
                     "datatype": "plaintext",
                     "date": datetime.now(UTC).isoformat().split("+")[0],
                     "original": self.__original,
-                    "source-language": "en",
-                    "target-language": "ru",
+                    "source-language": self.__source_language,
+                    "target-language": self.__target_language,
                 },
             ),
             version="1.2",
@@ -6,6 +6,9 @@ from sqlalchemy.orm import Session
 
 from app import Glossary, GlossaryRecord
 from app.base.exceptions import BaseQueryException
+from app.base.query import count_rows
+from app.base.schema import CountMode
+from app.db import run_cpu_bound
 from app.glossary.models import ProcessingStatuses
 from app.glossary.schema import (
     GlossaryRecordCreate,
@@ -13,6 +16,7 @@ from app.glossary.schema import (
     GlossarySchema,
 )
 from app.linguistic.utils import postprocess_stemmed_segment, stem_sentence
+from app.records import suggestions_cache
 
 
 class NotFoundGlossaryExc(BaseQueryException):
@@ -23,6 +27,26 @@ class NotFoundGlossaryRecordExc(BaseQueryException):
     """Not found glossary record"""
 
 
+def stem_phrases(phrases: dict[int, str]) -> dict[int, set[str]]:
+    return {
+        key: set(postprocess_stemmed_segment(stem_sentence(phrase)))
+        for key, phrase in phrases.items()
+    }
+
+
+def match_phrases(
+    records: list[GlossaryRecord], phrase_words: dict[int, set[str]]
+) -> dict[int, list[GlossaryRecord]]:
+    output: dict[int, list[GlossaryRecord]] = {key: [] for key in phrase_words}
+    for record in records:
+        glossary_words = record.stemmed_source.split(" ")
+        for key, words in phrase_words.items():
+            # naive approach to check if all words are found in a target phrase
+            if all(word in words for word in glossary_words):
+                output[key].append(record)
+    return output
+
+
 class GlossaryQuery:
     """Contain query to Glossary & GlossaryRecord"""
 
@@ -57,51 +81,67 @@ class GlossaryQuery:
     def get_glossary_records_for_phrase(
         self, phrase: str, glossary_ids: list[int]
     ) -> list[GlossaryRecord]:
-        words = postprocess_stemmed_segment(stem_sentence(phrase))
+        return self.get_glossary_records_for_phrases({0: phrase}, glossary_ids)[0]
+
+    def get_glossary_records_for_phrases(
+        self, phrases: dict[int, str], glossary_ids: list[int]
+    ) -> dict[int, list[GlossaryRecord]]:
+        """
+        Find glossary records for several phrases with a single pass over the
+        glossaries. Candidates are selected by words of all phrases at once,
+        then matched against each phrase separately.
+        """
+        phrase_words = run_cpu_bound(stem_phrases, phrases)
+        all_words = set().union(*phrase_words.values())
+        if not all_words:
+            return {key: [] for key in phrases}
+
         or_clauses = [
-            GlossaryRecord.stemmed_source.ilike(f"%{word}%") for word in words
+            GlossaryRecord.stemmed_source.ilike(f"%{word}%") for word in all_words
         ]
         records = self.db.execute(
-            select(GlossaryRecord).where(
+            select(GlossaryRecord)
+            .where(
                 or_(*or_clauses),
                 GlossaryRecord.glossary_id.in_(glossary_ids),
             )
+            .order_by(GlossaryRecord.id)
         ).scalars()
-
-        output: list[GlossaryRecord] = []
-        for record in records:
-            glossary_words = record.stemmed_source.split(" ")
-            found_words = [word for word in glossary_words if word in words]
-
-            # naive approach to check if all words are found in a target phrase
-            if len(found_words) == len(glossary_words):
-                output.append(record)
-
-        return output
+        return run_cpu_bound(match_phrases, list(records), phrase_words)
 
     def list_glossary(self) -> list[Glossary]:
         return self.db.query(Glossary).order_by(Glossary.id).all()
 
     def list_glossary_records(
-        self, glossary_id: int, page: int, page_records: int, search: str | None = None
-    ):
-        query = self.db.query(GlossaryRecord).filter(
-            GlossaryRecord.glossary_id == glossary_id
-        )
+        self,
+        glossary_id: int,
+        page: int,
+        page_records: int,
+        search: str | None = None,
+        after_id: int | None = None,
+        count_mode: CountMode = CountMode.exact,
+    ) -> tuple[list[GlossaryRecord], int, bool]:
+        """
+        Get a page of glossary records, or with after_id the records following
+        that record ID, with their total count and whether it is estimated.
+        """
+        query = select(GlossaryRecord).filter(GlossaryRecord.glossary_id == glossary_id)
         if search:
             like_pattern = f"%{search}%"
             query = query.filter(
                 (GlossaryRecord.source.ilike(like_pattern))
                 | (GlossaryRecord.target.ilike(like_pattern))
             )
-        selected_rows = (
-            query.order_by(GlossaryRecord.id)
-            .offset(page * page_records)
-            .limit(page_records)
-            .all()
-        )
-        total_rows = query.count()
-        return selected_rows, total_rows
+        total_rows, estimated = count_rows(self.db, query, count_mode)
+
+        if after_id is not None:
+            query = query.filter(GlossaryRecord.id > after_id)
+        else:
+            query = query.offset(page * page_records)
+        selected_rows = self.db.execute(
+            query.order_by(GlossaryRecord.id).limit(page_records)
+        ).scalars()
+        return list(selected_rows), total_rows, estimated
 
     def get_all_glossary_records(self, glossary_id: int) -> list[GlossaryRecord]:
         """
@@ -165,6 +205,7 @@ class GlossaryQuery:
             self.db.commit()
         except IntegrityError:
             raise NotFoundGlossaryExc
+        suggestions_cache.invalidate_glossaries()
         return glossary_record
 
     def update_glossary(self, glossary_id: int, glossary: GlossarySchema) -> Glossary:
@@ -185,6 +226,7 @@ class GlossaryQuery:
 
         self.db.delete(glossary)
         self.db.commit()
+        suggestions_cache.invalidate_glossaries()
         return True
 
     def update_glossary_processing_status(self, glossary_id: int) -> Glossary | None:
@@ -198,6 +240,7 @@ class GlossaryQuery:
     def bulk_create_glossary_record(self, records: list[GlossaryRecord]):
         self.db.add_all(records)
         self.db.commit()
+        suggestions_cache.invalidate_glossaries()
 
     def update_record(self, record_id: int, record: GlossaryRecordUpdate):
         dump = record.model_dump()
@@ -212,6 +255,7 @@ class GlossaryQuery:
         )
         if result:
             self.db.commit()
+            suggestions_cache.invalidate_glossaries()
             return self.get_glossary_record_by_id(record_id)
         raise NotFoundGlossaryRecordExc()
 
@@ -222,5 +266,6 @@ class GlossaryQuery:
             .delete()
         ):
             self.db.commit()
+            suggestions_cache.invalidate_glossaries()
             return True
         return False
@@ -40,6 +40,9 @@ class GlossaryRecordSchema(IdentifiedTimestampedModel):
 class GlossaryRecordResponse(BaseModel):
     records: list[GlossaryRecordSchema]
     total_rows: int
+    # total_rows is estimated or capped, see CountMode
+    total_is_estimate: bool = False
+    next_after_id: int | None = None
 
     model_config = ConfigDict(from_attributes=True)
 
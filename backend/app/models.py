@@ -1,7 +1,7 @@
 from enum import Enum
 from typing import Literal
 
-from pydantic import BaseModel, ConfigDict, EmailStr
+from pydantic import BaseModel, ConfigDict, EmailStr, Field
 
 from app.base.schema import Identified
 from app.permissions import P
@@ -49,6 +49,17 @@ class StatusMessage(BaseModel):
     message: str
 
 
+class DbPoolMetrics(BaseModel):
+    size: int
+    checked_in: int
+    checked_out: int
+    overflow: int
+    checkouts: int
+    timeouts: int
+    wait_time: float = Field(description="Total seconds spent waiting for connections")
+    max_wait_time: float
+
+
 class BaseUserFields(BaseModel):
     email: EmailStr
     username: str
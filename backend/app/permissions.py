@@ -2,10 +2,12 @@ from enum import StrEnum
 from typing import Annotated
 
 from fastapi import Depends, HTTPException, status
+from sqlalchemy import select
 from sqlalchemy.orm import Session
 
 from app.db import get_db
 from app.schema import User
+from app.user import auth_cache
 from app.user.depends import get_current_user_id
 
 
@@ -113,6 +115,17 @@ ROLE_PERMISSIONS: dict[str, frozenset[P]] = {
 }
 
 
+def get_user_role(user_id: int, db: Session) -> str | None:
+    role = auth_cache.roles.get(user_id)
+    if role is None:
+        role = db.execute(
+            select(User.role).filter(User.id == user_id)
+        ).scalar_one_or_none()
+        if role is not None:
+            auth_cache.roles.set(user_id, role)
+    return role
+
+
 class PermissionChecker:
     def __init__(self, permission: P) -> None:
         self._permission = permission
@@ -122,10 +135,10 @@ class PermissionChecker:
         user_id: Annotated[int, Depends(get_current_user_id)],
         db: Annotated[Session, Depends(get_db)],
     ):
-        user = db.query(User).filter_by(id=user_id).first()
-        if not user:
+        role = get_user_role(user_id, db)
+        if not role:
             raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED)
 
-        role_perms = ROLE_PERMISSIONS.get(user.role, frozenset())
+        role_perms = ROLE_PERMISSIONS.get(role, frozenset())
         if self._permission not in role_perms:
             raise HTTPException(status_code=status.HTTP_403_FORBIDDEN)
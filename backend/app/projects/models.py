@@ -51,6 +51,8 @@ class Project(Base):
     id: Mapped[int] = mapped_column(primary_key=True)
     name: Mapped[str] = mapped_column()
     created_by: Mapped[int] = mapped_column(ForeignKey("user.id"))
+    source_language: Mapped[str] = mapped_column(default="en", server_default="en")
+    target_language: Mapped[str] = mapped_column(default="ru", server_default="ru")
     created_at: Mapped[datetime] = mapped_column(default=utc_time)
     updated_at: Mapped[datetime] = mapped_column(default=utc_time)
 
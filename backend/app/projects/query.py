@@ -40,7 +40,12 @@ class ProjectQuery:
         )
 
     def create_project(self, user_id: int, data: ProjectCreate) -> Project:
-        project = Project(created_by=user_id, name=data.name)
+        project = Project(
+            created_by=user_id,
+            name=data.name,
+            source_language=data.source_language,
+            target_language=data.target_language,
+        )
         self.__db.add(project)
         self.__db.commit()
         return project
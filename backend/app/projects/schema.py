@@ -1,14 +1,20 @@
 from pydantic import BaseModel, ConfigDict, Field
 
-from app.base.schema import Identified, IdentifiedTimestampedModel
+from app.base.schema import Identified, IdentifiedTimestampedModel, LanguageCode
 from app.documents.models import TmMode
-from app.documents.schema import DocumentWithRecordsCount
+from app.documents.schema import (
+    DocumentTmAnalysis,
+    DocumentWithRecordsCount,
+    TmAnalysisBands,
+)
 from app.glossary.schema import GlossaryResponse
 from app.translation_memory.schema import TranslationMemory
 
 
 class ProjectCreate(BaseModel):
     name: str = Field(min_length=1, max_length=255)
+    source_language: LanguageCode = "en"
+    target_language: LanguageCode = "ru"
 
     model_config = ConfigDict(from_attributes=True)
 
@@ -22,6 +28,8 @@ class ProjectUpdate(BaseModel):
 class ProjectResponse(IdentifiedTimestampedModel):
     name: str
     created_by: int
+    source_language: str
+    target_language: str
 
     model_config = ConfigDict(from_attributes=True)
 
@@ -71,3 +79,9 @@ class DetailedProjectResponse(ProjectResponse):
     total_words_count: int
 
     model_config = ConfigDict(from_attributes=True)
+
+
+class ProjectTmAnalysis(BaseModel):
+    project_id: int
+    documents: list[DocumentTmAnalysis]
+    bands: TmAnalysisBands = Field(description="Sum of finished document analyses")
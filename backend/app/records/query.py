@@ -1,4 +1,4 @@
-from sqlalchemy import select
+from sqlalchemy import select, update
 from sqlalchemy.orm import Session
 
 from app.base.exceptions import BaseQueryException
@@ -19,9 +19,17 @@ class RecordsQuery:
             select(DocumentRecord).filter(DocumentRecord.id == record_id)
         ).scalar_one_or_none()
 
+    def get_existing_record_ids(self, record_ids: list[int]) -> set[int]:
+        return set(
+            self.__db.execute(
+                select(DocumentRecord.id).filter(DocumentRecord.id.in_(record_ids))
+            ).scalars()
+        )
+
     def update_record(
         self, record_id: int, data: DocumentRecordUpdate
     ) -> DocumentRecord:
+        """Update a record, changes are not committed."""
         record = self.get_record(record_id)
         if not record:
             raise NotFoundDocumentRecordExc()
@@ -30,5 +38,34 @@ class RecordsQuery:
         if data.approved is not None:
             record.approved = data.approved
 
-        self.__db.commit()
         return record
+
+    def update_repetitions(
+        self, record: DocumentRecord, data: DocumentRecordUpdate
+    ) -> list[tuple[int, str]]:
+        """
+        Update all repetitions of a record with a single statement. Changes are
+        not committed.
+
+        Returns:
+            List of (record ID, old target) for repetitions whose target changed
+        """
+        conditions = (
+            DocumentRecord.document_id == record.document_id,
+            DocumentRecord.repetition_group == record.repetition_group,
+            DocumentRecord.id != record.id,
+        )
+        old_targets = self.__db.execute(
+            select(DocumentRecord.id, DocumentRecord.target).where(*conditions)
+        ).all()
+
+        values: dict[str, str | bool] = {"target": data.target}
+        if data.approved is not None:
+            values["approved"] = data.approved
+        self.__db.execute(update(DocumentRecord).where(*conditions).values(**values))
+
+        return [
+            (record_id, target)
+            for record_id, target in old_targets
+            if target != data.target
+        ]
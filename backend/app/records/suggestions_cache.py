@@ -0,0 +1,41 @@
+"""
+Process-wide cache of translation suggestions for segment sources. Entries
+are keyed by a source text and IDs of resources it was searched in, so
+repeated segments and all documents of a project share them.
+
+Entries are dropped when memories or glossaries are changed through queries,
+the TTL bounds staleness for changes made by other processes (the worker).
+"""
+
+from typing import Iterable
+
+from app.cache import TtlCache
+from app.glossary.schema import GlossaryRecordSchema
+from app.settings import settings
+from app.translation_memory.schema import MemorySubstitution
+
+SuggestionKey = tuple[str, tuple[int, ...]]
+
+substitutions: TtlCache[SuggestionKey, list[MemorySubstitution]] = TtlCache(
+    settings.suggestions_cache_size, settings.suggestions_cache_ttl
+)
+glossary_records: TtlCache[SuggestionKey, list[GlossaryRecordSchema]] = TtlCache(
+    settings.suggestions_cache_size, settings.suggestions_cache_ttl
+)
+
+
+def key(source: str, resource_ids: Iterable[int]) -> SuggestionKey:
+    return source, tuple(sorted(set(resource_ids)))
+
+
+def invalidate_memories() -> None:
+    substitutions.clear()
+
+
+def invalidate_glossaries() -> None:
+    glossary_records.clear()
+
+
+def clear() -> None:
+    substitutions.clear()
+    glossary_records.clear()
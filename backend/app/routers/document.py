@@ -15,10 +15,11 @@ from sqlalchemy.orm import Session
 
 from app import models
 from app.base.exceptions import BusinessLogicError, EntityNotFound, UnauthorizedAccess
-from app.db import get_db
+from app.db import DbRunner, get_db, get_db_runner
 from app.documents import schema as doc_schema
 from app.permissions import P, PermissionChecker
 from app.services import DocumentService
+from app.services.analysis_service import AnalysisService
 from app.user.depends import get_current_user_id
 
 router = APIRouter(
@@ -27,6 +28,9 @@ router = APIRouter(
     dependencies=[Depends(PermissionChecker(P.DOCUMENT_READ))],
 )
 
+# Upper bound of records in a single suggestions request, a page of records
+MAX_SUGGESTION_RECORDS = 100
+
 
 def get_service(db: Annotated[Session, Depends(get_db)]):
     return DocumentService(db)
@@ -46,9 +50,9 @@ def get_doc(
 @router.get(
     "/{doc_id}/records", dependencies=[Depends(PermissionChecker(P.RECORD_READ))]
 )
-def get_doc_records(
+async def get_doc_records(
     doc_id: int,
-    service: Annotated[DocumentService, Depends(get_service)],
+    db: Annotated[DbRunner, Depends(get_db_runner)],
     page: Annotated[int | None, Query(ge=0)] = None,
     source: Annotated[
         str | None, Query(description="Filter by source text (contains search)")
@@ -56,6 +60,13 @@ def get_doc_records(
     target: Annotated[
         str | None, Query(description="Filter by target text (contains search)")
     ] = None,
+    after_id: Annotated[
+        int | None,
+        Query(
+            ge=0,
+            description="Return records following this record ID instead of a page",
+        ),
+    ] = None,
 ) -> doc_schema.DocumentRecordListResponse:
     if not page:
         page = 0
@@ -67,7 +78,71 @@ def get_doc_records(
         )
 
     try:
-        return service.get_document_records(doc_id, page, filters)
+        return await db.run(
+            lambda session: DocumentService(session).get_document_records(
+                doc_id, page, filters, after_id
+            )
+        )
+    except EntityNotFound as e:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail=str(e))
+
+
+@router.get(
+    "/{doc_id}/records/history",
+    description="Get the history of changes for records on a document page",
+    dependencies=[Depends(PermissionChecker(P.RECORD_READ))],
+)
+def get_doc_records_history(
+    doc_id: int,
+    service: Annotated[DocumentService, Depends(get_service)],
+    page: Annotated[int | None, Query(ge=0)] = None,
+    source: Annotated[
+        str | None, Query(description="Filter by source text (contains search)")
+    ] = None,
+    target: Annotated[
+        str | None, Query(description="Filter by target text (contains search)")
+    ] = None,
+    after_id: Annotated[
+        int | None,
+        Query(
+            ge=0,
+            description="Return records following this record ID instead of a page",
+        ),
+    ] = None,
+) -> doc_schema.DocumentRecordHistoryBatchResponse:
+    if not page:
+        page = 0
+
+    filters = None
+    if source or target:
+        filters = doc_schema.DocumentRecordFilter(
+            source_filter=source, target_filter=target
+        )
+
+    try:
+        return service.get_document_records_history(doc_id, page, filters, after_id)
+    except EntityNotFound as e:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail=str(e))
+
+
+@router.get(
+    "/{doc_id}/records/suggestions",
+    description="Get TM substitutions and glossary records for several records",
+    dependencies=[Depends(PermissionChecker(P.RECORD_READ))],
+)
+async def get_doc_records_suggestions(
+    doc_id: int,
+    record_id: Annotated[
+        list[int], Query(min_length=1, max_length=MAX_SUGGESTION_RECORDS)
+    ],
+    db: Annotated[DbRunner, Depends(get_db_runner)],
+) -> doc_schema.DocumentRecordSuggestionsResponse:
+    try:
+        return await db.run(
+            lambda session: DocumentService(session).get_records_suggestions(
+                doc_id, record_id
+            )
+        )
     except EntityNotFound as e:
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail=str(e))
 
@@ -153,6 +228,51 @@ def process_doc(
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail=str(e))
 
 
+@router.post(
+    "/{doc_id}/flush_approved",
+    description="Write all approved segments of a document to the write memory",
+    dependencies=[Depends(PermissionChecker(P.DOCUMENT_PROCESS))],
+)
+def flush_approved(
+    doc_id: int, service: Annotated[DocumentService, Depends(get_service)]
+) -> models.StatusMessage:
+    try:
+        return service.flush_approved(doc_id)
+    except EntityNotFound as e:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail=str(e))
+    except BusinessLogicError as e:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(e))
+
+
+@router.post(
+    "/{doc_id}/analysis",
+    description="Start TM leverage analysis of a document",
+    dependencies=[Depends(PermissionChecker(P.DOCUMENT_PROCESS))],
+)
+def request_doc_analysis(
+    doc_id: int, db: Annotated[Session, Depends(get_db)]
+) -> doc_schema.DocumentTmAnalysis:
+    try:
+        return AnalysisService(db).request_document_analysis(doc_id)
+    except EntityNotFound as e:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail=str(e))
+    except BusinessLogicError as e:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(e))
+
+
+@router.get(
+    "/{doc_id}/analysis",
+    description="Get TM leverage analysis of a document",
+)
+def get_doc_analysis(
+    doc_id: int, db: Annotated[Session, Depends(get_db)]
+) -> doc_schema.DocumentTmAnalysis:
+    try:
+        return AnalysisService(db).get_document_analysis(doc_id)
+    except EntityNotFound as e:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail=str(e))
+
+
 @router.post(
     "/{doc_id}/match", dependencies=[Depends(PermissionChecker(P.DOCUMENT_PROCESS))]
 )
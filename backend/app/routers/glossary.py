@@ -13,6 +13,7 @@ from fastapi import (
 from sqlalchemy.orm import Session
 
 from app.base.exceptions import EntityNotFound
+from app.base.schema import CountMode
 from app.db import get_db
 from app.glossary.models import ProcessingStatuses
 from app.glossary.schema import (
@@ -170,13 +171,26 @@ def list_records(
     service: Annotated[GlossaryService, Depends(get_service)],
     page: Annotated[int | None, Query(ge=0)] = None,
     search: Annotated[str | None, Query()] = None,
+    after_id: Annotated[
+        int | None,
+        Query(
+            ge=0,
+            description="Return records following this record ID instead of a page",
+        ),
+    ] = None,
+    count_mode: Annotated[
+        CountMode,
+        Query(description="Count total records exactly, up to a cap or by estimate"),
+    ] = CountMode.exact,
 ):
     page_records: Final = 100
     if not page:
         page = 0
 
     try:
-        return service.list_glossary_records(glossary_id, page, page_records, search)
+        return service.list_glossary_records(
+            glossary_id, page, page_records, search, after_id, count_mode
+        )
     except EntityNotFound as e:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
@@ -0,0 +1,16 @@
+from fastapi import APIRouter, Depends
+
+from app import models
+from app.db import pool_metrics
+from app.permissions import P, PermissionChecker
+
+router = APIRouter(
+    prefix="/metrics",
+    tags=["metrics"],
+    dependencies=[Depends(PermissionChecker(P.USER_MANAGE))],
+)
+
+
+@router.get("/db_pool", description="Get connection pool statistics of the API")
+def get_db_pool_metrics() -> models.DbPoolMetrics:
+    return models.DbPoolMetrics.model_validate(pool_metrics())
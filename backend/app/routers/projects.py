@@ -4,7 +4,8 @@ from fastapi import APIRouter, Depends, HTTPException, Query, status
 from sqlalchemy.orm import Session
 
 from app.base.exceptions import BusinessLogicError, EntityNotFound, UnauthorizedAccess
-from app.db import get_db
+from app.base.schema import CountMode
+from app.db import DbRunner, get_db, get_db_runner
 from app.glossary.schema import GlossaryRecordSchema
 from app.models import StatusMessage
 from app.permissions import P, PermissionChecker
@@ -14,12 +15,15 @@ from app.projects.schema import (
     ProjectGlossary,
     ProjectGlossaryUpdate,
     ProjectResponse,
+    ProjectTmAnalysis,
     ProjectTmUpdate,
     ProjectTranslationMemory,
     ProjectUpdate,
 )
+from app.services.analysis_service import AnalysisService
 from app.services.project_service import ProjectService
 from app.translation_memory.schema import (
+    SimilarityMode,
     TranslationMemoryListResponse,
     TranslationMemoryListSimilarResponse,
 )
@@ -350,13 +354,21 @@ def set_project_translation_memories(
     },
     dependencies=[Depends(PermissionChecker(P.TM_READ))],
 )
-def project_tm_search(
+async def project_tm_search(
     project_id: int,
     query: Annotated[str, Query()],
-    service: Annotated[ProjectService, Depends(get_service)],
+    db: Annotated[DbRunner, Depends(get_db_runner)],
+    count_mode: Annotated[
+        CountMode,
+        Query(description="Count total records exactly, up to a cap or by estimate"),
+    ] = CountMode.exact,
 ):
     try:
-        return service.search_tm(project_id, query)
+        return await db.run(
+            lambda session: ProjectService(session).search_tm(
+                project_id, query, count_mode
+            )
+        )
     except EntityNotFound as e:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
@@ -385,11 +397,48 @@ def project_tm_search_similar(
     project_id: int,
     query: Annotated[str, Query()],
     service: Annotated[ProjectService, Depends(get_service)],
+    mode: Annotated[
+        SimilarityMode,
+        Query(description="Similarity of trigrams, embeddings or both"),
+    ] = SimilarityMode.trigram,
 ):
     try:
-        return service.search_tm_similar(project_id, query)
+        return service.search_tm_similar(project_id, query, mode)
     except EntityNotFound as e:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
             detail=str(e),
         )
+    except BusinessLogicError as e:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(e))
+
+
+@router.post(
+    "/{project_id}/analysis",
+    description="Start TM leverage analysis of all processed project documents",
+    response_model=ProjectTmAnalysis,
+    dependencies=[Depends(PermissionChecker(P.DOCUMENT_PROCESS))],
+)
+def request_project_analysis(
+    project_id: int,
+    db: Annotated[Session, Depends(get_db)],
+):
+    try:
+        return AnalysisService(db).request_project_analysis(project_id)
+    except EntityNotFound as e:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail=str(e))
+
+
+@router.get(
+    "/{project_id}/analysis",
+    description="Get TM leverage analysis of project documents",
+    response_model=ProjectTmAnalysis,
+)
+def get_project_analysis(
+    project_id: int,
+    db: Annotated[Session, Depends(get_db)],
+):
+    try:
+        return AnalysisService(db).get_project_analysis(project_id)
+    except EntityNotFound as e:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail=str(e))
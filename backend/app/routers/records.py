@@ -1,11 +1,11 @@
 from typing import Annotated
 
-from fastapi import APIRouter, Depends, HTTPException, status
+from fastapi import APIRouter, Depends, HTTPException, Query, status
 from sqlalchemy.orm import Session
 
 from app.base.exceptions import EntityNotFound
 from app.comments.schema import CommentCreate, CommentResponse
-from app.db import get_db
+from app.db import DbRunner, get_db, get_db_runner
 from app.documents import schema as doc_schema
 from app.documents.models import DocumentRecordHistoryChangeType
 from app.glossary.schema import GlossaryRecordSchema
@@ -20,11 +20,30 @@ router = APIRouter(
     dependencies=[Depends(PermissionChecker(P.RECORD_READ))],
 )
 
+# Upper bound of records in a single history request
+MAX_HISTORY_RECORDS = 500
+
 
 def get_service(db: Annotated[Session, Depends(get_db)]):
     return RecordService(db)
 
 
+@router.get(
+    "/history",
+    description="Get the history of changes for several document records",
+)
+def get_records_history(
+    record_id: Annotated[
+        list[int], Query(min_length=1, max_length=MAX_HISTORY_RECORDS)
+    ],
+    service: Annotated[RecordService, Depends(get_service)],
+) -> doc_schema.DocumentRecordHistoryBatchResponse:
+    try:
+        return service.get_records_history(record_id)
+    except EntityNotFound as e:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail=str(e))
+
+
 @router.put("/{record_id}", dependencies=[Depends(PermissionChecker(P.RECORD_EDIT))])
 def update_doc_record(
     record_id: int,
@@ -68,12 +87,14 @@ def create_comment(
 
 
 @router.get("/{record_id}/substitutions")
-def get_record_substitutions(
+async def get_record_substitutions(
     record_id: int,
-    service: Annotated[RecordService, Depends(get_service)],
+    db: Annotated[DbRunner, Depends(get_db_runner)],
 ) -> list[MemorySubstitution]:
     try:
-        return service.get_record_substitutions(record_id)
+        return await db.run(
+            lambda session: RecordService(session).get_record_substitutions(record_id)
+        )
     except EntityNotFound as e:
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail=str(e))
 
@@ -93,11 +114,15 @@ def get_segment_history(
 
 
 @router.get("/{record_id}/glossary_records")
-def get_record_glossary_records(
+async def get_record_glossary_records(
     record_id: int,
-    service: Annotated[RecordService, Depends(get_service)],
+    db: Annotated[DbRunner, Depends(get_db_runner)],
 ) -> list[GlossaryRecordSchema]:
     try:
-        return service.get_record_glossary_records(record_id)
+        return await db.run(
+            lambda session: RecordService(session).get_record_glossary_records(
+                record_id
+            )
+        )
     except EntityNotFound as e:
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail=str(e))
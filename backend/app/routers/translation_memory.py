@@ -4,7 +4,8 @@ from fastapi import APIRouter, Depends, File, HTTPException, Query, UploadFile,
 from fastapi.responses import StreamingResponse
 from sqlalchemy.orm import Session
 
-from app.base.exceptions import EntityNotFound
+from app.base.exceptions import BusinessLogicError, EntityNotFound
+from app.base.schema import CountMode, LanguageCode
 from app.db import get_db
 from app.models import StatusMessage
 from app.permissions import P, PermissionChecker
@@ -26,7 +27,11 @@ def get_service(db: Annotated[Session, Depends(get_db)]):
 @router.get("/")
 def get_memories(
     service: Annotated[TranslationMemoryService, Depends(get_service)],
+    source_language: Annotated[LanguageCode | None, Query()] = None,
+    target_language: Annotated[LanguageCode | None, Query()] = None,
 ) -> list[schema.TranslationMemory]:
+    if source_language and target_language:
+        return service.get_memories((source_language, target_language))
     return service.get_memories()
 
 
@@ -46,11 +51,22 @@ def get_memory_records(
     service: Annotated[TranslationMemoryService, Depends(get_service)],
     page: Annotated[int | None, Query(ge=0)] = None,
     query: Annotated[str | None, Query()] = None,
+    after_id: Annotated[
+        int | None,
+        Query(
+            ge=0,
+            description="Return records following this record ID instead of a page",
+        ),
+    ] = None,
+    count_mode: Annotated[
+        CountMode,
+        Query(description="Count total records exactly, up to a cap or by estimate"),
+    ] = CountMode.exact,
 ) -> schema.TranslationMemoryListResponse:
     if not page:
         page = 0
     try:
-        return service.get_memory_records(tm_id, page, query)
+        return service.get_memory_records(tm_id, page, query, after_id, count_mode)
     except EntityNotFound as e:
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail=str(e))
 
@@ -60,24 +76,93 @@ def get_memory_records_similar(
     tm_id: int,
     service: Annotated[TranslationMemoryService, Depends(get_service)],
     query: Annotated[str, Query()],
+    mode: Annotated[
+        schema.SimilarityMode,
+        Query(description="Similarity of trigrams, embeddings or both"),
+    ] = schema.SimilarityMode.trigram,
 ) -> schema.TranslationMemoryListSimilarResponse:
     try:
-        return service.get_memory_records_similar(tm_id, query)
+        return service.get_memory_records_similar(tm_id, query, mode)
     except EntityNotFound as e:
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail=str(e))
+    except BusinessLogicError as e:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(e))
 
 
 @router.post("/upload", dependencies=[Depends(PermissionChecker(P.TM_UPLOAD))])
-async def create_memory_from_file(
+def create_memory_from_file(
     file: Annotated[UploadFile, File()],
     service: Annotated[TranslationMemoryService, Depends(get_service)],
     current_user: Annotated[int, Depends(get_current_user_id)],
+    deduplication: Annotated[
+        schema.TmxDeduplication, Query()
+    ] = schema.TmxDeduplication.newest,
+    source_language: Annotated[LanguageCode, Query()] = "en",
+    target_language: Annotated[LanguageCode, Query()] = "ru",
 ) -> schema.TranslationMemory:
-    return await service.create_memory_from_file(
-        file.filename, await file.read(), current_user
+    return service.create_memory_from_file(
+        file.filename,
+        file.file.read(),
+        current_user,
+        deduplication,
+        source_language,
+        target_language,
     )
 
 
+@router.post(
+    "/upload_multilingual",
+    description="Create a translation memory for every language pair of a TMX file",
+    dependencies=[Depends(PermissionChecker(P.TM_UPLOAD))],
+)
+def create_memories_from_file(
+    file: Annotated[UploadFile, File()],
+    service: Annotated[TranslationMemoryService, Depends(get_service)],
+    current_user: Annotated[int, Depends(get_current_user_id)],
+    deduplication: Annotated[
+        schema.TmxDeduplication, Query()
+    ] = schema.TmxDeduplication.newest,
+) -> list[schema.TranslationMemory]:
+    return service.create_memories_from_file(
+        file.filename, file.file.read(), current_user, deduplication
+    )
+
+
+@router.post(
+    "/{tm_id}/upload",
+    description="Append segments of a TMX file to a translation memory",
+    dependencies=[Depends(PermissionChecker(P.TM_UPLOAD))],
+)
+def import_memory_file(
+    tm_id: int,
+    file: Annotated[UploadFile, File()],
+    service: Annotated[TranslationMemoryService, Depends(get_service)],
+    deduplication: Annotated[
+        schema.TmxDeduplication, Query()
+    ] = schema.TmxDeduplication.newest,
+) -> schema.TmxImportResult:
+    try:
+        return service.import_file(tm_id, file.file.read(), deduplication)
+    except EntityNotFound as e:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail=str(e))
+
+
+@router.post(
+    "/{tm_id}/build_index",
+    description="Rebuild the trigram index file of a translation memory",
+    dependencies=[Depends(PermissionChecker(P.TM_UPLOAD))],
+)
+def build_memory_index(
+    tm_id: int, service: Annotated[TranslationMemoryService, Depends(get_service)]
+) -> StatusMessage:
+    try:
+        return service.build_index(tm_id)
+    except EntityNotFound as e:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail=str(e))
+    except BusinessLogicError as e:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(e))
+
+
 @router.post(
     "/",
     response_model=schema.TranslationMemory,
@@ -89,7 +174,7 @@ def create_translation_memory(
     service: Annotated[TranslationMemoryService, Depends(get_service)],
     current_user: Annotated[int, Depends(get_current_user_id)],
 ):
-    return service.create_memory(settings.name, current_user)
+    return service.create_memory(settings, current_user)
 
 
 @router.delete("/{tm_id}", dependencies=[Depends(PermissionChecker(P.TM_DELETE))])
@@ -0,0 +1,258 @@
+"""Service for TM leverage analysis of documents and projects."""
+
+from itertools import batched
+
+from sqlalchemy import select
+from sqlalchemy.orm import Session
+
+from app.base.exceptions import BusinessLogicError, EntityNotFound
+from app.documents import schema as doc_schema
+from app.documents.models import (
+    TM_ANALYSIS_BANDS,
+    Document,
+    DocumentRecord,
+    DocumentTmAnalysis,
+    TmAnalysisStatus,
+)
+from app.documents.query import DocumentTmAnalysisQuery, GenericDocsQuery
+from app.models import DocumentStatus
+from app.projects.query import NotFoundProjectExc, ProjectQuery
+from app.projects.schema import ProjectTmAnalysis
+from app.services.match_service import MATCH_CACHE_BATCH, MatchService
+from app.translation_memory.query import TranslationMemoryQuery
+from app.translation_memory.schema import MemorySubstitution
+
+# Lowest similarity of each fuzzy band, matches below the last one are
+# counted as no match
+FUZZY_BANDS = (("fuzzy_95", 0.95), ("fuzzy_85", 0.85), ("fuzzy_75", 0.75))
+
+
+def match_band(substitution: MemorySubstitution | None) -> str:
+    """
+    Get the fuzzy band of a segment by its best TM match. Exact matches are
+    found by source hashes: fuzzy similarity ignores case and punctuation,
+    so variants of a source score 1.0 as well.
+    """
+    if substitution is None:
+        return "no_match"
+    for band, similarity in FUZZY_BANDS:
+        if substitution.similarity >= similarity:
+            return band
+    return "no_match"
+
+
+def analysis_bands(
+    analyses: list[DocumentTmAnalysis],
+) -> doc_schema.TmAnalysisBands:
+    return doc_schema.TmAnalysisBands(
+        **{
+            band: doc_schema.TmAnalysisBand(
+                segments=sum(getattr(item, f"{band}_segments") for item in analyses),
+                words=sum(getattr(item, f"{band}_words") for item in analyses),
+            )
+            for band in TM_ANALYSIS_BANDS
+        }
+    )
+
+
+def analysis_response(analysis: DocumentTmAnalysis) -> doc_schema.DocumentTmAnalysis:
+    return doc_schema.DocumentTmAnalysis(
+        document_id=analysis.document_id,
+        status=analysis.status,
+        processed_records=analysis.processed_records,
+        total_records=analysis.total_records,
+        updated_at=analysis.updated_at,
+        bands=analysis_bands([analysis]),
+    )
+
+
+class AnalysisService:
+    """
+    Service for TM leverage analysis. Analyses are computed by the worker and
+    stored per document, so reports are read without any TM searches.
+    """
+
+    def __init__(self, db: Session):
+        self.__db = db
+        self.__query = DocumentTmAnalysisQuery(db)
+        self.__docs_query = GenericDocsQuery(db)
+        self.__project_query = ProjectQuery(db)
+
+    def request_document_analysis(self, doc_id: int) -> doc_schema.DocumentTmAnalysis:
+        """
+        Start TM leverage analysis of a document.
+
+        Args:
+            doc_id: Document ID
+
+        Returns:
+            DocumentTmAnalysis object in the pending state
+
+        Raises:
+            EntityNotFound: If document not found
+            BusinessLogicError: If document has no segments to analyze
+        """
+        doc = self.__docs_query.get_document_header(doc_id)
+        if not doc:
+            raise EntityNotFound("Document not found")
+        if not self._can_analyze(doc.processing_status):
+            raise BusinessLogicError("Document is not processed")
+
+        self.__query.enqueue_analysis([doc_id])
+        return self.get_document_analysis(doc_id)
+
+    def get_document_analysis(self, doc_id: int) -> doc_schema.DocumentTmAnalysis:
+        """
+        Get TM leverage analysis of a document.
+
+        Args:
+            doc_id: Document ID
+
+        Returns:
+            DocumentTmAnalysis object
+
+        Raises:
+            EntityNotFound: If document not found or was never analyzed
+        """
+        analysis = self.__query.get_analysis(doc_id)
+        if not analysis:
+            raise EntityNotFound("Document analysis not found")
+        return analysis_response(analysis)
+
+    def request_project_analysis(self, project_id: int) -> ProjectTmAnalysis:
+        """
+        Start TM leverage analysis of all processed documents of a project.
+
+        Args:
+            project_id: Project ID
+
+        Returns:
+            ProjectTmAnalysis object
+
+        Raises:
+            EntityNotFound: If project not found
+        """
+        project = self._get_project(project_id)
+        self.__query.enqueue_analysis(
+            doc.id
+            for doc in project.documents
+            if self._can_analyze(doc.processing_status)
+        )
+        return self.get_project_analysis(project_id)
+
+    def get_project_analysis(self, project_id: int) -> ProjectTmAnalysis:
+        """
+        Get TM leverage analysis of a project, a sum of its documents.
+        Repetitions are counted within each document.
+
+        Args:
+            project_id: Project ID
+
+        Returns:
+            ProjectTmAnalysis object
+
+        Raises:
+            EntityNotFound: If project not found
+        """
+        self._get_project(project_id)
+        analyses = self.__query.get_project_analyses(project_id)
+        return ProjectTmAnalysis(
+            project_id=project_id,
+            documents=[analysis_response(analysis) for analysis in analyses],
+            bands=analysis_bands(
+                [
+                    analysis
+                    for analysis in analyses
+                    if analysis.status == TmAnalysisStatus.done
+                ]
+            ),
+        )
+
+    def analyze_document(self, doc: Document, tm_ids: list[int]) -> None:
+        """
+        Compute TM leverage analysis of a document, storing progress after
+        every chunk of records.
+
+        Every first occurrence of a segment is matched against memories,
+        the following ones are counted as repetitions. Exact matches are
+        looked up by source hashes, fuzzy matches of the rest are taken in
+        bulk, from precomputed ones if the document has them.
+
+        Args:
+            doc: Document object
+            tm_ids: Translation memory IDs to match segments against
+        """
+        records = self.__db.execute(
+            select(
+                DocumentRecord.id,
+                DocumentRecord.source,
+                DocumentRecord.repetition_group,
+                DocumentRecord.word_count,
+            )
+            .filter(DocumentRecord.document_id == doc.id)
+            .order_by(DocumentRecord.id)
+        ).all()
+
+        analysis = self.__query.get_analysis(doc.id)
+        if not analysis:
+            analysis = DocumentTmAnalysis(document_id=doc.id)
+            self.__db.add(analysis)
+        self.__query.reset_analysis(analysis, TmAnalysisStatus.processing, len(records))
+
+        match_service = MatchService(self.__db)
+        tm_query = TranslationMemoryQuery(self.__db)
+        seen_groups: set[str] = set()
+        for chunk in batched(records, MATCH_CACHE_BATCH):
+            # (band, words) of every record in the chunk
+            counted: list[tuple[str, int]] = []
+            first_occurrences = []
+            for record in chunk:
+                if record.repetition_group in seen_groups:
+                    counted.append(("repetitions", record.word_count))
+                else:
+                    seen_groups.add(record.repetition_group)
+                    first_occurrences.append(record)
+
+            exact = tm_query.get_exact_sources(
+                [record.source for record in first_occurrences], tm_ids
+            )
+            substitutions = match_service.get_substitutions(
+                doc,
+                [
+                    record.id
+                    for record in first_occurrences
+                    if record.source not in exact
+                ],
+                tm_ids,
+                FUZZY_BANDS[-1][1],
+                1,
+            )
+            for record in first_occurrences:
+                if record.source in exact:
+                    band = "exact"
+                else:
+                    best = substitutions[record.id]
+                    band = match_band(best[0] if best else None)
+                counted.append((band, record.word_count))
+
+            bands: dict[str, tuple[int, int]] = {}
+            for band, words in counted:
+                segments_count, words_count = bands.get(band, (0, 0))
+                bands[band] = (segments_count + 1, words_count + words)
+            self.__query.add_progress(analysis, len(chunk), bands)
+
+        self.__query.finish_analysis(analysis)
+
+    def _get_project(self, project_id: int):
+        try:
+            return self.__project_query._get_project(project_id)
+        except NotFoundProjectExc:
+            raise EntityNotFound("Project", project_id)
+
+    @staticmethod
+    def _can_analyze(processing_status: str) -> bool:
+        # pending and processing documents get segments before the analysis
+        return processing_status not in (
+            DocumentStatus.UPLOADED.value,
+            DocumentStatus.ERROR.value,
+        )
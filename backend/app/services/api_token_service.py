@@ -11,6 +11,7 @@ from app.api_token.schema import (
 )
 from app.base.exceptions import EntityNotFound
 from app.models import StatusMessage
+from app.user import auth_cache
 
 
 class ApiTokenService:
@@ -49,4 +50,5 @@ class ApiTokenService:
             self.__query.delete(token_id)
         except Exception:
             raise EntityNotFound("Api Token", token_id)
+        auth_cache.invalidate_token(token_id)
         return StatusMessage(message="ok")
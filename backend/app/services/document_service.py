@@ -2,7 +2,6 @@
 
 from dataclasses import dataclass
 from datetime import datetime, timedelta
-from io import BytesIO
 
 from fastapi import UploadFile
 from fastapi.responses import StreamingResponse
@@ -16,13 +15,18 @@ from app.documents.models import (
     DocumentRecord,
     DocumentRecordHistoryChangeType,
     DocumentType,
-    XliffRecord,
+    TmMode,
 )
 from app.documents.query import (
+    DocumentHeader,
     DocumentRecordHistoryQuery,
     GenericDocsQuery,
 )
-from app.documents.utils import compute_diff
+from app.documents.utils import (
+    BLOB_CHUNK_SIZE,
+    compute_encoded_diff,
+    document_compressor,
+)
 from app.formats.txt import extract_txt_content
 from app.formats.xliff import (
     SegmentState,
@@ -31,8 +35,13 @@ from app.formats.xliff import (
     extract_xliff_content,
 )
 from app.glossary.query import GlossaryQuery
+from app.glossary.schema import GlossaryRecordSchema
 from app.projects.query import NotFoundProjectExc, ProjectQuery
+from app.records import suggestions_cache
+from app.services.match_service import MatchService
+from app.services.record_service import history_batch_response
 from app.translation_memory.query import TranslationMemoryQuery
+from app.translation_memory.schema import MemorySubstitution
 from app.utils import encode_to_latin_1
 
 
@@ -67,9 +76,7 @@ class DocumentService:
         Raises:
             EntityNotFound: If document not found
         """
-        doc = self.__query.get_document(doc_id)
-        if not doc:
-            raise EntityNotFound("Document not found")
+        doc = self._get_document_header(doc_id)
         records = self.__query.get_document_records_count_with_approved(doc)
         words = self.__query.get_document_word_count_with_approved(doc)
         return doc_schema.DocumentWithRecordsCount(
@@ -109,8 +116,6 @@ class DocumentService:
         self.__query.bulk_delete_documents(outdated_docs)
 
         name = str(file.filename)
-        file_data = await file.read()
-        original_document = file_data.decode("utf-8")
 
         # quite simple logic, but it is fine for now
         ext = name.lower().split(".")[-1]
@@ -128,6 +133,8 @@ class DocumentService:
         except NotFoundProjectExc:
             raise EntityNotFound("Project", project_id)
 
+        original_data = await self._compress_upload(file)
+
         doc = Document(
             name=name,
             type=doc_type,
@@ -136,7 +143,7 @@ class DocumentService:
             created_by=user_id,
             project_id=project_id,
         )
-        self.__query.add_document(doc, original_document)
+        self.__query.add_document(doc, original_data)
         return doc_schema.Document(
             id=doc.id,
             name=doc.name,
@@ -179,8 +186,8 @@ class DocumentService:
         Raises:
             EntityNotFound: If document not found
         """
-        doc = self._get_document_by_id(doc_id)
-        self.__query.enqueue_document(doc)
+        self._get_document_header(doc_id)
+        self.__query.enqueue_document(doc_id)
 
         tasks: list[schema.DocumentTask] = [
             schema.DocumentTask(
@@ -192,6 +199,15 @@ class DocumentService:
                 ).model_dump_json(),
                 status=models.TaskStatus.PENDING.value,
             ),
+            schema.DocumentTask(
+                data=doc_schema.DocumentTaskDescription(
+                    document_id=doc_id,
+                    task_data=doc_schema.CacheTmMatchesTaskData(
+                        task_type="cache_tm_matches"
+                    ),
+                ).model_dump_json(),
+                status=models.TaskStatus.PENDING.value,
+            ),
             schema.DocumentTask(
                 data=doc_schema.DocumentTaskDescription(
                     document_id=doc_id,
@@ -238,11 +254,53 @@ class DocumentService:
         self.__db.commit()
         return models.StatusMessage(message="Ok")
 
+    def flush_approved(self, doc_id: int) -> models.StatusMessage:
+        """
+        Write all approved segments of a document to the write translation
+        memory of its project. The worker writes them in batches.
+
+        Args:
+            doc_id: Document ID
+
+        Returns:
+            StatusMessage indicating success
+
+        Raises:
+            EntityNotFound: If document not found
+            BusinessLogicError: If document is not processed or its project
+                has no memory to write to
+        """
+        doc = self._get_document_by_id(doc_id)
+        if doc.processing_status in (
+            models.DocumentStatus.UPLOADED.value,
+            models.DocumentStatus.ERROR.value,
+        ):
+            raise BusinessLogicError("Document is not processed")
+        if not any(
+            association.mode == TmMode.write
+            for association in doc.project.tm_associations
+        ):
+            raise BusinessLogicError("Project has no translation memory to write")
+
+        self.__db.add(
+            schema.DocumentTask(
+                data=doc_schema.DocumentTaskDescription(
+                    document_id=doc_id,
+                    task_data=doc_schema.FlushApprovedTaskData(
+                        task_type="flush_approved"
+                    ),
+                ).model_dump_json(),
+                status=models.TaskStatus.PENDING.value,
+            )
+        )
+        self.__db.commit()
+        return models.StatusMessage(message="Ok")
+
     async def match_document(
         self, doc_id: int, file_to_match: UploadFile, api_key: str
     ) -> models.StatusMessage:
-        doc = self._get_document_by_id(doc_id)
-        self.__query.enqueue_document(doc)
+        self._get_document_header(doc_id)
+        self.__query.enqueue_document(doc_id)
 
         file_data = await file_to_match.read()
         original_document = file_data.decode("utf-8")
@@ -298,20 +356,19 @@ class DocumentService:
         Raises:
             EntityNotFound: If document not found or file not available
         """
-        doc = self._get_document_by_id(doc_id)
+        doc = self.__query.get_document_for_export(doc_id)
+        if not doc:
+            raise EntityNotFound("Document not found")
+
         if doc.type == DocumentType.xliff:
             if not doc.xliff:
                 raise EntityNotFound("No XLIFF file found")
 
-            original_document = doc.xliff.original_document.encode("utf-8")
-            processed_document = extract_xliff_content(original_document)
+            processed_document = extract_xliff_content(doc.xliff.original_bytes)
 
+            xliff_records = {rec.segment_id: rec for rec in doc.xliff.records}
             for segment in processed_document.segments:
-                record = (
-                    self.__db.query(XliffRecord)
-                    .filter_by(segment_id=segment.id_)
-                    .first()
-                )
+                record = xliff_records.get(segment.id_)
                 if record and not segment.approved:
                     segment.translation = record.parent.target
                     segment.approved = record.parent.approved
@@ -376,13 +433,11 @@ class DocumentService:
         if doc.type == DocumentType.xliff:
             if not doc.xliff:
                 raise EntityNotFound("No XLIFF file found")
-            original_document = doc.xliff.original_document.encode("utf-8")
-            output = BytesIO(original_document)
+            output = doc.xliff.iter_original()
         elif doc.type == DocumentType.txt:
             if not doc.txt:
                 raise EntityNotFound("No TXT file found")
-            original_document = doc.txt.original_document
-            output = BytesIO(original_document.encode())
+            output = doc.txt.iter_original()
         else:
             raise EntityNotFound("Unknown document type")
 
@@ -407,7 +462,9 @@ class DocumentService:
         Raises:
             EntityNotFound: If document not found or file not available
         """
-        doc = self._get_document_by_id(doc_id)
+        doc = self.__query.get_document_with_records(doc_id)
+        if not doc:
+            raise EntityNotFound("Document not found")
         data = XliffNewFile(
             [
                 XliffSegment(
@@ -422,6 +479,8 @@ class DocumentService:
                 for rec in doc.records
             ],
             str(doc.id),
+            doc.project.source_language,
+            doc.project.target_language,
         )
         file = data.serialize()
         return StreamingResponse(
@@ -437,14 +496,17 @@ class DocumentService:
         doc_id: int,
         page: int,
         filters: doc_schema.DocumentRecordFilter | None = None,
+        after_id: int | None = None,
     ) -> doc_schema.DocumentRecordListResponse:
         """
         Get records from a document.
 
         Args:
             doc_id: Document ID
-            page: Page number
+            page: Page number, ignored when after_id is given
             filters: Optional filters for source/target text
+            after_id: Optional ID of the last record of the previous page to
+                paginate by cursor instead of page number
 
         Returns:
             DocumentRecordListResponse object
@@ -452,17 +514,132 @@ class DocumentService:
         Raises:
             EntityNotFound: If document not found
         """
-        doc = self._get_document_by_id(doc_id)
+        page_records = 100
+        doc = self._get_document_header(doc_id)
         total_records = self.__query.get_document_records_count_filtered(doc, filters)
-        records = self.__query.get_document_records_paged(doc, page, filters=filters)
+        if after_id is not None:
+            records = self.__query.get_document_records_after(
+                doc, after_id, page_records, filters
+            )
+        else:
+            records = self.__query.get_document_records_paged(
+                doc, page, page_records, filters
+            )
 
         return doc_schema.DocumentRecordListResponse(
-            records=[
-                doc_schema.DocumentRecordExtended.model_validate(record)
-                for record in records
-            ],
-            page=page,
+            records=records,
+            page=page if after_id is None else None,
             total_records=total_records,
+            next_after_id=records[-1].id if len(records) == page_records else None,
+        )
+
+    def get_document_records_history(
+        self,
+        doc_id: int,
+        page: int,
+        filters: doc_schema.DocumentRecordFilter | None = None,
+        after_id: int | None = None,
+    ) -> doc_schema.DocumentRecordHistoryBatchResponse:
+        """
+        Get the history of changes for records on a document page.
+
+        Args:
+            doc_id: Document ID
+            page: Page number, ignored when after_id is given
+            filters: Optional filters for source/target text
+            after_id: Optional ID of the last record of the previous page
+
+        Returns:
+            DocumentRecordHistoryBatchResponse object
+
+        Raises:
+            EntityNotFound: If document not found
+        """
+        doc = self._get_document_header(doc_id)
+        record_ids = self.__query.get_document_record_ids(
+            doc, page, 100, filters, after_id
+        )
+        histories = self.__history_query.get_history_by_record_ids(
+            record_ids, load_authors=True
+        )
+        return history_batch_response(record_ids, histories)
+
+    def get_records_suggestions(
+        self, doc_id: int, record_ids: list[int]
+    ) -> doc_schema.DocumentRecordSuggestionsResponse:
+        """
+        Get TM substitutions and glossary records for several records of a
+        document, e.g. for the next page of segments a translator works on.
+
+        Suggestions are looked up in a process-wide cache first, the missing
+        ones are found with one query for all records per resource type.
+
+        Args:
+            doc_id: Document ID
+            record_ids: IDs of document records
+
+        Returns:
+            DocumentRecordSuggestionsResponse object
+
+        Raises:
+            EntityNotFound: If document or any of the records not found
+        """
+        doc = self._get_document_header(doc_id)
+        sources = self.__query.get_document_record_sources(doc, record_ids)
+        if len(sources) != len(set(record_ids)):
+            raise EntityNotFound("Document record not found")
+
+        project = ProjectQuery(self.__db)._get_project(doc.project_id)
+        tm_ids = [tm.id for tm in project.translation_memories]
+        glossary_ids = [gl.id for gl in project.glossaries]
+
+        substitutions: dict[int, list[MemorySubstitution]] = {}
+        glossary_records: dict[int, list[GlossaryRecordSchema]] = {}
+        for record_id, source in sources.items():
+            cached_substitutions = suggestions_cache.substitutions.get(
+                suggestions_cache.key(source, tm_ids)
+            )
+            if cached_substitutions is not None:
+                substitutions[record_id] = cached_substitutions
+            cached_glossary = suggestions_cache.glossary_records.get(
+                suggestions_cache.key(source, glossary_ids)
+            )
+            if cached_glossary is not None:
+                glossary_records[record_id] = cached_glossary
+
+        missing = [record_id for record_id in sources if record_id not in substitutions]
+        found = MatchService(self.__db).get_substitutions(doc, missing, tm_ids)
+        for record_id, items in found.items():
+            suggestions_cache.substitutions.set(
+                suggestions_cache.key(sources[record_id], tm_ids), items
+            )
+            substitutions[record_id] = items
+
+        missing = [
+            record_id for record_id in sources if record_id not in glossary_records
+        ]
+        if missing and glossary_ids:
+            found_records = self.__glossary_query.get_glossary_records_for_phrases(
+                {record_id: sources[record_id] for record_id in missing}, glossary_ids
+            )
+        else:
+            found_records = {record_id: [] for record_id in missing}
+        for record_id, records in found_records.items():
+            items = [GlossaryRecordSchema.model_validate(record) for record in records]
+            suggestions_cache.glossary_records.set(
+                suggestions_cache.key(sources[record_id], glossary_ids), items
+            )
+            glossary_records[record_id] = items
+
+        return doc_schema.DocumentRecordSuggestionsResponse(
+            records=[
+                doc_schema.DocumentRecordSuggestions(
+                    record_id=record_id,
+                    substitutions=substitutions[record_id],
+                    glossary_records=glossary_records[record_id],
+                )
+                for record_id in dict.fromkeys(record_ids)
+            ]
         )
 
     def get_record_page(
@@ -471,14 +648,14 @@ class DocumentService:
         record_id: int,
         filters: doc_schema.DocumentRecordFilter | None = None,
     ) -> doc_schema.RowPageResponse:
-        doc = self._get_document_by_id(doc_id)
+        doc = self._get_document_header(doc_id)
         page = self.__query.get_record_filtered_page(doc, record_id, filters)
         return doc_schema.RowPageResponse(page=page)
 
     def get_first_unapproved_record(
         self, doc_id: int
     ) -> doc_schema.DocumentRecord | None:
-        doc = self._get_document_by_id(doc_id)
+        doc = self._get_document_header(doc_id)
         record = self.__query.get_first_unapproved_record(doc)
 
         if not record:
@@ -486,6 +663,43 @@ class DocumentService:
 
         return doc_schema.DocumentRecord.model_validate(record)
 
+    @staticmethod
+    async def _compress_upload(file: UploadFile) -> bytes:
+        """
+        Compress an uploaded file chunk by chunk without keeping it in memory
+        as a whole.
+
+        Args:
+            file: Uploaded file
+
+        Returns:
+            Compressed file content
+        """
+        compressor = document_compressor()
+        chunks: list[bytes] = []
+        while chunk := await file.read(BLOB_CHUNK_SIZE):
+            chunks.append(compressor.compress(chunk))
+        chunks.append(compressor.flush())
+        return b"".join(chunks)
+
+    def _get_document_header(self, doc_id: int) -> DocumentHeader:
+        """
+        Get document metadata by ID without loading any of its content.
+
+        Args:
+            doc_id: Document ID
+
+        Returns:
+            DocumentHeader object
+
+        Raises:
+            EntityNotFound: If document not found
+        """
+        doc = self.__query.get_document_header(doc_id)
+        if not doc:
+            raise EntityNotFound("Document not found")
+        return doc
+
     def _get_document_by_id(self, doc_id: int) -> Document:
         """
         Get a document by ID.
@@ -522,7 +736,7 @@ class DocumentService:
             EntityNotFound: If document or project not found
             UnauthorizedAccess: If user doesn't own project
         """
-        self._get_document_by_id(doc_id)
+        doc = self._get_document_header(doc_id)
         try:
             if update_data.project_id is not None:
                 pq = ProjectQuery(self.__db)
@@ -536,6 +750,12 @@ class DocumentService:
             update_data.name,
             update_data.project_id,
         )
+        # matches were found in memories of the previous project
+        if (
+            doc.matches_updated_at is not None
+            and doc.project_id != updated_doc.project_id
+        ):
+            self.__query.enqueue_matches_refresh([doc_id])
         return doc_schema.DocumentUpdateResponse(
             id=updated_doc.id, name=updated_doc.name, project_id=updated_doc.project_id
         )
@@ -590,7 +810,7 @@ class DocumentService:
             raise BusinessLogicError(f"Invalid document ID in XLIFF: {doc_id_str}")
 
         # Validate document exists
-        self._get_document_by_id(doc_id)
+        self._get_document_header(doc_id)
 
         # Prepare history entries for bulk creation
         history_entries = []
@@ -621,7 +841,7 @@ class DocumentService:
 
                 # Prepare history entry
                 history_entries.append(
-                    (record.id, compute_diff(old_target, new_target))
+                    (record.id, compute_encoded_diff(old_target, new_target))
                 )
 
         # Bulk create history entries
@@ -12,6 +12,7 @@ from sqlalchemy.orm import Session
 
 from app import Glossary, GlossaryRecord
 from app.base.exceptions import EntityNotFound
+from app.base.schema import CountMode
 from app.glossary.models import ProcessingStatuses
 from app.glossary.query import (
     GlossaryQuery,
@@ -132,15 +133,20 @@ class GlossaryService:
         page: int,
         page_records: int,
         search: str | None = None,
+        after_id: int | None = None,
+        count_mode: CountMode = CountMode.exact,
     ) -> GlossaryRecordResponse:
         """
         Get list of glossary records for a glossary.
 
         Args:
             glossary_id: Glossary ID
-            page: Page number
+            page: Page number, ignored when after_id is given
             page_records: Number of records per page
             search: Optional search query
+            after_id: Optional ID of the last record of the previous page to
+                paginate by cursor instead of page number
+            count_mode: How to count the total number of records
 
         Returns:
             GlossaryRecordResponse object with records and total count
@@ -149,12 +155,14 @@ class GlossaryService:
             self.__query.get_glossary(glossary_id)
         except NotFoundGlossaryExc:
             raise EntityNotFound("Glossary", glossary_id)
-        records, total_rows = self.__query.list_glossary_records(
-            glossary_id, page, page_records, search
+        records, total_rows, estimated = self.__query.list_glossary_records(
+            glossary_id, page, page_records, search, after_id, count_mode
         )
         return GlossaryRecordResponse(
             records=[GlossaryRecordSchema.model_validate(record) for record in records],
             total_rows=total_rows,
+            total_is_estimate=estimated,
+            next_after_id=records[-1].id if len(records) == page_records else None,
         )
 
     def create_glossary_record(
@@ -0,0 +1,146 @@
+"""Service for fuzzy TM matches of document records."""
+
+from datetime import UTC, datetime
+from itertools import batched
+from typing import Sequence
+
+from sqlalchemy import Row, select
+from sqlalchemy.orm import Session
+
+from app.documents.models import Document, DocumentRecord
+from app.documents.query import DocumentHeader, DocumentRecordMatchQuery
+from app.translation_memory.query import (
+    TranslationMemoryQuery,
+    substitutions_by_record,
+)
+from app.translation_memory.schema import MemorySubstitution
+
+# Matches kept for every record and the lowest similarity of them, lookups
+# asking for more or for less similar matches go to the memories directly
+MATCH_CACHE_SIZE = 10
+MATCH_CACHE_THRESHOLD = 0.5
+# Records searched by a single query when matches are computed
+MATCH_CACHE_BATCH = 200
+# TM records added after matches were computed which are scored on read,
+# if there are more, lookups go to the memories until the next refresh
+MAX_NEW_TM_RECORDS = 1000
+
+
+class MatchService:
+    """
+    Service for fuzzy TM matches of document records. Matches are computed
+    by the worker once per document and stored in document_record_match,
+    lookups read them instead of searching memories every time.
+    """
+
+    def __init__(self, db: Session):
+        self.__match_query = DocumentRecordMatchQuery(db)
+        self.__tm_query = TranslationMemoryQuery(db)
+        self.__db = db
+
+    def get_substitutions(
+        self,
+        doc: Document | DocumentHeader,
+        record_ids: list[int],
+        tm_ids: list[int],
+        threshold: float = 0.75,
+        count: int = 10,
+    ) -> dict[int, list[MemorySubstitution]]:
+        """
+        Get substitutions for records of a document.
+
+        Args:
+            doc: Document the records belong to
+            record_ids: Document record IDs
+            tm_ids: Translation memory IDs to search in
+            threshold: Minimal similarity of substitutions
+            count: Maximal number of substitutions for a record
+
+        Returns:
+            Substitutions of every record ordered by similarity
+        """
+        if not tm_ids or not record_ids:
+            return {record_id: [] for record_id in record_ids}
+
+        since = doc.matches_updated_at
+        if (
+            since is None
+            or threshold < MATCH_CACHE_THRESHOLD
+            or count > MATCH_CACHE_SIZE
+        ):
+            return self.__tm_query.get_substitutions_for_records(
+                record_ids, tm_ids, threshold, count
+            )
+
+        new_ids = self.__tm_query.get_new_record_ids(
+            tm_ids, since, MAX_NEW_TM_RECORDS + 1
+        )
+        if len(new_ids) > MAX_NEW_TM_RECORDS:
+            return self.__tm_query.get_substitutions_for_records(
+                record_ids, tm_ids, threshold, count
+            )
+
+        rows = list(self.__match_query.get_matches(record_ids, tm_ids, threshold))
+        if new_ids:
+            new_rows = self.__tm_query.get_similar_records_for_records(
+                record_ids, tm_ids, new_ids, threshold
+            )
+            rows = self._merge(rows, new_rows, count)
+        else:
+            rows = self._limit(rows, count)
+        return substitutions_by_record(record_ids, rows)
+
+    def cache_document_matches(self, doc: Document, tm_ids: list[int]) -> None:
+        """
+        Find matches for all records of a document and store them, replacing
+        the previous ones.
+
+        Args:
+            doc: Document object
+            tm_ids: Translation memory IDs to search in
+        """
+        started_at = datetime.now(UTC)
+        # lookups go to the memories until all matches are stored
+        doc.matches_updated_at = None
+        self.__match_query.delete_document_matches(doc.id)
+
+        record_ids = list(
+            self.__db.execute(
+                select(DocumentRecord.id)
+                .filter(DocumentRecord.document_id == doc.id)
+                .order_by(DocumentRecord.id)
+            ).scalars()
+        )
+        if tm_ids:
+            for batch in batched(record_ids, MATCH_CACHE_BATCH):
+                rows = self.__tm_query.get_matches_for_records(
+                    list(batch), tm_ids, MATCH_CACHE_THRESHOLD, MATCH_CACHE_SIZE
+                )
+                self.__match_query.add_matches(
+                    (row.record_id, row.tm_record_id, row.similarity) for row in rows
+                )
+
+        # records added to memories during the search are scored on read
+        doc.matches_updated_at = started_at
+        self.__db.commit()
+
+    @staticmethod
+    def _merge(rows: list[Row], new_rows: Sequence[Row], count: int) -> list[Row]:
+        new_keys = {(row.record_id, row.tm_record_id) for row in new_rows}
+        merged = [
+            row for row in rows if (row.record_id, row.tm_record_id) not in new_keys
+        ]
+        merged.extend(new_rows)
+        merged.sort(key=lambda row: (row.record_id, -row.similarity, row.tm_record_id))
+        return MatchService._limit(merged, count)
+
+    @staticmethod
+    def _limit(rows: list[Row], count: int) -> list[Row]:
+        output: list[Row] = []
+        per_record: dict[int, int] = {}
+        for row in rows:
+            seen = per_record.get(row.record_id, 0)
+            if seen < count:
+                output.append(row)
+                per_record[row.record_id] = seen + 1
+        return output
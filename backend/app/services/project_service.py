@@ -3,7 +3,9 @@
 from sqlalchemy.orm import Session
 
 from app.base.exceptions import BusinessLogicError, EntityNotFound
+from app.base.schema import CountMode
 from app.documents.models import TmMode
+from app.documents.query import GenericDocsQuery
 from app.documents.schema import DocumentWithRecordsCount
 from app.glossary.query import GlossaryQuery, NotFoundGlossaryExc
 from app.glossary.schema import GlossaryResponse
@@ -20,8 +22,10 @@ from app.projects.schema import (
     ProjectTranslationMemory,
     ProjectUpdate,
 )
+from app.services.translation_memory_service import check_similarity_mode
 from app.translation_memory.query import TranslationMemoryQuery
 from app.translation_memory.schema import (
+    SimilarityMode,
     TranslationMemory,
     TranslationMemoryListResponse,
     TranslationMemoryListSimilarResponse,
@@ -35,6 +39,7 @@ class ProjectService:
         self.__query = ProjectQuery(db)
         self.__glossary_query = GlossaryQuery(db)
         self.__tm_query = TranslationMemoryQuery(db)
+        self.__docs_query = GenericDocsQuery(db)
 
     def list_projects(self, user_id: int) -> list[ProjectResponse]:
         """
@@ -52,6 +57,8 @@ class ProjectService:
                 id=project.id,
                 name=project.name,
                 created_by=project.created_by,
+                source_language=project.source_language,
+                target_language=project.target_language,
                 created_at=project.created_at,
                 updated_at=project.updated_at,
             )
@@ -89,6 +96,8 @@ class ProjectService:
                 id=project.id,
                 name=project.name,
                 created_by=project.created_by,
+                source_language=project.source_language,
+                target_language=project.target_language,
                 created_at=project.created_at,
                 updated_at=project.updated_at,
                 documents=[
@@ -294,6 +303,7 @@ class ProjectService:
 
         Raises:
             EntityNotFound: If project or TMs not found
+            BusinessLogicError: If TMs have another language pair
         """
         # Extract tm_ids and modes from the schema
         tm_ids = [tm.id for tm in tms_update.translation_memories]
@@ -322,6 +332,14 @@ class ProjectService:
             tms = list(self.__tm_query.get_memories_by_id(mems))
             if len(mems) != len(tms):
                 raise EntityNotFound("Not all translation memories were found")
+            if any(
+                (tm.source_language, tm.target_language)
+                != (project.source_language, project.target_language)
+                for tm in tms
+            ):
+                raise BusinessLogicError(
+                    "Translation memories must have the language pair of the project"
+                )
 
         # Create list of (memory, mode) tuples
         tm_modes = []
@@ -330,16 +348,24 @@ class ProjectService:
             if memory:
                 tm_modes.append((memory, setting.mode))
 
+        old_tm_ids = {tm.id for tm in project.translation_memories}
         self.__query.set_project_translation_memories(project, tm_modes)
+        if old_tm_ids != set(tm_ids):
+            self.__docs_query.enqueue_matches_refresh(
+                doc.id for doc in project.documents if doc.matches_updated_at
+            )
         return StatusMessage(message="Translation memory list updated")
 
-    def search_tm(self, project_id: int, query: str) -> TranslationMemoryListResponse:
+    def search_tm(
+        self, project_id: int, query: str, count_mode: CountMode = CountMode.exact
+    ) -> TranslationMemoryListResponse:
         """
         Search translation memories in a project.
 
         Args:
             project_id: Project ID
             query: Search query string
+            count_mode: How to count the total number of found records
 
         Returns:
             TranslationMemoryListResponse with search results
@@ -359,19 +385,28 @@ class ProjectService:
         if not tm_ids:
             return TranslationMemoryListResponse(records=[], page=0, total_records=0)
 
-        records, count = self.__tm_query.get_memory_records_paged(
+        records = self.__tm_query.get_memory_records_paged(
             memory_ids=tm_ids,
             page=0,
             page_records=20,
             query=query,
         )
+        count, estimated = self.__tm_query.count_memory_records(
+            tm_ids, query, count_mode
+        )
 
         return TranslationMemoryListResponse(
-            records=records, page=0, total_records=count
+            records=records,
+            page=0,
+            total_records=count,
+            total_is_estimate=estimated,
         )
 
     def search_tm_similar(
-        self, project_id: int, query: str
+        self,
+        project_id: int,
+        query: str,
+        mode: SimilarityMode = SimilarityMode.trigram,
     ) -> TranslationMemoryListSimilarResponse:
         """
         Search similar translation memories in a project.
@@ -379,17 +414,20 @@ class ProjectService:
         Args:
             project_id: Project ID
             query: Search query string
+            mode: Similarity of trigrams, embeddings or both
 
         Returns:
             TranslationMemoryListSimilarResponse with similar search results
 
         Raises:
             EntityNotFound: If project not found
+            BusinessLogicError: If semantic search is disabled
         """
         try:
             self.__query._get_project(project_id)
         except NotFoundProjectExc:
             raise EntityNotFound("Project", project_id)
+        check_similarity_mode(mode)
 
         # Get TMs from project
         tms_data = self.get_translation_memories(project_id)
@@ -401,7 +439,7 @@ class ProjectService:
             )
 
         records = self.__tm_query.get_memory_records_paged_similar(
-            memory_ids=tm_ids, page_records=20, query=query
+            memory_ids=tm_ids, page_records=20, query=query, mode=mode
         )
 
         return TranslationMemoryListSimilarResponse(
@@ -2,7 +2,6 @@ from datetime import UTC, datetime
 
 from sqlalchemy.orm import Session
 
-from app import models
 from app.base.exceptions import EntityNotFound
 from app.comments.query import CommentsQuery
 from app.comments.schema import CommentCreate, CommentResponse
@@ -16,22 +15,45 @@ from app.documents.query import (
     DocumentRecordHistoryQuery,
     GenericDocsQuery,
 )
-from app.documents.utils import compute_diff, reconstruct_from_diffs
+from app.documents.utils import compute_encoded_diff, reconstruct_from_diffs
 from app.glossary.query import GlossaryQuery
 from app.glossary.schema import GlossaryRecordSchema
+from app.records import suggestions_cache
 from app.records.query import NotFoundDocumentRecordExc, RecordsQuery
-from app.translation_memory.query import TranslationMemoryQuery
+from app.services.match_service import MatchService
+from app.translation_memory import write_buffer
 from app.translation_memory.schema import MemorySubstitution
 
+# Every history chain has a full-text snapshot at least every N entries
+HISTORY_SNAPSHOT_INTERVAL = 20
+
+
+def history_batch_response(
+    record_ids: list[int], histories: dict[int, list[DocumentRecordHistory]]
+) -> doc_schema.DocumentRecordHistoryBatchResponse:
+    return doc_schema.DocumentRecordHistoryBatchResponse(
+        records=[
+            doc_schema.DocumentRecordHistoryBatchItem(
+                record_id=record_id,
+                history=[
+                    doc_schema.DocumentRecordHistory.model_validate(entry)
+                    for entry in histories.get(record_id, [])
+                ],
+            )
+            for record_id in record_ids
+        ]
+    )
+
 
 class RecordService:
     def __init__(self, db: Session):
+        self.__db = db
         self.__query = RecordsQuery(db)
         self.__docs_query = GenericDocsQuery(db)
         self.__comments_query = CommentsQuery(db)
         self.__history_query = DocumentRecordHistoryQuery(db)
-        self.__tm_query = TranslationMemoryQuery(db)
         self.__glossary_query = GlossaryQuery(db)
+        self.__match_service = MatchService(db)
 
     def update_record(
         self,
@@ -39,7 +61,6 @@ class RecordService:
         data: doc_schema.DocumentRecordUpdate,
         author_id: int,
         change_type: DocumentRecordHistoryChangeType,
-        shallow: bool = False,
     ) -> doc_schema.DocumentRecordUpdateResponse:
         """
         Update a document record.
@@ -49,7 +70,6 @@ class RecordService:
             data: Updated record data
             author_id: Author ID of these changes
             change_type: Type of the change
-            shallow: Whether to apply repetitions to its descendants
 
         Returns:
             DocumentRecordUpdateResponse object
@@ -63,38 +83,29 @@ class RecordService:
             updated_record = self.__query.update_record(record_id, data)
             new_target = updated_record.target
 
-            # TM tracking
-            if data.approved and not shallow:
-                for memory in record.document.project.tm_associations:
-                    if memory.mode == TmMode.write:
-                        self.__tm_query.add_or_update_record(
-                            memory.tm_id, record.source, record.target
-                        )
-                        break
-
             self.track_history(
-                record.id, old_target, new_target, author_id, change_type
+                [(record.id, old_target, new_target)], author_id, change_type
             )
 
             # update repetitions
-            if data.approved and data.update_repetitions and not shallow:
-                updated_records = self.__docs_query.get_record_ids_by_source(
-                    record.document_id, record.source
+            if data.approved and data.update_repetitions:
+                changed = self.__query.update_repetitions(record, data)
+                self.track_history(
+                    [(rec_id, target, data.target) for rec_id, target in changed],
+                    author_id,
+                    DocumentRecordHistoryChangeType.repetition,
                 )
 
-                for rec in updated_records:
-                    # skip the current ID to avoid making more repetitions than needed
-                    if rec == record.id:
-                        continue
-
-                    self.update_record(
-                        rec,
-                        data,
-                        author_id,
-                        DocumentRecordHistoryChangeType.repetition,
-                        shallow=True,
-                    )
+            # the record, its repetitions and their history
+            self.__db.commit()
 
+            # TM tracking, written in batches with other approvals by the
+            # flusher of the app, see write_buffer.flush_periodically()
+            if data.approved:
+                for memory in record.document.project.tm_associations:
+                    if memory.mode == TmMode.write:
+                        write_buffer.add(memory.tm_id, record.source, record.target)
+                        break
             return doc_schema.DocumentRecordUpdateResponse.model_validate(
                 updated_record
             )
@@ -103,41 +114,101 @@ class RecordService:
 
     def track_history(
         self,
-        record_id: int,
-        old_target: str,
-        new_target: str,
+        changes: list[tuple[int, str, str]],
         author_id: int,
         change_type: DocumentRecordHistoryChangeType,
     ):
-        # Track history if the target changed
-        if old_target == new_target:
-            return
-
-        last_history = self.__history_query.get_last_history_by_record_id(record_id)
-
-        if last_history and RecordService._are_segments_mergeable(
-            last_history,
-            author_id,
-            change_type,
-        ):
-            # we need to reconstruct original string before doing a merge
-            all_history = list(self.__history_query.get_history_by_record_id(record_id))
-
-            diffs = [history.diff for history in all_history[1:]]
-            original_text = reconstruct_from_diffs(reversed(diffs))
-            merged_diff = compute_diff(original_text, new_target)
-
-            self.__history_query.update_history_entry(
-                last_history, merged_diff, datetime.now(UTC)
+        """
+        Track history for a batch of records changed in the same way. Changes
+        are flushed, not committed.
+
+        Args:
+            changes: List of (record ID, old target, new target)
+            author_id: Author ID of these changes
+            change_type: Type of the change
+        """
+        # Track history only if the target changed
+        changes = [change for change in changes if change[1] != change[2]]
+        record_ids = [change[0] for change in changes]
+
+        # The window is enough both to find a snapshot to reconstruct the text
+        # before the latest entry and to decide whether a new entry needs one.
+        recent_histories = self.__history_query.get_recent_history_by_record_ids(
+            record_ids, HISTORY_SNAPSHOT_INTERVAL + 1
+        )
+        mergeable_ids = [
+            record_id
+            for record_id, histories in recent_histories.items()
+            if RecordService._are_segments_mergeable(
+                histories[0], author_id, change_type
             )
-        else:
-            # diffs are not mergeable, create a new one
-            self.__history_query.create_history_entry(
-                record_id,
-                compute_diff(old_target, new_target),
-                author_id,
-                change_type,
+        ]
+        # history written before snapshots were introduced may have none
+        fallback_ids = [
+            record_id
+            for record_id in mergeable_ids
+            if RecordService._find_base(recent_histories[record_id][1:]) is None
+        ]
+        if fallback_ids:
+            recent_histories.update(
+                self.__history_query.get_history_by_record_ids(fallback_ids)
+            )
+
+        new_entries: list[tuple[int, bytes]] = []
+        snapshots: dict[int, str] = {}
+        for record_id, old_target, new_target in changes:
+            histories = recent_histories.get(record_id, [])
+            if record_id in mergeable_ids:
+                # we need to reconstruct original string before doing a merge
+                last_history = histories[0]
+                original_text = RecordService._reconstruct(histories[1:])
+                last_history.diff_data = compute_encoded_diff(original_text, new_target)
+                last_history.timestamp = datetime.now(UTC)
+                if last_history.snapshot is not None:
+                    last_history.snapshot = new_target
+            else:
+                # diffs are not mergeable, create a new one
+                new_entries.append(
+                    (record_id, compute_encoded_diff(old_target, new_target))
+                )
+                previous = histories[: HISTORY_SNAPSHOT_INTERVAL - 1]
+                if len(previous) == HISTORY_SNAPSHOT_INTERVAL - 1 and all(
+                    history.snapshot is None for history in previous
+                ):
+                    snapshots[record_id] = new_target
+
+        self.__history_query.bulk_create_history_entry(
+            new_entries, author_id, change_type, snapshots
+        )
+        # later changes of the transaction read these entries
+        self.__db.flush()
+
+    @staticmethod
+    def _find_base(histories: list[DocumentRecordHistory]) -> int | None:
+        """
+        Find the position of the newest entry to start reconstruction from.
+        Returns len(histories) if the whole chain is present and no snapshot
+        exists, None if there is no snapshot in an incomplete chain.
+        """
+        for idx, history in enumerate(histories):
+            if history.snapshot is not None:
+                return idx
+        if len(histories) < HISTORY_SNAPSHOT_INTERVAL:
+            return len(histories)
+        return None
+
+    @staticmethod
+    def _reconstruct(histories: list[DocumentRecordHistory]) -> str:
+        """Reconstruct the text after the newest of the given history entries."""
+        base_idx = RecordService._find_base(histories)
+        if base_idx is None or base_idx == len(histories):
+            return reconstruct_from_diffs(
+                reversed([history.diff_data for history in histories])
             )
+        return reconstruct_from_diffs(
+            reversed([history.diff_data for history in histories[:base_idx]]),
+            base=histories[base_idx].snapshot or "",
+        )
 
     @staticmethod
     def _are_segments_mergeable(
@@ -170,20 +241,36 @@ class RecordService:
         self._get_record_by_id(record_id)
         history_entries = self.__history_query.get_history_by_record_id(record_id)
         history_list = [
-            doc_schema.DocumentRecordHistory(
-                id=entry.id,
-                diff=entry.diff,
-                author=models.ShortUser.model_validate(entry.author)
-                if entry.author
-                else None,
-                timestamp=entry.timestamp,
-                change_type=entry.change_type,
-            )
+            doc_schema.DocumentRecordHistory.model_validate(entry)
             for entry in history_entries
         ]
 
         return doc_schema.DocumentRecordHistoryListResponse(history=history_list)
 
+    def get_records_history(
+        self, record_ids: list[int]
+    ) -> doc_schema.DocumentRecordHistoryBatchResponse:
+        """
+        Get the history of changes for several document records at once.
+
+        Args:
+            record_ids: Document record IDs
+
+        Returns:
+            DocumentRecordHistoryBatchResponse object, records are in the order
+            of the given IDs
+
+        Raises:
+            EntityNotFound: If any of the records not found
+        """
+        record_ids = list(dict.fromkeys(record_ids))
+        if len(self.__query.get_existing_record_ids(record_ids)) != len(record_ids):
+            raise EntityNotFound("Document record not found")
+        histories = self.__history_query.get_history_by_record_ids(
+            record_ids, load_authors=True
+        )
+        return history_batch_response(record_ids, histories)
+
     def get_comments(self, record_id: int) -> list[CommentResponse]:
         """
         Get all comments for a document record.
@@ -244,11 +331,14 @@ class RecordService:
         tm_ids = [
             tm.id for tm in original_segment.document.project.translation_memories
         ]
-        return (
-            self.__tm_query.get_substitutions(original_segment.source, tm_ids)
-            if tm_ids
-            else []
-        )
+        key = suggestions_cache.key(original_segment.source, tm_ids)
+        substitutions = suggestions_cache.substitutions.get(key)
+        if substitutions is None:
+            substitutions = self.__match_service.get_substitutions(
+                original_segment.document, [record_id], tm_ids
+            )[record_id]
+            suggestions_cache.substitutions.set(key, substitutions)
+        return substitutions
 
     def get_record_glossary_records(self, record_id: int) -> list[GlossaryRecordSchema]:
         """
@@ -265,17 +355,21 @@ class RecordService:
         """
         original_segment = self._get_record_by_id(record_id)
         glossary_ids = [gl.id for gl in original_segment.document.project.glossaries]
-
-        return (
-            [
-                GlossaryRecordSchema.model_validate(record)
-                for record in self.__glossary_query.get_glossary_records_for_phrase(
-                    original_segment.source, glossary_ids
-                )
-            ]
-            if glossary_ids
-            else []
-        )
+        key = suggestions_cache.key(original_segment.source, glossary_ids)
+        records = suggestions_cache.glossary_records.get(key)
+        if records is None:
+            records = (
+                [
+                    GlossaryRecordSchema.model_validate(record)
+                    for record in self.__glossary_query.get_glossary_records_for_phrase(
+                        original_segment.source, glossary_ids
+                    )
+                ]
+                if glossary_ids
+                else []
+            )
+            suggestions_cache.glossary_records.set(key, records)
+        return records
 
     def _get_record_by_id(self, record_id: int):
         """
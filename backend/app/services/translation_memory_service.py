@@ -2,14 +2,20 @@
 
 import io
 from dataclasses import dataclass
+from datetime import UTC, datetime
+from typing import Iterable
 
 from sqlalchemy.orm import Session
 
-from app.base.exceptions import EntityNotFound
-from app.formats.tmx import TmxData, TmxSegment, extract_tmx_content
+from app.base.exceptions import BusinessLogicError, EntityNotFound
+from app.base.schema import CountMode
+from app.documents.query import GenericDocsQuery
+from app.formats.tmx import TmxData, TmxSegment, iter_tmx_content, iter_tmx_pairs
 from app.models import StatusMessage
+from app.settings import settings
 from app.translation_memory import models, schema
-from app.translation_memory.query import TranslationMemoryQuery
+from app.translation_memory.query import TranslationMemoryQuery, naive_utc
+from app.translation_memory.utils import normalize_source
 
 
 @dataclass
@@ -20,24 +26,69 @@ class DownloadMemoryData:
     filename: str
 
 
+def check_similarity_mode(mode: schema.SimilarityMode) -> None:
+    """
+    Check that a similar records search mode is available.
+
+    Raises:
+        BusinessLogicError: If the mode needs semantic search which is disabled
+    """
+    if mode != schema.SimilarityMode.trigram and not settings.semantic_search:
+        raise BusinessLogicError("Semantic search is disabled")
+
+
+def deduplicate_segments(
+    segments: Iterable[TmxSegment], deduplication: schema.TmxDeduplication
+) -> tuple[list[TmxSegment], int]:
+    """
+    Drop duplicated segments of a TMX file keeping the last changed one of
+    every source, or of every source and target with all_variants, the last
+    one in the file for equal dates.
+
+    Returns:
+        Kept segments and the number of dropped ones
+    """
+    kept: dict[tuple[str, str | None], TmxSegment] = {}
+    count = 0
+    for segment in segments:
+        count += 1
+        key = (
+            (normalize_source(segment.original), None)
+            if deduplication == schema.TmxDeduplication.newest
+            else (segment.original, segment.translation)
+        )
+        previous = kept.get(key)
+        if previous is None or change_time(segment) >= change_time(previous):
+            kept[key] = segment
+    return list(kept.values()), count - len(kept)
+
+
+def change_time(segment: TmxSegment) -> datetime:
+    return naive_utc(segment.change_date) or datetime.min
+
+
 class TranslationMemoryService:
     """Service for translation memory operations."""
 
     def __init__(self, db: Session):
         self.__query = TranslationMemoryQuery(db)
+        self.__docs_query = GenericDocsQuery(db)
 
-    def get_memories(self) -> list[schema.TranslationMemory]:
+    def get_memories(
+        self, language_pair: tuple[str, str] | None = None
+    ) -> list[schema.TranslationMemory]:
         """
         Get all translation memories.
 
+        Args:
+            language_pair: Source and target languages to filter memories by
+
         Returns:
             List of TranslationMemory objects
         """
         return [
-            schema.TranslationMemory(
-                id=doc.id, name=doc.name, created_by=doc.created_by
-            )
-            for doc in self.__query.get_memories()
+            schema.TranslationMemory.model_validate(doc)
+            for doc in self.__query.get_memories(language_pair)
         ]
 
     def get_memory(self, tm_id: int) -> schema.TranslationMemoryWithRecordsCount:
@@ -58,57 +109,159 @@ class TranslationMemoryService:
             id=doc.id,
             name=doc.name,
             created_by=doc.created_by,
+            source_language=doc.source_language,
+            target_language=doc.target_language,
             records_count=self.__query.get_memory_records_count(tm_id),
         )
 
-    def create_memory(self, name: str, user_id: int) -> schema.TranslationMemory:
+    def create_memory(
+        self, settings: schema.TranslationMemoryCreationSettings, user_id: int
+    ) -> schema.TranslationMemory:
         """
         Create a new translation memory.
 
         Args:
-            name: Name for the translation memory
+            settings: Name and language pair of the translation memory
             user_id: ID of user creating the memory
 
         Returns:
             Created TranslationMemory object
         """
-        doc = self.__query.add_memory(name, user_id, [])
-        return schema.TranslationMemory(
-            id=doc.id, name=doc.name, created_by=doc.created_by
+        doc = self.__query.add_memory(
+            settings.name,
+            user_id,
+            [],
+            settings.source_language,
+            settings.target_language,
         )
-
-    async def create_memory_from_file(
-        self, filename: str | None, content: bytes, user_id: int
+        return schema.TranslationMemory.model_validate(doc)
+
+    def create_memory_from_file(
+        self,
+        filename: str | None,
+        content: bytes,
+        user_id: int,
+        deduplication: schema.TmxDeduplication = schema.TmxDeduplication.newest,
+        source_language: str = "en",
+        target_language: str = "ru",
     ) -> schema.TranslationMemory:
         """
         Create a translation memory from an uploaded TMX file.
 
         Args:
-            file: Uploaded file
+            filename: Name of the file
+            content: TMX file content
             user_id: ID of user creating the memory
+            deduplication: Which of duplicated segments to keep
+            source_language: Source language of segments to take
+            target_language: Target language of segments to take
 
         Returns:
             Created TranslationMemory object
         """
-        segments = extract_tmx_content(content)
-
-        doc = self.__query.add_memory(
-            filename or "",
-            user_id,
-            [
-                models.TranslationMemoryRecord(
-                    source=segment.original,
-                    target=segment.translation,
-                    creation_date=segment.creation_date,
-                    change_date=segment.change_date,
-                )
-                for segment in segments
-            ],
+        segments, _ = deduplicate_segments(
+            iter_tmx_content(content, source_language, target_language),
+            deduplication,
+        )
+        doc = self._add_memory(
+            filename or "", user_id, segments, (source_language, target_language)
         )
+        self._enqueue_index_build(doc.id)
+        return schema.TranslationMemory.model_validate(doc)
+
+    def create_memories_from_file(
+        self,
+        filename: str | None,
+        content: bytes,
+        user_id: int,
+        deduplication: schema.TmxDeduplication = schema.TmxDeduplication.newest,
+    ) -> list[schema.TranslationMemory]:
+        """
+        Create a translation memory for every language pair of a multilingual
+        TMX file, parsing the file once.
+
+        Args:
+            filename: Name of the file
+            content: TMX file content
+            user_id: ID of user creating the memories
+            deduplication: Which of duplicated segments to keep
 
-        return schema.TranslationMemory(
-            id=doc.id, name=doc.name, created_by=doc.created_by
+        Returns:
+            Created TranslationMemory objects
+        """
+        pairs: dict[tuple[str, str], list[TmxSegment]] = {}
+        for pair, segment in iter_tmx_pairs(content):
+            pairs.setdefault(pair, []).append(segment)
+
+        memories = []
+        for pair, pair_segments in pairs.items():
+            segments, _ = deduplicate_segments(pair_segments, deduplication)
+            doc = self._add_memory(
+                f"{filename or ''} ({pair[0]}-{pair[1]})", user_id, segments, pair
+            )
+            self._enqueue_index_build(doc.id)
+            memories.append(schema.TranslationMemory.model_validate(doc))
+        return memories
+
+    def import_file(
+        self,
+        tm_id: int,
+        content: bytes,
+        deduplication: schema.TmxDeduplication = schema.TmxDeduplication.newest,
+    ) -> schema.TmxImportResult:
+        """
+        Append segments of a TMX file to an existing translation memory.
+
+        Args:
+            tm_id: Translation memory ID
+            content: TMX file content, segments of the language pair of the
+                memory are taken
+            deduplication: Which of duplicated segments to keep
+
+        Returns:
+            Numbers of inserted, updated and skipped segments, duplicates
+            within the file are counted as skipped
+
+        Raises:
+            EntityNotFound: If memory not found
+        """
+        memory = self._get_memory_by_id(tm_id)
+        segments, duplicates = deduplicate_segments(
+            iter_tmx_content(content, memory.source_language, memory.target_language),
+            deduplication,
         )
+        result = self.__query.merge_records(tm_id, segments, deduplication)
+        result.skipped += duplicates
+
+        # imported records keep their dates, so documents with precomputed
+        # matches would not notice them as new
+        if result.inserted:
+            self.__docs_query.enqueue_matches_refresh(
+                self.__docs_query.get_matched_document_ids_by_memory(tm_id)
+            )
+            self._enqueue_index_build(tm_id)
+        return result
+
+    def build_index(self, tm_id: int) -> StatusMessage:
+        """
+        Rebuild the trigram and vector index files of a translation memory by
+        the worker, the ones which are used.
+
+        Args:
+            tm_id: Translation memory ID
+
+        Returns:
+            StatusMessage indicating success
+
+        Raises:
+            EntityNotFound: If memory not found
+            BusinessLogicError: If index files are not used
+        """
+        self._get_memory_by_id(tm_id)
+        if not self._uses_index_files() and not self._uses_vector_files():
+            raise BusinessLogicError("Index files are not used")
+        self._enqueue_index_build(tm_id)
+        return StatusMessage(message="Index build started")
 
     def delete_memory(self, tm_id: int) -> StatusMessage:
         """
@@ -128,15 +281,23 @@ class TranslationMemoryService:
         return StatusMessage(message="Deleted")
 
     def get_memory_records(
-        self, tm_id: int, page: int, query_str: str | None
+        self,
+        tm_id: int,
+        page: int,
+        query_str: str | None,
+        after_id: int | None = None,
+        count_mode: CountMode = CountMode.exact,
     ) -> schema.TranslationMemoryListResponse:
         """
         Get records from a translation memory.
 
         Args:
             tm_id: Translation memory ID
-            page: Page number
+            page: Page number, ignored when after_id is given
             query_str: Optional search query
+            after_id: Optional ID of the last record of the previous page to
+                paginate by cursor instead of page number
+            count_mode: How to count the total number of records
 
         Returns:
             TranslationMemoryListResponse object
@@ -146,15 +307,25 @@ class TranslationMemoryService:
         """
         page_records = 100
         self._get_memory_by_id(tm_id)
-        records, count = self.__query.get_memory_records_paged(
-            tm_id, page, page_records, query_str
+        count, estimated = self.__query.count_memory_records(
+            tm_id, query_str, count_mode
+        )
+        records = self.__query.get_memory_records_paged(
+            tm_id, page, page_records, query_str, after_id
         )
         return schema.TranslationMemoryListResponse(
-            records=records, page=page, total_records=count
+            records=records,
+            page=page if after_id is None else None,
+            total_records=count,
+            total_is_estimate=estimated,
+            next_after_id=records[-1].id if len(records) == page_records else None,
         )
 
     def get_memory_records_similar(
-        self, tm_id: int, query_str: str
+        self,
+        tm_id: int,
+        query_str: str,
+        mode: schema.SimilarityMode = schema.SimilarityMode.trigram,
     ) -> schema.TranslationMemoryListSimilarResponse:
         """
         Get similar records from a translation memory.
@@ -162,17 +333,20 @@ class TranslationMemoryService:
         Args:
             tm_id: Translation memory ID
             query_str: Search query
+            mode: Similarity of trigrams, embeddings or both
 
         Returns:
             TranslationMemoryListSimilarResponse object
 
         Raises:
             EntityNotFound: If memory not found
+            BusinessLogicError: If semantic search is disabled
         """
         page_records = 20
         self._get_memory_by_id(tm_id)
+        check_similarity_mode(mode)
         records = self.__query.get_memory_records_paged_similar(
-            tm_id, page_records, query_str
+            tm_id, page_records, query_str, mode
         )
         return schema.TranslationMemoryListSimilarResponse(
             records=records, page=0, total_records=len(records)
@@ -201,10 +375,49 @@ class TranslationMemoryService:
                     change_date=record.change_date,
                 )
                 for record in memory.records
-            ]
+            ],
+            memory.source_language,
+            memory.target_language,
         )
         return DownloadMemoryData(content=data.write(), filename=f"{tm_id}.tmx")
 
+    def _add_memory(
+        self,
+        name: str,
+        user_id: int,
+        segments: list[TmxSegment],
+        pair: tuple[str, str],
+    ) -> models.TranslationMemory:
+        now = datetime.now(UTC)
+        return self.__query.add_memory(
+            name,
+            user_id,
+            [
+                models.TranslationMemoryRecord(
+                    source=segment.original,
+                    target=segment.translation,
+                    creation_date=segment.creation_date or now,
+                    change_date=segment.change_date or now,
+                )
+                for segment in segments
+            ],
+            *pair,
+        )
+
+    def _enqueue_index_build(self, tm_id: int) -> None:
+        if self._uses_index_files():
+            self.__query.enqueue_index_build(tm_id)
+        if self._uses_vector_files():
+            self.__query.enqueue_embeddings_build(tm_id)
+
+    @staticmethod
+    def _uses_index_files() -> bool:
+        return settings.fuzzy_matcher == "trigram_index" and bool(settings.tm_index_dir)
+
+    @staticmethod
+    def _uses_vector_files() -> bool:
+        return settings.semantic_search and bool(settings.tm_index_dir)
+
     def _get_memory_by_id(self, tm_id: int) -> models.TranslationMemory:
         """
         Get a translation memory by ID.
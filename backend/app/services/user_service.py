@@ -7,6 +7,7 @@ from app.base.exceptions import BusinessLogicError, EntityNotFound
 from app.registration_token.models import RegistrationToken
 from app.registration_token.query import RegistrationTokenQuery
 from app.security import hash_password
+from app.user import auth_cache
 
 
 class UserService:
@@ -128,5 +129,6 @@ class UserService:
         user.disabled = data.disabled
 
         self.__db.commit()
+        auth_cache.invalidate_user(user_id)
 
         return models.StatusMessage(message="ok")
@@ -0,0 +1,100 @@
+"""
+Providers of text embeddings for semantic TM search, chosen by
+settings.embedding_provider. Vectors are L2-normalized, so their dot
+product is cosine similarity.
+"""
+
+import hashlib
+import math
+import re
+from abc import ABC, abstractmethod
+from array import array
+from typing import Sequence
+
+import httpx
+from openai import OpenAI
+
+from app.settings import settings
+
+Vector = array  # of "f"
+
+WORD_RE = re.compile(r"[^\W_]+")
+
+
+def normalize(values: Sequence[float]) -> Vector:
+    norm = math.sqrt(sum(value * value for value in values))
+    if not norm:
+        return array("f", values)
+    return array("f", (value / norm for value in values))
+
+
+def dot(first: Sequence[float], second: Sequence[float]) -> float:
+    return math.sumprod(first, second)
+
+
+class EmbeddingProvider(ABC):
+    @abstractmethod
+    def embed(self, texts: list[str]) -> list[Vector]:
+        """Get normalized embeddings of texts."""
+
+
+class HashingEmbeddingProvider(EmbeddingProvider):
+    """
+    Local stub without a model: words and character trigrams of words are
+    hashed into a fixed number of signed buckets. Vectors do not depend on
+    word order, so reordered sentences match, paraphrases need a real model.
+    """
+
+    def __init__(self, dimension: int) -> None:
+        self.dimension = dimension
+
+    def embed(self, texts: list[str]) -> list[Vector]:
+        return [self._embed(text) for text in texts]
+
+    def _embed(self, text: str) -> Vector:
+        values = [0.0] * self.dimension
+        for word in WORD_RE.findall(text.lower()):
+            padded = f" {word} "
+            features = [word] * 2 + [padded[i : i + 3] for i in range(len(padded) - 2)]
+            for feature in features:
+                digest = hashlib.blake2b(feature.encode(), digest_size=8).digest()
+                bucket = int.from_bytes(digest[:4], "little") % self.dimension
+                values[bucket] += 1.0 if digest[4] & 1 else -1.0
+        return normalize(values)
+
+
+class OpenAIEmbeddingProvider(EmbeddingProvider):
+    """Embeddings of an OpenAI compatible API."""
+
+    # texts sent in a single request
+    BATCH = 256
+
+    def embed(self, texts: list[str]) -> list[Vector]:
+        client = OpenAI(
+            api_key=settings.embedding_api_key,
+            base_url=settings.embedding_base_api,
+            http_client=httpx.Client(proxy=settings.proxy_server)
+            if settings.proxy_server
+            else None,
+        )
+        output = []
+        for start in range(0, len(texts), self.BATCH):
+            response = client.embeddings.create(
+                model=settings.embedding_model or "",
+                input=texts[start : start + self.BATCH],
+            )
+            output.extend(normalize(item.embedding) for item in response.data)
+        return output
+
+
+def provider_key() -> str:
+    """Identify the configured provider, vectors of different ones differ."""
+    if settings.embedding_provider == "openai":
+        return f"openai:{settings.embedding_model}"
+    return f"hashing:{settings.embedding_dimension}"
+
+
+def get_provider() -> EmbeddingProvider:
+    if settings.embedding_provider == "openai":
+        return OpenAIEmbeddingProvider()
+    return HashingEmbeddingProvider(settings.embedding_dimension)
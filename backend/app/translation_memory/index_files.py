@@ -0,0 +1,178 @@
+"""
+File-backed indexes of translation memories, shared by trigram and vector
+indexes.
+
+Indexes are built by the worker into files in settings.tm_index_dir and
+memory-mapped, a changed file is reloaded on the next search. A search in
+a memory without a usable file enqueues its build and gets an empty index
+until the file is written, so the web process does not index a whole
+memory. Memories are indexed in process only without the directory or in
+SQLite, which has no worker of its own in tests and local setups.
+
+A file is a magic string, the size of a JSON header and the header, then
+arrays of the index. Arrays start at a multiple of 8 bytes, the ones with
+8 byte items go first.
+"""
+
+import json
+import logging
+import mmap
+import os
+import struct
+import threading
+from abc import ABC, abstractmethod
+from collections.abc import Buffer
+from typing import Any, Generic, Iterable, TypeVar
+
+from sqlalchemy.orm import Session
+
+from app.settings import settings
+from app.translation_memory import schema
+from app.translation_memory.tasks import enqueue_memory_task
+
+T = TypeVar("T")
+
+
+def write_index_file(
+    path: str, magic: bytes, header: dict[str, Any], arrays: Iterable[Buffer]
+) -> None:
+    """Write an index file, replacing it atomically."""
+    data = json.dumps(header).encode()
+    data += b" " * (-(len(magic) + 8 + len(data)) % 8)
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "wb") as file:
+        file.write(magic)
+        file.write(len(data).to_bytes(8, "little"))
+        file.write(data)
+        for values in arrays:
+            file.write(memoryview(values))
+    os.replace(tmp_path, path)
+
+
+class IndexFileReader:
+    """Memory-mapped index file written by write_index_file()."""
+
+    def __init__(self, path: str, magic: bytes) -> None:
+        with open(path, "rb") as file:
+            mapped = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+        if mapped[: len(magic)] != magic:
+            raise ValueError(f"{path} is not an index of this version")
+        start = len(magic) + 8
+        header_size = int.from_bytes(mapped[len(magic) : start], "little")
+        self.header: dict[str, Any] = json.loads(mapped[start : start + header_size])
+        self._view = memoryview(mapped)
+        self._start = start + header_size
+
+    def take(self, typecode: str, count: int) -> memoryview:
+        """Get the next array, slices of it are not copied."""
+        size = count * struct.calcsize(typecode)
+        part = self._view[self._start : self._start + size].cast(typecode)
+        self._start += size
+        return part
+
+
+def modified_at(path: str | None) -> float | None:
+    if path is None:
+        return None
+    try:
+        return os.stat(path).st_mtime
+    except FileNotFoundError:
+        return None
+
+
+class IndexFiles(ABC, Generic[T]):
+    """Indexes of memories kept by a process, see the module docstring."""
+
+    # of index files in settings.tm_index_dir
+    suffix: str
+    # index kind in log messages
+    kind: str
+
+    def __init__(self) -> None:
+        # memory ID -> (modification time of the file or None,
+        # built in process, index)
+        self._indexes: dict[int, tuple[float | None, bool, T]] = {}
+        self._lock = threading.Lock()
+
+    @abstractmethod
+    def load(self, path: str) -> T | None:
+        """Load an index file, None if it cannot be used."""
+
+    @abstractmethod
+    def build(self, db: Session, memory_id: int) -> T:
+        """Index a memory in process."""
+
+    @abstractmethod
+    def write(self, db: Session, memory_id: int, path: str) -> None:
+        """Index a memory into a file."""
+
+    @abstractmethod
+    def empty(self) -> T:
+        """Get an index without records."""
+
+    @abstractmethod
+    def task_data(
+        self,
+    ) -> schema.BuildTmIndexTaskData | schema.BuildTmEmbeddingsTaskData:
+        """Get the worker task building the file."""
+
+    def path(self, memory_id: int) -> str | None:
+        if not settings.tm_index_dir:
+            return None
+        return os.path.join(settings.tm_index_dir, f"{int(memory_id)}{self.suffix}")
+
+    def get(self, db: Session, memory_id: int) -> T:
+        """Get the index of a memory, loading a changed file."""
+        path = self.path(memory_id)
+        file_modified_at = modified_at(path)
+        with self._lock:
+            cached = self._indexes.get(memory_id)
+            if cached is not None and cached[0] == file_modified_at:
+                return cached[2]
+
+        # an unusable file is not read again until it changes
+        index = self.load(path) if path and file_modified_at is not None else None
+        in_process = index is None and (
+            path is None or db.get_bind().dialect.name == "sqlite"
+        )
+        if in_process:
+            logging.info(
+                "Building %s index of memory %s in process", self.kind, memory_id
+            )
+            index = self.build(db, memory_id)
+        elif index is None:
+            logging.info("Enqueued %s index of memory %s", self.kind, memory_id)
+            enqueue_memory_task(db, memory_id, self.task_data())
+            index = self.empty()
+        with self._lock:
+            self._indexes[memory_id] = (file_modified_at, in_process, index)
+        return index
+
+    def is_in_process(self, memory_id: int) -> bool:
+        with self._lock:
+            cached = self._indexes.get(memory_id)
+            return cached is not None and cached[1]
+
+    def build_file(self, db: Session, memory_id: int) -> None:
+        """Build the index file of a memory, processes reload it on next search."""
+        path = self.path(memory_id)
+        if path is None:
+            raise RuntimeError(f"Directory of {self.kind} indexes is not set")
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        self.write(db, memory_id, path)
+
+    def forget(self, memory_id: int) -> None:
+        """Drop the index of a memory from the process."""
+        with self._lock:
+            self._indexes.pop(memory_id, None)
+
+    def remove(self, memory_id: int) -> None:
+        """Drop the index of a deleted memory, with its file."""
+        self.forget(memory_id)
+        path = self.path(memory_id)
+        if path is not None and os.path.exists(path):
+            os.remove(path)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._indexes.clear()
@@ -0,0 +1,369 @@
+"""
+Fuzzy search engines of translation memories.
+
+PgTrgmMatcher searches by KNN over the pg_trgm GiST index in PostgreSQL.
+TrigramIndexMatcher searches in-process trigram indexes of memories, see
+app.translation_memory.trigram_index, and works on any database. Both give
+pg_trgm similarity and order ties by TM record ID, the engine is chosen by
+settings.fuzzy_matcher.
+"""
+
+import logging
+from abc import ABC, abstractmethod
+from typing import NamedTuple, Sequence
+
+from sqlalchemy import Float, Row, Select, func, select, true, union_all
+from sqlalchemy.orm import Session
+
+from app.db import run_cpu_bound
+from app.documents.models import DocumentRecord
+from app.settings import settings
+from app.translation_memory import trigram_index
+from app.translation_memory.models import TranslationMemoryRecord
+
+
+class FuzzyMatch(NamedTuple):
+    id: int
+    source: str
+    target: str
+    similarity: float
+
+
+class RecordMatch(NamedTuple):
+    record_id: int
+    tm_record_id: int
+    source: str
+    target: str
+    similarity: float
+
+
+class FuzzyMatcher(ABC):
+    @abstractmethod
+    def search(
+        self, source: str, tm_ids: list[int], threshold: float, count: int
+    ) -> Sequence[FuzzyMatch]:
+        """
+        Find TM records with the most similar sources.
+
+        Args:
+            source: Text to search for
+            tm_ids: Translation memory IDs to search in
+            threshold: Minimal similarity of records
+            count: Maximal number of records
+
+        Returns:
+            Records ordered by similarity
+        """
+
+    @abstractmethod
+    def search_records(
+        self, record_ids: list[int], tm_ids: list[int], threshold: float, count: int
+    ) -> Sequence[RecordMatch]:
+        """
+        Find the most similar TM records for sources of several document
+        records, ordered by record ID and similarity.
+        """
+
+    @abstractmethod
+    def score_records(
+        self,
+        record_ids: list[int],
+        tm_ids: list[int],
+        tm_record_ids: list[int],
+        threshold: float,
+    ) -> Sequence[RecordMatch]:
+        """
+        Score given TM records against document records directly, without
+        an index. Meant for a handful of TM records.
+        """
+
+
+class PgTrgmMatcher(FuzzyMatcher):
+    def __init__(self, db: Session) -> None:
+        self.__db = db
+
+    def search(
+        self, source: str, tm_ids: list[int], threshold: float, count: int
+    ) -> Sequence[FuzzyMatch]:
+        """
+        Find records with the most similar sources by KNN searches over the
+        trigram GiST index, then drop the ones below the similarity threshold.
+
+        Trigram distance is 1 - similarity, so the nearest `count` records
+        filtered by the threshold are the same as the most similar `count`
+        records above the threshold. Unlike the % operator, this needs no
+        pg_trgm.similarity_threshold session setting.
+        """
+        if not tm_ids:
+            return []
+        nearest = self._nearest(source, tm_ids, count).subquery()
+        rows = self.__db.execute(
+            select(
+                nearest.c.id,
+                nearest.c.source,
+                nearest.c.target,
+                (1 - nearest.c.distance).label("similarity"),
+            )
+            .filter(nearest.c.distance <= 1 - threshold)
+            .order_by(nearest.c.distance, nearest.c.id)
+        ).all()
+        return [FuzzyMatch(*row) for row in rows]
+
+    def search_records(
+        self, record_ids: list[int], tm_ids: list[int], threshold: float, count: int
+    ) -> Sequence[RecordMatch]:
+        """
+        Every record gets its own KNN searches joined laterally, all records
+        are searched in one query.
+        """
+        if not tm_ids:
+            return []
+        nearest = self._nearest(DocumentRecord.source, tm_ids, count).lateral()
+        rows = self.__db.execute(
+            select(
+                DocumentRecord.id.label("record_id"),
+                nearest.c.id.label("tm_record_id"),
+                nearest.c.source,
+                nearest.c.target,
+                (1 - nearest.c.distance).label("similarity"),
+            )
+            .join(nearest, true())
+            .filter(
+                DocumentRecord.id.in_(record_ids),
+                nearest.c.distance <= 1 - threshold,
+            )
+            .order_by(DocumentRecord.id, nearest.c.distance, nearest.c.id)
+        ).all()
+        return [RecordMatch(*row) for row in rows]
+
+    @staticmethod
+    def _nearest(source, tm_ids: list[int], count: int) -> Select:
+        """
+        Select the `count` records of memories nearest to a source. Every
+        memory gets its own KNN scan: the index starts with the memory ID, so
+        a scan filtered by equality walks only records of that memory, while
+        an IN list would be a filter over the nearest records of all
+        memories. The scans are merged by distance.
+        """
+        distance = TranslationMemoryRecord.source.op("<->", return_type=Float)(
+            source
+        ).label("distance")
+        scans = [
+            select(
+                TranslationMemoryRecord.id,
+                TranslationMemoryRecord.source,
+                TranslationMemoryRecord.target,
+                distance,
+            )
+            .filter(TranslationMemoryRecord.document_id == tm_id)
+            .order_by(distance, TranslationMemoryRecord.id)
+            .limit(count)
+            # a lateral source is correlated through the merging subquery
+            .correlate_except(TranslationMemoryRecord)
+            for tm_id in tm_ids
+        ]
+        if len(scans) == 1:
+            return scans[0]
+        merged = union_all(*scans).subquery()
+        return (
+            select(merged.c.id, merged.c.source, merged.c.target, merged.c.distance)
+            .order_by(merged.c.distance, merged.c.id)
+            .limit(count)
+        )
+
+    def score_records(
+        self,
+        record_ids: list[int],
+        tm_ids: list[int],
+        tm_record_ids: list[int],
+        threshold: float,
+    ) -> Sequence[RecordMatch]:
+        similarity = func.similarity(
+            TranslationMemoryRecord.source, DocumentRecord.source
+        ).label("similarity")
+        rows = self.__db.execute(
+            select(
+                DocumentRecord.id.label("record_id"),
+                TranslationMemoryRecord.id.label("tm_record_id"),
+                TranslationMemoryRecord.source,
+                TranslationMemoryRecord.target,
+                similarity,
+            )
+            .join(TranslationMemoryRecord, true())
+            .filter(
+                DocumentRecord.id.in_(record_ids),
+                # prunes partitions of other memories
+                TranslationMemoryRecord.document_id.in_(tm_ids),
+                TranslationMemoryRecord.id.in_(tm_record_ids),
+                similarity >= threshold,
+            )
+            .order_by(DocumentRecord.id, similarity.desc(), TranslationMemoryRecord.id)
+        ).all()
+        return [RecordMatch(*row) for row in rows]
+
+
+class TrigramIndexMatcher(FuzzyMatcher):
+    """
+    Searches trigram indexes of memories. Records added after an index was
+    built are scored directly, an index built in process is rebuilt when
+    there are more of them than settings.tm_index_max_unindexed.
+    """
+
+    def __init__(self, db: Session) -> None:
+        self.__db = db
+
+    def search(
+        self, source: str, tm_ids: list[int], threshold: float, count: int
+    ) -> Sequence[FuzzyMatch]:
+        return self._search_many([source], tm_ids, threshold, count)[0]
+
+    def search_records(
+        self, record_ids: list[int], tm_ids: list[int], threshold: float, count: int
+    ) -> Sequence[RecordMatch]:
+        records = self.__db.execute(
+            select(DocumentRecord.id, DocumentRecord.source)
+            .filter(DocumentRecord.id.in_(record_ids))
+            .order_by(DocumentRecord.id)
+        ).all()
+        found = self._search_many(
+            [record.source for record in records], tm_ids, threshold, count
+        )
+        return [
+            RecordMatch(record.id, *match)
+            for record, matches in zip(records, found)
+            for match in matches
+        ]
+
+    def score_records(
+        self,
+        record_ids: list[int],
+        tm_ids: list[int],
+        tm_record_ids: list[int],
+        threshold: float,
+    ) -> Sequence[RecordMatch]:
+        records = self.__db.execute(
+            select(DocumentRecord.id, DocumentRecord.source)
+            .filter(DocumentRecord.id.in_(record_ids))
+            .order_by(DocumentRecord.id)
+        ).all()
+        tm_records = self.__db.execute(
+            select(
+                TranslationMemoryRecord.id,
+                TranslationMemoryRecord.source,
+                TranslationMemoryRecord.target,
+            ).filter(
+                TranslationMemoryRecord.document_id.in_(tm_ids),
+                TranslationMemoryRecord.id.in_(tm_record_ids),
+            )
+        ).all()
+        return run_cpu_bound(self._score, records, tm_records, threshold)
+
+    @staticmethod
+    def _score(
+        records: Sequence[Row], tm_records: Sequence[Row], threshold: float
+    ) -> list[RecordMatch]:
+        tm_grams = [
+            trigram_index.trigrams(tm_record.source) for tm_record in tm_records
+        ]
+
+        output = []
+        for record in records:
+            grams = trigram_index.trigrams(record.source)
+            scored = [
+                RecordMatch(record.id, *tm_record, similarity)
+                for tm_record, other in zip(tm_records, tm_grams)
+                if (similarity := trigram_index.similarity(grams, other))
+                >= threshold - trigram_index.EPSILON
+            ]
+            scored.sort(key=lambda match: (-match.similarity, match.tm_record_id))
+            output.extend(scored)
+        return output
+
+    def _search_many(
+        self, sources: list[str], tm_ids: list[int], threshold: float, count: int
+    ) -> list[list[FuzzyMatch]]:
+        # (memory ID, index, records added after it was built)
+        memories = []
+        for tm_id in tm_ids:
+            index = trigram_index.get_index(self.__db, tm_id)
+            memories.append(
+                (tm_id, index, self._get_unindexed(tm_id, index.max_record_id))
+            )
+        best = run_cpu_bound(self._search_indexes, sources, memories, threshold, count)
+
+        records = {
+            row.id: row
+            for row in self.__db.execute(
+                select(
+                    TranslationMemoryRecord.id,
+                    TranslationMemoryRecord.source,
+                    TranslationMemoryRecord.target,
+                ).filter(
+                    TranslationMemoryRecord.document_id.in_(tm_ids),
+                    TranslationMemoryRecord.id.in_(
+                        {record_id for output in best for _, record_id in output}
+                    ),
+                )
+            )
+        }
+        # records removed after the index was built are skipped
+        return [
+            [
+                FuzzyMatch(record_id, *records[record_id][1:], score)
+                for score, record_id in output
+                if record_id in records
+            ]
+            for output in best
+        ]
+
+    @staticmethod
+    def _search_indexes(
+        sources: list[str],
+        memories: list[tuple[int, trigram_index.TrigramIndex, list[tuple[int, str]]]],
+        threshold: float,
+        count: int,
+    ) -> list[list[tuple[float, int]]]:
+        queries = [trigram_index.trigrams(source) for source in sources]
+        # (similarity, TM record ID) of every query
+        found: list[list[tuple[float, int]]] = [[] for _ in sources]
+        for tm_id, index, unindexed in memories:
+            unindexed_grams = [
+                (record_id, trigram_index.trigrams(source))
+                for record_id, source in unindexed
+            ]
+            indexed = trigram_index.search_many(index, tm_id, queries, threshold, count)
+            for grams, output, matches in zip(queries, found, indexed):
+                output.extend(matches)
+                for record_id, other in unindexed_grams:
+                    score = trigram_index.similarity(grams, other)
+                    if score >= threshold - trigram_index.EPSILON:
+                        output.append((score, record_id))
+        return [trigram_index.top(output, count) for output in found]
+
+    def _get_unindexed(self, tm_id: int, max_record_id: int) -> list[tuple[int, str]]:
+        rows = self.__db.execute(
+            select(TranslationMemoryRecord.id, TranslationMemoryRecord.source).filter(
+                TranslationMemoryRecord.document_id == tm_id,
+                TranslationMemoryRecord.id > max_record_id,
+            )
+        ).all()
+        if len(rows) > settings.tm_index_max_unindexed:
+            if trigram_index.is_in_process(tm_id):
+                trigram_index.forget(tm_id)
+            else:
+                logging.warning(
+                    "Trigram index of translation memory %s misses %s records",
+                    tm_id,
+                    len(rows),
+                )
+        return [(row.id, row.source) for row in rows]
+
+
+def get_matcher(db: Session) -> FuzzyMatcher:
+    """Get the fuzzy search engine, pg_trgm is available in PostgreSQL only."""
+    if (
+        settings.fuzzy_matcher == "pg_trgm"
+        and db.get_bind().dialect.name == "postgresql"
+    ):
+        return PgTrgmMatcher(db)
+    return TrigramIndexMatcher(db)
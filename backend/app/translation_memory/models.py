@@ -2,10 +2,12 @@ from datetime import UTC, datetime
 from typing import TYPE_CHECKING
 
 from sqlalchemy import ForeignKey, Index
+from sqlalchemy.engine.default import DefaultExecutionContext
 from sqlalchemy.ext.associationproxy import AssociationProxy, association_proxy
 from sqlalchemy.orm import Mapped, mapped_column, relationship
 
 from app.db import Base
+from app.translation_memory.utils import source_hash
 
 if TYPE_CHECKING:
     from app.projects.models import Project, ProjectTmAssociation
@@ -16,12 +18,18 @@ def utc_time():
     return datetime.now(UTC)
 
 
+def record_source_hash(context: DefaultExecutionContext) -> str:
+    return source_hash(context.get_current_parameters()["source"])
+
+
 class TranslationMemory(Base):
     __tablename__ = "translation_memory"
 
     id: Mapped[int] = mapped_column(primary_key=True)
     name: Mapped[str] = mapped_column()
     created_by: Mapped[int] = mapped_column(ForeignKey("user.id"))
+    source_language: Mapped[str] = mapped_column(default="en", server_default="en")
+    target_language: Mapped[str] = mapped_column(default="ru", server_default="ru")
 
     records: Mapped[list["TranslationMemoryRecord"]] = relationship(
         back_populates="document",
@@ -46,6 +54,8 @@ class TranslationMemoryRecord(Base):
     id: Mapped[int] = mapped_column(primary_key=True)
     document_id: Mapped[int] = mapped_column(ForeignKey("translation_memory.id"))
     source: Mapped[str] = mapped_column()
+    # md5 of the source, see app.translation_memory.utils.source_hash
+    source_hash: Mapped[str] = mapped_column(default=record_source_hash)
     target: Mapped[str] = mapped_column()
     creation_date: Mapped[datetime] = mapped_column(default=utc_time)
     change_date: Mapped[datetime] = mapped_column(default=utc_time)
@@ -54,8 +64,30 @@ class TranslationMemoryRecord(Base):
 
 
 Index(
-    "trgm_tm_src_idx",
+    "translation_memory_language_pair_idx",
+    TranslationMemory.source_language,
+    TranslationMemory.target_language,
+)
+# In PostgreSQL the record table is partitioned by document_id with the
+# primary key (id, document_id) and every partition has its own copy of these
+# indexes, see app.translation_memory.partitions
+# KNN scans filtered by a memory walk only its records, needs btree_gist
+Index(
+    "trgm_tm_memory_src_idx",
+    TranslationMemoryRecord.document_id,
     TranslationMemoryRecord.source,
     postgresql_using="gist",
     postgresql_ops={"source": "gist_trgm_ops"},
 )
+# exact lookups and writes merging records by source, a memory may have
+# several translations of a source
+Index(
+    "translation_memory_record_source_hash_idx",
+    TranslationMemoryRecord.document_id,
+    TranslationMemoryRecord.source_hash,
+)
+Index(
+    "translation_memory_record_creation_date_idx",
+    TranslationMemoryRecord.document_id,
+    TranslationMemoryRecord.creation_date,
+)
@@ -0,0 +1,103 @@
+"""
+Partitions of translation_memory_record, PostgreSQL only.
+
+The table is partitioned by LIST of memory IDs. Memories are kept in the
+default partition until a large one is moved to a partition of its own,
+which has its own trigram index. Lookups filter records by memory IDs, so
+the planner prunes partitions of other memories: a search in a large memory
+does not traverse the index of the rest, and a search in small memories
+skips the large ones.
+
+Moving a memory in or out of its partition is a maintenance operation, see
+create_memory_partition().
+"""
+
+from sqlalchemy import text
+from sqlalchemy.orm import Session
+
+DEFAULT_PARTITION = "translation_memory_record_default"
+PARTITION_PREFIX = "translation_memory_record_tm_"
+
+
+def partition_name(memory_id: int) -> str:
+    return f"{PARTITION_PREFIX}{int(memory_id)}"
+
+
+def get_memory_partitions(db: Session) -> dict[int, str]:
+    """Get dedicated partitions by memory ID."""
+    rows = db.execute(
+        text(
+            """
+            SELECT child.relname
+            FROM pg_inherits
+            JOIN pg_class parent ON parent.oid = pg_inherits.inhparent
+            JOIN pg_class child ON child.oid = pg_inherits.inhrelid
+            WHERE parent.relname = 'translation_memory_record'
+                AND child.relname != :default
+            """
+        ),
+        {"default": DEFAULT_PARTITION},
+    ).scalars()
+    return {int(name.removeprefix(PARTITION_PREFIX)): name for name in rows}
+
+
+def create_partition_sql(memory_id: int) -> list[str]:
+    """Get statements moving a memory to a partition of its own."""
+    name = partition_name(memory_id)
+    memory_id = int(memory_id)
+    return [
+        f"CREATE TABLE {name} (LIKE translation_memory_record INCLUDING DEFAULTS)",
+        # lets ATTACH skip the scan validating the partition
+        f"ALTER TABLE {name} ADD CONSTRAINT {name}_document_id_check "
+        f"CHECK (document_id = {memory_id})",
+        f"INSERT INTO {name} SELECT * FROM {DEFAULT_PARTITION} "
+        f"WHERE document_id = {memory_id}",
+        f"DELETE FROM {DEFAULT_PARTITION} WHERE document_id = {memory_id}",
+        f"ALTER TABLE translation_memory_record ATTACH PARTITION {name} "
+        f"FOR VALUES IN ({memory_id})",
+        f"ANALYZE {name}",
+    ]
+
+
+def merge_partition_sql(memory_id: int) -> list[str]:
+    """Get statements moving a memory back to the default partition."""
+    name = partition_name(memory_id)
+    return [
+        f"ALTER TABLE translation_memory_record DETACH PARTITION {name}",
+        f"INSERT INTO translation_memory_record SELECT * FROM {name}",
+        f"DROP TABLE {name}",
+    ]
+
+
+def create_memory_partition(db: Session, memory_id: int) -> None:
+    """
+    Move records of a memory from the default partition to a partition of
+    its own. Records are copied to a standalone table first, so its indexes
+    are built once on attach instead of being updated row by row.
+
+    It runs in a single transaction, which has to be done during a
+    maintenance window: the copied records are locked against writes while
+    they are moved, and ATTACH locks the default partition against reads
+    and writes of all memories while it scans it for records of the memory.
+    Copying in batches would not help, changes of copied records made
+    before the final move would be lost.
+    """
+    for statement in create_partition_sql(memory_id):
+        db.execute(text(statement))
+    db.commit()
+
+
+def merge_memory_partition(db: Session, memory_id: int) -> None:
+    """
+    Move records of a memory back to the default partition. Records of the
+    memory cannot be searched until it is done, see create_memory_partition().
+    """
+    for statement in merge_partition_sql(memory_id):
+        db.execute(text(statement))
+    db.commit()
+
+
+def drop_memory_partition(db: Session, memory_id: int) -> None:
+    """Drop a partition of a memory if it has one, with all its records."""
+    db.execute(text(f"DROP TABLE IF EXISTS {partition_name(memory_id)}"))
+    db.commit()
@@ -1,22 +1,65 @@
 import datetime
-from typing import Iterable
+from itertools import batched
+from typing import Iterable, Sequence
 
-from sqlalchemy import func, select, text
+from sqlalchemy import Row, bindparam, func, insert, select, update
 from sqlalchemy.orm import Session
 
-from app.translation_memory import schema
+from app.base.query import count_rows
+from app.base.schema import CountMode
+from app.formats.tmx import TmxSegment
+from app.records import suggestions_cache
+from app.settings import settings
+from app.translation_memory import embeddings, schema, trigram_index, vector_index
+from app.translation_memory.matcher import RecordMatch, get_matcher
+from app.translation_memory.partitions import drop_memory_partition
+from app.translation_memory.tasks import enqueue_memory_task
+from app.translation_memory.utils import source_hash
 
 from .models import TranslationMemory, TranslationMemoryRecord
 
+# Records merged by a single lookup and write
+TM_WRITE_BATCH = 500
+
+
+def naive_utc(value: datetime.datetime | None) -> datetime.datetime | None:
+    """Convert a date to naive UTC, as dates of records are stored."""
+    if value is None or value.tzinfo is None:
+        return value
+    return value.astimezone(datetime.UTC).replace(tzinfo=None)
+
+
+def substitutions_by_record(
+    record_ids: Iterable[int], rows: Iterable[Row | RecordMatch]
+) -> dict[int, list[schema.MemorySubstitution]]:
+    """Group rows of record matches into substitutions of every record."""
+    output: dict[int, list[schema.MemorySubstitution]] = {
+        record_id: [] for record_id in record_ids
+    }
+    for row in rows:
+        output[row.record_id].append(
+            schema.MemorySubstitution(
+                source=row.source, target=row.target, similarity=row.similarity
+            )
+        )
+    return output
+
 
 class TranslationMemoryQuery:
     def __init__(self, db: Session) -> None:
         self.__db = db
+        self.__matcher = get_matcher(db)
 
-    def get_memories(self) -> Iterable[TranslationMemory]:
-        return self.__db.execute(
-            select(TranslationMemory).order_by(TranslationMemory.id)
-        ).scalars()
+    def get_memories(
+        self, language_pair: tuple[str, str] | None = None
+    ) -> Iterable[TranslationMemory]:
+        stmt = select(TranslationMemory).order_by(TranslationMemory.id)
+        if language_pair:
+            stmt = stmt.where(
+                TranslationMemory.source_language == language_pair[0],
+                TranslationMemory.target_language == language_pair[1],
+            )
+        return self.__db.execute(stmt).scalars()
 
     def get_memories_by_id(self, ids: Iterable[int]) -> Iterable[TranslationMemory]:
         return self.__db.execute(
@@ -41,7 +84,37 @@ class TranslationMemoryQuery:
         page: int,
         page_records: int,
         query: str | None,
-    ) -> tuple[list[schema.TranslationMemoryRecord], int]:
+        after_id: int | None = None,
+    ) -> list[schema.TranslationMemoryRecord]:
+        """
+        Get a page of records, or with after_id the records following that
+        record ID, so a page costs the same regardless of its depth.
+        """
+        stmt = self._records_query(memory_ids, query).order_by(
+            TranslationMemoryRecord.id
+        )
+        if after_id is not None:
+            stmt = stmt.filter(TranslationMemoryRecord.id > after_id)
+        else:
+            stmt = stmt.offset(page_records * page)
+
+        return [
+            schema.TranslationMemoryRecord(
+                id=scalar.id, source=scalar.source, target=scalar.target
+            )
+            for scalar in self.__db.execute(stmt.limit(page_records)).scalars()
+        ]
+
+    def count_memory_records(
+        self,
+        memory_ids: int | list[int],
+        query: str | None,
+        mode: CountMode = CountMode.exact,
+    ) -> tuple[int, bool]:
+        """Count records matching a search, see app.base.query.count_rows."""
+        return count_rows(self.__db, self._records_query(memory_ids, query), mode)
+
+    def _records_query(self, memory_ids: int | list[int], query: str | None):
         # Handle both single int and list of ints
         if isinstance(memory_ids, int):
             filters = [TranslationMemoryRecord.document_id == memory_ids]
@@ -50,137 +123,409 @@ class TranslationMemoryQuery:
 
         if query:
             filters.append(TranslationMemoryRecord.source.ilike(f"%{query}%"))
-
-        count = self.__db.execute(
-            select(
-                func.count(TranslationMemoryRecord.id),
-            ).filter(*filters)
-        ).scalar_one()
-
-        return [
-            schema.TranslationMemoryRecord(
-                id=scalar.id, source=scalar.source, target=scalar.target
-            )
-            for scalar in self.__db.execute(
-                select(TranslationMemoryRecord)
-                .filter(*filters)
-                .order_by(TranslationMemoryRecord.id)
-                .offset(page_records * page)
-                .limit(page_records)
-            ).scalars()
-        ], count
+        return select(TranslationMemoryRecord).filter(*filters)
 
     def get_memory_records_paged_similar(
         self,
         memory_ids: int | list[int],
         page_records: int,
         query: str,
+        mode: schema.SimilarityMode = schema.SimilarityMode.trigram,
     ) -> list[schema.TranslationMemoryRecordWithSimilarity]:
-        # Use the same approach as get_substitutions but with different parameters
-        similarity_func = func.similarity(TranslationMemoryRecord.source, query)
-
-        # Set similarity threshold to 0.25 (25%) as required
-        self.__db.execute(
-            text("SET pg_trgm.similarity_threshold TO :threshold"),
-            {"threshold": 0.25},
-        )
-
-        # Handle both single int and list of ints for filtering
         if isinstance(memory_ids, int):
-            filter_condition = TranslationMemoryRecord.document_id == memory_ids
-        else:
-            filter_condition = TranslationMemoryRecord.document_id.in_(memory_ids)
+            memory_ids = [memory_ids]
+        if mode != schema.SimilarityMode.trigram:
+            return self._get_semantically_similar(memory_ids, page_records, query, mode)
 
         return [
             schema.TranslationMemoryRecordWithSimilarity(
-                id=scalar.id,
-                source=scalar.source,
-                target=scalar.target,
-                similarity=scalar.similarity,
-            )
-            for scalar in self.__db.execute(
-                select(
-                    TranslationMemoryRecord.id,
-                    TranslationMemoryRecord.source,
-                    TranslationMemoryRecord.target,
-                    similarity_func,
-                )
-                .filter(
-                    filter_condition,
-                    TranslationMemoryRecord.source.op("%")(query),
-                )
-                .order_by(similarity_func.desc())
-                .limit(page_records)
-            ).all()
+                id=match.id,
+                source=match.source,
+                target=match.target,
+                similarity=match.similarity,
+            )
+            for match in self.__matcher.search(query, memory_ids, 0.25, page_records)
         ]
 
-    def get_substitutions(
+    def _get_semantically_similar(
         self,
-        source: str,
-        tm_ids: list[int],
-        threshold: float = 0.75,
-        count: int = 10,
-    ) -> list[schema.MemorySubstitution]:
-        similarity_func = func.similarity(TranslationMemoryRecord.source, source)
-        self.__db.execute(
-            text("SET pg_trgm.similarity_threshold TO :threshold"),
-            {"threshold": threshold},
-        )
+        memory_ids: list[int],
+        count: int,
+        query: str,
+        mode: schema.SimilarityMode,
+    ) -> list[schema.TranslationMemoryRecordWithSimilarity]:
+        """
+        Find records by cosine similarity of source embeddings. Hybrid mode
+        adds trigram matches to the candidates and scores all of them by
+        the weighted sum of both similarities.
+        """
+        provider = embeddings.get_provider()
+        query_vector = provider.embed([query])[0]
+        cosines = {
+            record_id: score
+            for score, record_id in vector_index.search(
+                self.__db, memory_ids, query_vector, count
+            )
+        }
+        candidate_ids = set(cosines)
+        if mode == schema.SimilarityMode.hybrid:
+            candidate_ids.update(
+                match.id
+                for match in self.__matcher.search(query, memory_ids, 0.25, count)
+            )
         records = self.__db.execute(
             select(
+                TranslationMemoryRecord.id,
                 TranslationMemoryRecord.source,
                 TranslationMemoryRecord.target,
-                similarity_func,
+            ).filter(
+                TranslationMemoryRecord.document_id.in_(memory_ids),
+                TranslationMemoryRecord.id.in_(candidate_ids),
             )
-            .filter(
-                TranslationMemoryRecord.source.op("%")(source),
+        ).all()
+
+        if mode == schema.SimilarityMode.hybrid:
+            # trigram matches missed by the vector search
+            missing = [record for record in records if record.id not in cosines]
+            for record, vector in zip(
+                missing, provider.embed([record.source for record in missing])
+            ):
+                cosines[record.id] = embeddings.dot(query_vector, vector)
+            grams = trigram_index.trigrams(query)
+            weight = settings.semantic_search_weight
+            scores = {
+                record.id: weight * max(cosines[record.id], 0.0)
+                + (1 - weight)
+                * trigram_index.similarity(grams, trigram_index.trigrams(record.source))
+                for record in records
+            }
+        else:
+            scores = cosines
+
+        found = [
+            schema.TranslationMemoryRecordWithSimilarity(
+                id=record.id,
+                source=record.source,
+                target=record.target,
+                similarity=scores[record.id],
+            )
+            for record in records
+            if scores[record.id] > 0
+        ]
+        found.sort(key=lambda record: (-record.similarity, record.id))
+        return found[:count]
+
+    def get_exact_sources(self, sources: list[str], tm_ids: list[int]) -> set[str]:
+        """Get the sources memories have records of, by the source hash index."""
+        if not sources or not tm_ids:
+            return set()
+        wanted = set(sources)
+        found = self.__db.execute(
+            select(TranslationMemoryRecord.source).filter(
                 TranslationMemoryRecord.document_id.in_(tm_ids),
+                TranslationMemoryRecord.source_hash.in_(
+                    {source_hash(source) for source in wanted}
+                ),
             )
-            .order_by(similarity_func.desc())
-            .limit(count),
-        ).all()
+        ).scalars()
+        # equal hashes of different sources are not exact matches
+        return wanted.intersection(found)
 
+    def get_substitutions(
+        self,
+        source: str,
+        tm_ids: list[int],
+        threshold: float = 0.75,
+        count: int = 10,
+    ) -> list[schema.MemorySubstitution]:
         return [
             schema.MemorySubstitution(
-                source=record.source, target=record.target, similarity=record.similarity
+                source=match.source, target=match.target, similarity=match.similarity
             )
-            for record in records
+            for match in self.__matcher.search(source, tm_ids, threshold, count)
         ]
 
+    def get_substitutions_for_records(
+        self,
+        record_ids: list[int],
+        tm_ids: list[int],
+        threshold: float = 0.75,
+        count: int = 10,
+    ) -> dict[int, list[schema.MemorySubstitution]]:
+        return substitutions_by_record(
+            record_ids,
+            self.get_matches_for_records(record_ids, tm_ids, threshold, count),
+        )
+
+    def get_matches_for_records(
+        self,
+        record_ids: list[int],
+        tm_ids: list[int],
+        threshold: float,
+        count: int,
+    ) -> Sequence[RecordMatch]:
+        """
+        Get the most similar TM records for several document records at once,
+        ordered the same way as get_substitutions().
+        """
+        return self.__matcher.search_records(record_ids, tm_ids, threshold, count)
+
+    def get_new_record_ids(
+        self, tm_ids: list[int], since: datetime.datetime, limit: int
+    ) -> list[int]:
+        return list(
+            self.__db.execute(
+                select(TranslationMemoryRecord.id)
+                .filter(
+                    TranslationMemoryRecord.document_id.in_(tm_ids),
+                    TranslationMemoryRecord.creation_date > since,
+                )
+                .limit(limit)
+            ).scalars()
+        )
+
+    def get_similar_records_for_records(
+        self,
+        record_ids: list[int],
+        tm_ids: list[int],
+        tm_record_ids: list[int],
+        threshold: float,
+    ) -> Sequence[RecordMatch]:
+        """
+        Score given TM records against document records directly, without
+        the index. Meant for a handful of TM records, rows have the same shape
+        as get_matches_for_records() returns.
+        """
+        return self.__matcher.score_records(
+            record_ids, tm_ids, tm_record_ids, threshold
+        )
+
     def add_memory(
-        self, name: str, created_by: int, records: list[TranslationMemoryRecord]
+        self,
+        name: str,
+        created_by: int,
+        records: list[TranslationMemoryRecord],
+        source_language: str = "en",
+        target_language: str = "ru",
     ) -> TranslationMemory:
-        doc = TranslationMemory(name=name, created_by=created_by, records=records)
+        doc = TranslationMemory(
+            name=name,
+            created_by=created_by,
+            records=records,
+            source_language=source_language,
+            target_language=target_language,
+        )
         self.__db.add(doc)
         self.__db.commit()
+        suggestions_cache.invalidate_memories()
         return doc
 
     def delete_memory(self, memory: TranslationMemory):
+        memory_id = memory.id
         self.__db.delete(memory)
         self.__db.commit()
+        if self.__db.get_bind().dialect.name == "postgresql":
+            drop_memory_partition(self.__db, memory_id)
+        trigram_index.remove(memory_id)
+        vector_index.remove(memory_id)
+        suggestions_cache.invalidate_memories()
+
+    def enqueue_index_build(self, memory_id: int):
+        enqueue_memory_task(
+            self.__db,
+            memory_id,
+            schema.BuildTmIndexTaskData(task_type="build_tm_index"),
+        )
+
+    def enqueue_embeddings_build(self, memory_id: int):
+        enqueue_memory_task(
+            self.__db,
+            memory_id,
+            schema.BuildTmEmbeddingsTaskData(task_type="build_tm_embeddings"),
+        )
 
     def add_or_update_record(self, document_id: int, source: str, target: str):
-        record = self.__db.execute(
-            select(TranslationMemoryRecord)
+        self.upsert_records(document_id, [(source, target)])
+
+    def upsert_records(
+        self, document_id: int, records: Iterable[tuple[str, str]]
+    ) -> None:
+        """
+        Add (source, target) records to a memory. A record of the source with
+        the same target, or else the last changed one, is updated instead.
+        The last target of a repeated source wins.
+        """
+        targets = dict(records)
+        if not targets:
+            return
+
+        now = datetime.datetime.now(datetime.UTC).replace(tzinfo=None)
+        self._lock_memory(document_id)
+        for batch in batched(targets.items(), TM_WRITE_BATCH):
+            existing = self._get_records_by_source(
+                document_id, [source for source, _ in batch]
+            )
+            inserts, updates = [], []
+            for source, target in batch:
+                variants = existing.get(source, [])
+                record = next(
+                    (record for record in variants if record.target == target),
+                    variants[0] if variants else None,
+                )
+                if record is None:
+                    inserts.append(
+                        self._new_record(document_id, source, target, now, now)
+                    )
+                else:
+                    updates.append(self._changed_record(record.id, target, now))
+            self._write(document_id, inserts, updates)
+
+        self.__db.commit()
+        suggestions_cache.invalidate_memories()
+
+    def merge_records(
+        self,
+        document_id: int,
+        segments: Iterable[TmxSegment],
+        deduplication: schema.TmxDeduplication = schema.TmxDeduplication.newest,
+    ) -> schema.TmxImportResult:
+        """
+        Merge imported segments into a memory.
+
+        With newest deduplication segments with new sources are inserted, the
+        ones changed later than the last changed record of the source with
+        another target update it, the rest are skipped. Sources must be
+        unique. With all_variants segments are inserted unless the memory has
+        a record of the same source and target, which must be unique.
+        """
+        result = schema.TmxImportResult(inserted=0, updated=0, skipped=0)
+        now = datetime.datetime.now(datetime.UTC).replace(tzinfo=None)
+        self._lock_memory(document_id)
+        for batch in batched(segments, TM_WRITE_BATCH):
+            existing = self._get_records_by_source(
+                document_id, [segment.original for segment in batch]
+            )
+            inserts, updates = [], []
+            for segment in batch:
+                change_date = naive_utc(segment.change_date) or now
+                variants = existing.get(segment.original, [])
+                if deduplication == schema.TmxDeduplication.all_variants:
+                    record = None
+                    if any(
+                        variant.target == segment.translation for variant in variants
+                    ):
+                        result.skipped += 1
+                        continue
+                else:
+                    record = variants[0] if variants else None
+                    if record is not None and (
+                        record.target == segment.translation
+                        or change_date < naive_utc(record.change_date)
+                    ):
+                        result.skipped += 1
+                        continue
+
+                if record is None:
+                    result.inserted += 1
+                    inserts.append(
+                        self._new_record(
+                            document_id,
+                            segment.original,
+                            segment.translation,
+                            naive_utc(segment.creation_date) or now,
+                            change_date,
+                        )
+                    )
+                else:
+                    result.updated += 1
+                    updates.append(
+                        self._changed_record(
+                            record.id, segment.translation, change_date
+                        )
+                    )
+            self._write(document_id, inserts, updates)
+
+        self.__db.commit()
+        suggestions_cache.invalidate_memories()
+        return result
+
+    def _lock_memory(self, document_id: int) -> None:
+        """
+        Serialize writes to a memory until the transaction ends, so concurrent
+        ones do not both insert a new source.
+        """
+        if self.__db.get_bind().dialect.name == "postgresql":
+            self.__db.execute(select(func.pg_advisory_xact_lock(document_id)))
+
+    def _get_records_by_source(
+        self, document_id: int, sources: list[str]
+    ) -> dict[str, list[Row]]:
+        """Get records of sources by the source hash index, last changed first."""
+        output: dict[str, list[Row]] = {}
+        rows = self.__db.execute(
+            select(
+                TranslationMemoryRecord.id,
+                TranslationMemoryRecord.source,
+                TranslationMemoryRecord.target,
+                TranslationMemoryRecord.change_date,
+            )
             .where(
                 TranslationMemoryRecord.document_id == document_id,
-                TranslationMemoryRecord.source == source,
+                TranslationMemoryRecord.source_hash.in_(
+                    {source_hash(source) for source in sources}
+                ),
             )
-            .order_by(TranslationMemoryRecord.id.desc()),
-        ).scalar_one_or_none()
+            .order_by(
+                TranslationMemoryRecord.change_date.desc(),
+                TranslationMemoryRecord.id.desc(),
+            )
+        )
+        for row in rows:
+            output.setdefault(row.source, []).append(row)
+        return output
+
+    @staticmethod
+    def _new_record(
+        document_id: int,
+        source: str,
+        target: str,
+        creation_date: datetime.datetime,
+        change_date: datetime.datetime,
+    ) -> dict:
+        return {
+            "document_id": document_id,
+            "source": source,
+            "source_hash": source_hash(source),
+            "target": target,
+            "creation_date": creation_date,
+            "change_date": change_date,
+        }
+
+    @staticmethod
+    def _changed_record(
+        record_id: int, target: str, change_date: datetime.datetime
+    ) -> dict:
+        return {
+            "record_id": record_id,
+            "new_target": target,
+            "new_change_date": change_date,
+        }
 
-        if not record:
-            self.__db.add(
-                TranslationMemoryRecord(
-                    document_id=document_id,
-                    source=source,
-                    target=target,
-                    creation_date=datetime.datetime.now(datetime.UTC),
-                    change_date=datetime.datetime.now(datetime.UTC),
+    def _write(self, document_id: int, inserts: list[dict], updates: list[dict]):
+        if inserts:
+            self.__db.execute(insert(TranslationMemoryRecord.__table__), inserts)
+        if updates:
+            table = TranslationMemoryRecord.__table__
+            self.__db.execute(
+                update(table)
+                # the memory prunes partitions of other memories
+                .where(
+                    table.c.document_id == document_id,
+                    table.c.id == bindparam("record_id"),
                 )
+                .values(
+                    target=bindparam("new_target"),
+                    change_date=bindparam("new_change_date"),
+                ),
+                updates,
             )
-        else:
-            record.target = target
-            record.change_date = datetime.datetime.now(datetime.UTC)
-
-        self.__db.commit()
@@ -1,6 +1,9 @@
+from enum import Enum
+from typing import Literal
+
 from pydantic import BaseModel, ConfigDict, Field
 
-from app.base.schema import Identified
+from app.base.schema import Identified, LanguageCode
 
 
 class MemorySubstitution(BaseModel):
@@ -12,6 +15,8 @@ class MemorySubstitution(BaseModel):
 class TranslationMemory(Identified):
     name: str
     created_by: int
+    source_language: str
+    target_language: str
 
     model_config = ConfigDict(from_attributes=True)
 
@@ -27,8 +32,11 @@ class TranslationMemoryRecord(Identified):
 
 class TranslationMemoryListResponse(BaseModel):
     records: list[TranslationMemoryRecord]
-    page: int
+    page: int | None
     total_records: int
+    # total_records is estimated or capped, see CountMode
+    total_is_estimate: bool = False
+    next_after_id: int | None = None
 
 
 class TranslationMemoryRecordWithSimilarity(TranslationMemoryRecord):
@@ -41,5 +49,43 @@ class TranslationMemoryListSimilarResponse(BaseModel):
     total_records: int
 
 
+class SimilarityMode(Enum):
+    # pg_trgm similarity of sources
+    trigram = "trigram"
+    # cosine similarity of source embeddings
+    semantic = "semantic"
+    # weighted sum of both, see settings.semantic_search_weight
+    hybrid = "hybrid"
+
+
 class TranslationMemoryCreationSettings(BaseModel):
     name: str = Field(min_length=1)
+    source_language: LanguageCode = "en"
+    target_language: LanguageCode = "ru"
+
+
+class TmxDeduplication(Enum):
+    # the newest segment of sources equal after normalization
+    newest = "newest"
+    # every variant and translation of a source, only segments with the same
+    # source and target are dropped
+    all_variants = "all_variants"
+
+
+class TmxImportResult(BaseModel):
+    inserted: int
+    updated: int
+    skipped: int
+
+
+class BuildTmIndexTaskData(BaseModel):
+    task_type: Literal["build_tm_index"]
+
+
+class BuildTmEmbeddingsTaskData(BaseModel):
+    task_type: Literal["build_tm_embeddings"]
+
+
+class MemoryTaskDescription(BaseModel):
+    memory_id: int
+    task_data: BuildTmIndexTaskData | BuildTmEmbeddingsTaskData
@@ -0,0 +1,29 @@
+from sqlalchemy import select
+from sqlalchemy.orm import Session
+
+from app.models import TaskStatus
+from app.schema import DocumentTask
+from app.translation_memory import schema
+
+
+def enqueue_memory_task(
+    db: Session,
+    memory_id: int,
+    task_data: schema.BuildTmIndexTaskData | schema.BuildTmEmbeddingsTaskData,
+) -> None:
+    """
+    Add a worker task of a memory unless the same task is pending already,
+    it reads the memory when it is started.
+    """
+    data = schema.MemoryTaskDescription(
+        memory_id=memory_id, task_data=task_data
+    ).model_dump_json()
+    pending = db.execute(
+        select(DocumentTask.id).filter(
+            DocumentTask.data == data,
+            DocumentTask.status == TaskStatus.PENDING.value,
+        )
+    ).first()
+    if pending is None:
+        db.add(DocumentTask(data=data, status=TaskStatus.PENDING.value))
+        db.commit()
@@ -0,0 +1,320 @@
+"""
+In-process character trigram index of translation memory sources, an
+alternative to pg_trgm that works on any database.
+
+Trigrams and similarity follow pg_trgm: words of alphanumeric characters
+are lowercased and padded with two spaces before and one after, similarity
+is the number of shared trigrams divided by the number of trigrams in
+either string.
+
+An index maps every trigram to a sorted list of record positions. Search
+generates candidates by count filtering: a record with similarity of at
+least t to a query of q trigrams shares at least ceil(t * q) of them, so it
+is in the posting list of one of the q - ceil(t * q) + 1 rarest ones. Only
+those lists are scanned, shared trigrams of the candidates are then counted
+exactly by binary search in the others.
+
+Indexes are kept in files, see app.translation_memory.index_files.
+"""
+
+import math
+import os
+import re
+import struct
+import threading
+from array import array
+from bisect import bisect_left
+from collections import defaultdict
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass
+from heapq import nlargest
+from multiprocessing import get_context
+from typing import Iterable, Sequence
+
+from sqlalchemy import select
+from sqlalchemy.orm import Session
+
+from app.settings import settings
+from app.translation_memory import schema
+from app.translation_memory.index_files import (
+    IndexFileReader,
+    IndexFiles,
+    modified_at,
+    write_index_file,
+)
+from app.translation_memory.models import TranslationMemoryRecord
+
+MAGIC = b"HATTRGM2"
+# tolerance of float comparisons with thresholds
+EPSILON = 1e-9
+# queries searched by a process at least, smaller batches are not split
+PARALLEL_MIN_QUERIES = 50
+
+WORD_RE = re.compile(r"[^\W_]+")
+
+
+def trigrams(text: str) -> frozenset[str]:
+    """Get the set of trigrams of a string, as pg_trgm show_trgm() does."""
+    output = set()
+    for word in WORD_RE.findall(text.lower()):
+        padded = f"  {word} "
+        output.update(padded[i : i + 3] for i in range(len(padded) - 2))
+    return frozenset(output)
+
+
+def float4(value: float) -> float:
+    """Round to single precision, pg_trgm computes similarity in it."""
+    return struct.unpack("f", struct.pack("f", value))[0]
+
+
+def similarity(first: frozenset[str], second: frozenset[str]) -> float:
+    """Get pg_trgm similarity of two trigram sets."""
+    if not first or not second:
+        return 0.0
+    shared = len(first & second)
+    return float4(shared / (len(first) + len(second) - shared))
+
+
+@dataclass
+class TrigramIndex:
+    # record ID and trigram count of every position
+    ids: Sequence[int]
+    sizes: Sequence[int]
+    # trigram -> (start, length) of its postings in positions
+    offsets: dict[str, tuple[int, int]]
+    positions: Sequence[int]
+    # records with greater IDs were added after the index was built
+    max_record_id: int
+
+    @classmethod
+    def build(cls, rows: Iterable[tuple[int, str]]) -> "TrigramIndex":
+        """Build an index of (record ID, source) rows ordered by ID."""
+        ids = array("q")
+        sizes = array("I")
+        postings: dict[str, array] = defaultdict(lambda: array("I"))
+        for position, (record_id, source) in enumerate(rows):
+            grams = trigrams(source)
+            ids.append(record_id)
+            sizes.append(len(grams))
+            for gram in grams:
+                postings[gram].append(position)
+
+        offsets = {}
+        positions = array("I")
+        for gram, posting in postings.items():
+            offsets[gram] = (len(positions), len(posting))
+            positions.extend(posting)
+        # slices of memory views are not copied
+        return cls(ids, sizes, offsets, memoryview(positions), ids[-1] if ids else 0)
+
+    @classmethod
+    def build_for_memory(cls, db: Session, memory_id: int) -> "TrigramIndex":
+        rows = db.execute(
+            select(TranslationMemoryRecord.id, TranslationMemoryRecord.source)
+            .filter(TranslationMemoryRecord.document_id == memory_id)
+            .order_by(TranslationMemoryRecord.id)
+            .execution_options(yield_per=10000)
+        )
+        return cls.build((row.id, row.source) for row in rows)
+
+    def save(self, path: str) -> None:
+        """Write the index to a file, replacing it atomically."""
+        write_index_file(
+            path,
+            MAGIC,
+            {
+                "records": len(self.ids),
+                "postings": len(self.positions),
+                "max_record_id": self.max_record_id,
+                "offsets": self.offsets,
+            },
+            (self.ids, self.sizes, self.positions),
+        )
+
+    @classmethod
+    def load(cls, path: str) -> "TrigramIndex":
+        """Memory-map an index file written by save()."""
+        reader = IndexFileReader(path, MAGIC)
+        header = reader.header
+        ids = reader.take("q", header["records"])
+        sizes = reader.take("I", header["records"])
+        positions = reader.take("I", header["postings"])
+        offsets = {gram: tuple(value) for gram, value in header["offsets"].items()}
+        return cls(ids, sizes, offsets, positions, header["max_record_id"])
+
+    def postings(self, gram: str) -> Sequence[int]:
+        offset = self.offsets.get(gram)
+        if offset is None:
+            return ()
+        start, length = offset
+        return self.positions[start : start + length]
+
+    def search(
+        self, grams: frozenset[str], threshold: float, count: int
+    ) -> list[tuple[float, int]]:
+        """
+        Find records similar to a query.
+
+        Args:
+            grams: Trigrams of the query
+            threshold: Minimal similarity of records
+            count: Maximal number of records
+
+        Returns:
+            (similarity, record ID) of the most similar records, ties are
+            ordered by ID
+        """
+        return self.search_many([grams], threshold, count)[0]
+
+    def search_many(
+        self, queries: Sequence[frozenset[str]], threshold: float, count: int
+    ) -> list[list[tuple[float, int]]]:
+        """
+        Find records similar to every query of a batch, see search(). Every
+        posting list is scanned once for the whole batch, segments of
+        a document share most of their frequent trigrams.
+        """
+        # query index -> (trigram count, minimal overlap, postings to verify)
+        plans: dict[int, tuple[int, int, list[Sequence[int]]]] = {}
+        # trigram -> indexes of queries generating candidates from it
+        scans: dict[str, list[int]] = defaultdict(list)
+        for query_index, grams in enumerate(queries):
+            size = len(grams)
+            if not size or count <= 0:
+                continue
+            overlap = max(1, math.ceil(threshold * size - EPSILON))
+            ordered = sorted(grams, key=lambda gram: self.offsets.get(gram, (0, 0))[1])
+            prefix = size - overlap + 1
+            for gram in ordered[:prefix]:
+                scans[gram].append(query_index)
+            plans[query_index] = (
+                size,
+                overlap,
+                [self.postings(gram) for gram in ordered[prefix:]],
+            )
+
+        shared_counts: dict[int, dict[int, int]] = {
+            query_index: defaultdict(int) for query_index in plans
+        }
+        for gram, query_indexes in scans.items():
+            targets = [shared_counts[query_index] for query_index in query_indexes]
+            for position in self.postings(gram):
+                for counts in targets:
+                    counts[position] += 1
+
+        output: list[list[tuple[float, int]]] = [[] for _ in queries]
+        for query_index, (size, overlap, rest) in plans.items():
+            found = []
+            for position, shared in shared_counts[query_index].items():
+                record_size = self.sizes[position]
+                # similarity is at most the ratio of trigram counts
+                if (
+                    min(size, record_size)
+                    < threshold * max(size, record_size) - EPSILON
+                ):
+                    continue
+                if shared + len(rest) < overlap:
+                    continue
+                for posting in rest:
+                    index = bisect_left(posting, position)
+                    if index < len(posting) and posting[index] == position:
+                        shared += 1
+                score = float4(shared / (size + record_size - shared))
+                if score >= threshold - EPSILON:
+                    found.append((score, self.ids[position]))
+            output[query_index] = top(found, count)
+        return output
+
+
+def top(found: Iterable[tuple[float, int]], count: int) -> list[tuple[float, int]]:
+    """Get the most similar (similarity, record ID) items, ties by ID."""
+    return nlargest(count, found, key=lambda item: (item[0], -item[1]))
+
+
+class TrigramIndexFiles(IndexFiles[TrigramIndex]):
+    suffix = ".trgm"
+    kind = "trigram"
+
+    def load(self, path: str) -> TrigramIndex:
+        return TrigramIndex.load(path)
+
+    def build(self, db: Session, memory_id: int) -> TrigramIndex:
+        return TrigramIndex.build_for_memory(db, memory_id)
+
+    def write(self, db: Session, memory_id: int, path: str) -> None:
+        TrigramIndex.build_for_memory(db, memory_id).save(path)
+
+    def empty(self) -> TrigramIndex:
+        return TrigramIndex.build(())
+
+    def task_data(self) -> schema.BuildTmIndexTaskData:
+        return schema.BuildTmIndexTaskData(task_type="build_tm_index")
+
+
+_index_files = TrigramIndexFiles()
+index_path = _index_files.path
+get_index = _index_files.get
+is_in_process = _index_files.is_in_process
+build_index_file = _index_files.build_file
+forget = _index_files.forget
+remove = _index_files.remove
+clear = _index_files.clear
+
+_lock = threading.Lock()
+# index files mapped by pool processes, path -> (modification time, index)
+_files: dict[str, tuple[float, TrigramIndex]] = {}
+_pool: ProcessPoolExecutor | None = None
+
+
+def search_many(
+    index: TrigramIndex,
+    memory_id: int,
+    queries: Sequence[frozenset[str]],
+    threshold: float,
+    count: int,
+) -> list[list[tuple[float, int]]]:
+    """
+    Search the index of a memory got by get_index() for a batch of queries,
+    see TrigramIndex.search_many(). Large batches are split between
+    settings.tm_search_processes processes if the index has a file.
+    """
+    path = index_path(memory_id)
+    processes = min(settings.tm_search_processes, len(queries) // PARALLEL_MIN_QUERIES)
+    if processes < 2 or modified_at(path) is None:
+        return index.search_many(queries, threshold, count)
+
+    size = math.ceil(len(queries) / processes)
+    chunks = [queries[i : i + size] for i in range(0, len(queries), size)]
+    output: list[list[tuple[float, int]]] = []
+    for found in _get_pool().map(
+        _search_file,
+        [path] * len(chunks),
+        chunks,
+        [threshold] * len(chunks),
+        [count] * len(chunks),
+    ):
+        output.extend(found)
+    return output
+
+
+def _get_pool() -> ProcessPoolExecutor:
+    global _pool
+    with _lock:
+        if _pool is None:
+            # forked processes would share database connections of the parent
+            _pool = ProcessPoolExecutor(
+                settings.tm_search_processes, mp_context=get_context("spawn")
+            )
+        return _pool
+
+
+def _search_file(
+    path: str, queries: Sequence[frozenset[str]], threshold: float, count: int
+) -> list[list[tuple[float, int]]]:
+    # runs in pool processes, they keep their own mappings of index files
+    file_modified_at = os.stat(path).st_mtime
+    cached = _files.get(path)
+    if cached is None or cached[0] != file_modified_at:
+        cached = (file_modified_at, TrigramIndex.load(path))
+        _files[path] = cached
+    return cached[1].search_many(queries, threshold, count)
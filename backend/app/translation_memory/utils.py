@@ -0,0 +1,26 @@
+import hashlib
+import unicodedata
+
+
+def source_hash(source: str) -> str:
+    """
+    Compute a hash of a TM record source for exact lookups by an index.
+
+    It is the same as md5() of PostgreSQL, so hashes can be computed by the
+    database too.
+
+    Args:
+        source: Record source text
+
+    Returns:
+        Hex digest of the source
+    """
+    return hashlib.md5(source.encode("utf-8")).hexdigest()
+
+
+def normalize_source(source: str) -> str:
+    """
+    Normalize a source to find variants of the same segment, which differ in
+    Unicode composition or whitespace only.
+    """
+    return " ".join(unicodedata.normalize("NFC", source).split())
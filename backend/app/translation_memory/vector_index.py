@@ -0,0 +1,428 @@
+"""
+In-process IVF index of translation memory source embeddings for semantic
+search, see app.translation_memory.embeddings.
+
+Vectors are clustered around centroids sampled from the memory and refined
+by a k-means pass over the sample, every cluster is a contiguous list of
+vectors. Builds embed a memory in batches and spool the vectors to a
+temporary file, which is copied to the index file grouped by list, so the
+worker does not hold every vector of a large memory.
+
+Search scores the centroids, then only the vectors of the
+settings.tm_vector_probes nearest lists, so it is approximate for memories
+large enough to have several lists.
+
+Indexes are kept in files, see app.translation_memory.index_files. A file
+of another embedding provider is not used.
+"""
+
+import logging
+import math
+import os
+import random
+import tempfile
+from array import array
+from collections.abc import Buffer
+from dataclasses import dataclass, field
+from itertools import batched, chain
+from typing import BinaryIO, Iterable, Iterator, Sequence
+
+from sqlalchemy import select
+from sqlalchemy.orm import Session
+
+from app.settings import settings
+from app.translation_memory import embeddings, schema
+from app.translation_memory.embeddings import Vector, dot
+from app.translation_memory.index_files import (
+    IndexFileReader,
+    IndexFiles,
+    write_index_file,
+)
+from app.translation_memory.models import TranslationMemoryRecord
+from app.translation_memory.trigram_index import top
+
+MAGIC = b"HATVEC02"
+# records embedded by a single provider call while building
+EMBED_BATCH = 1000
+# memories smaller than this have a single list and are searched exactly
+MIN_RECORDS_PER_LIST = 1000
+# training vectors of k-means per list
+TRAIN_PER_LIST = 32
+
+
+def _nearest(vector: Sequence[float], centroids: list[Vector]) -> int:
+    return max(range(len(centroids)), key=lambda i: dot(vector, centroids[i]))
+
+
+def _list_count(records: int) -> int:
+    return max(1, min(records // MIN_RECORDS_PER_LIST, math.isqrt(records)))
+
+
+def _sample_positions(records: int, lists: int) -> list[int]:
+    """Get random positions of training vectors, the first ones are centroids."""
+    size = lists * TRAIN_PER_LIST if lists > 1 else lists
+    return random.Random(0).sample(range(records), min(records, size))
+
+
+def _train(sample: list[Vector], lists: int) -> list[Vector]:
+    """Get centroids of lists refined by a k-means pass over the sample."""
+    centroids = sample[:lists]
+    if lists > 1:
+        sums = [[0.0] * len(centroid) for centroid in centroids]
+        for vector in sample:
+            total = sums[_nearest(vector, centroids)]
+            for i, value in enumerate(vector):
+                total[i] += value
+        centroids = [
+            embeddings.normalize(total) if any(total) else centroid
+            for total, centroid in zip(sums, centroids)
+        ]
+    return centroids
+
+
+def _group(
+    rows: Iterable[tuple[int, Vector]], centroids: list[Vector], spool: BinaryIO
+) -> tuple[array, array, array]:
+    """
+    Assign (record ID, vector) rows to lists, writing vectors to a spool file.
+
+    Returns:
+        Record IDs and spool positions of rows grouped by list, starts of lists
+    """
+    spooled_ids = array("q")
+    assigned = array("I")
+    for record_id, vector in rows:
+        spooled_ids.append(record_id)
+        assigned.append(_nearest(vector, centroids) if len(centroids) > 1 else 0)
+        spool.write(array("f", vector))
+    spool.flush()
+
+    starts = array("I", [0])
+    counts = [0] * len(centroids)
+    for i in assigned:
+        counts[i] += 1
+    for count in counts:
+        starts.append(starts[-1] + count)
+    free = list(starts[:-1])
+    positions = array("q", bytes(8 * len(assigned)))
+    for position, i in enumerate(assigned):
+        positions[free[i]] = position
+        free[i] += 1
+    return array("q", (spooled_ids[p] for p in positions)), positions, starts
+
+
+def _read_vectors(
+    spool: BinaryIO, positions: Sequence[int], dimension: int
+) -> Iterator[bytes]:
+    size = dimension * 4
+    for position in positions:
+        yield os.pread(spool.fileno(), size, position * size)
+
+
+def _embed_memory(
+    db: Session, memory_id: int
+) -> tuple[list[Vector], Iterator[tuple[int, Vector]]]:
+    """
+    Embed records of a memory in two passes: a random sample trains
+    centroids, then all records are embedded in batches.
+
+    Returns:
+        Centroids and (record ID, vector) rows ordered by ID
+    """
+    provider = embeddings.get_provider()
+    record_ids = array(
+        "q",
+        db.scalars(
+            select(TranslationMemoryRecord.id).filter(
+                TranslationMemoryRecord.document_id == memory_id
+            )
+        ),
+    )
+    lists = _list_count(len(record_ids))
+    sample = []
+    for batch in batched(
+        (record_ids[i] for i in _sample_positions(len(record_ids), lists)),
+        EMBED_BATCH,
+    ):
+        sources = dict(
+            db.execute(
+                select(
+                    TranslationMemoryRecord.id, TranslationMemoryRecord.source
+                ).filter(
+                    TranslationMemoryRecord.document_id == memory_id,
+                    TranslationMemoryRecord.id.in_(batch),
+                )
+            ).all()
+        )
+        # records removed meanwhile are skipped
+        sample.extend(provider.embed([sources[i] for i in batch if i in sources]))
+
+    def embed_rows() -> Iterator[tuple[int, Vector]]:
+        rows = db.execute(
+            select(TranslationMemoryRecord.id, TranslationMemoryRecord.source)
+            .filter(TranslationMemoryRecord.document_id == memory_id)
+            .order_by(TranslationMemoryRecord.id)
+            .execution_options(yield_per=EMBED_BATCH)
+        )
+        for batch in batched(rows, EMBED_BATCH):
+            yield from zip(
+                [row.id for row in batch],
+                provider.embed([row.source for row in batch]),
+            )
+
+    return _train(sample, lists), embed_rows()
+
+
+def _flat(centroids: list[Vector]) -> array:
+    flat_centroids = array("f")
+    for centroid in centroids:
+        flat_centroids.extend(centroid)
+    return flat_centroids
+
+
+@dataclass
+class VectorIndex:
+    dimension: int
+    # embedding provider the vectors come from
+    provider: str
+    # record ID of every position, positions are grouped by list
+    ids: Sequence[int]
+    # list i takes positions starts[i] to starts[i + 1]
+    starts: Sequence[int]
+    # flat centroids and vectors, dimension values each
+    centroids: Sequence[float]
+    vectors: Sequence[float]
+    # records with greater IDs were added after the index was built
+    max_record_id: int
+    # record ID -> vector of records added after the build, embedded once by
+    # the process and dropped with the index
+    recent: dict[int, Vector] = field(default_factory=dict)
+
+    @classmethod
+    def build(
+        cls, rows: Sequence[tuple[int, Vector]], dimension: int, provider: str
+    ) -> "VectorIndex":
+        """Build an index of (record ID, normalized vector) rows."""
+        lists = _list_count(len(rows))
+        sample = [rows[i][1] for i in _sample_positions(len(rows), lists)]
+        return cls._build(rows, _train(sample, lists), dimension, provider)
+
+    @classmethod
+    def build_for_memory(cls, db: Session, memory_id: int) -> "VectorIndex":
+        centroids, rows = _embed_memory(db, memory_id)
+        dimension = len(centroids[0]) if centroids else settings.embedding_dimension
+        return cls._build(rows, centroids, dimension, embeddings.provider_key())
+
+    @classmethod
+    def _build(
+        cls,
+        rows: Iterable[tuple[int, Vector]],
+        centroids: list[Vector],
+        dimension: int,
+        provider: str,
+    ) -> "VectorIndex":
+        vectors = array("f")
+        with tempfile.TemporaryFile() as spool:
+            ids, positions, starts = _group(rows, centroids, spool)
+            for data in _read_vectors(spool, positions, dimension):
+                vectors.frombytes(data)
+        return cls(
+            dimension,
+            provider,
+            ids,
+            starts,
+            memoryview(_flat(centroids)),
+            # slices of memory views are not copied
+            memoryview(vectors),
+            max(ids, default=0),
+        )
+
+    def save(self, path: str) -> None:
+        """Write the index to a file, replacing it atomically."""
+        _write(
+            path,
+            self.dimension,
+            self.provider,
+            self.ids,
+            self.starts,
+            (self.centroids, self.vectors),
+        )
+
+    @staticmethod
+    def write_for_memory(db: Session, memory_id: int, path: str) -> None:
+        """
+        Embed a memory into an index file. Vectors are spooled to a temporary
+        file next to it and copied grouped by list, so a large memory is not
+        kept in memory.
+        """
+        centroids, rows = _embed_memory(db, memory_id)
+        dimension = len(centroids[0]) if centroids else settings.embedding_dimension
+        with tempfile.TemporaryFile(dir=os.path.dirname(path)) as spool:
+            ids, positions, starts = _group(rows, centroids, spool)
+            _write(
+                path,
+                dimension,
+                embeddings.provider_key(),
+                ids,
+                starts,
+                chain([_flat(centroids)], _read_vectors(spool, positions, dimension)),
+            )
+
+    @classmethod
+    def load(cls, path: str) -> "VectorIndex":
+        """Memory-map an index file written by save()."""
+        reader = IndexFileReader(path, MAGIC)
+        header = reader.header
+        dimension = header["dimension"]
+        return cls(
+            dimension,
+            header["provider"],
+            reader.take("q", header["records"]),
+            reader.take("I", header["lists"] + 1),
+            reader.take("f", header["lists"] * dimension),
+            reader.take("f", header["records"] * dimension),
+            header["max_record_id"],
+        )
+
+    def vector(self, position: int) -> Sequence[float]:
+        return self.vectors[position * self.dimension : (position + 1) * self.dimension]
+
+    def search(
+        self, query: Sequence[float], count: int, probes: int
+    ) -> list[tuple[float, int]]:
+        """
+        Find records nearest to a query.
+
+        Args:
+            query: Normalized query vector
+            count: Maximal number of records
+            probes: Lists to search, the ones with the nearest centroids
+
+        Returns:
+            (cosine similarity, record ID) of the nearest records, ties are
+            ordered by ID
+        """
+        lists = len(self.starts) - 1
+        if not self.ids or len(query) != self.dimension:
+            return []
+        nearest = sorted(
+            range(lists),
+            key=lambda i: -dot(
+                query, self.centroids[i * self.dimension : (i + 1) * self.dimension]
+            ),
+        )[:probes]
+        return top(
+            (
+                (dot(query, self.vector(position)), self.ids[position])
+                for i in nearest
+                for position in range(self.starts[i], self.starts[i + 1])
+            ),
+            count,
+        )
+
+
+def _write(
+    path: str,
+    dimension: int,
+    provider: str,
+    ids: Sequence[int],
+    starts: Sequence[int],
+    arrays: Iterable[Buffer],
+) -> None:
+    """Write an index file, arrays are centroids and vectors."""
+    write_index_file(
+        path,
+        MAGIC,
+        {
+            "dimension": dimension,
+            "provider": provider,
+            "records": len(ids),
+            "lists": len(starts) - 1,
+            "max_record_id": max(ids, default=0),
+        },
+        chain([ids, starts], arrays),
+    )
+
+
+class VectorIndexFiles(IndexFiles[VectorIndex]):
+    suffix = ".vec"
+    kind = "vector"
+
+    def load(self, path: str) -> VectorIndex | None:
+        index = VectorIndex.load(path)
+        if index.provider != embeddings.provider_key():
+            logging.warning("Vector index %s is built by %s", path, index.provider)
+            return None
+        return index
+
+    def build(self, db: Session, memory_id: int) -> VectorIndex:
+        return VectorIndex.build_for_memory(db, memory_id)
+
+    def write(self, db: Session, memory_id: int, path: str) -> None:
+        VectorIndex.write_for_memory(db, memory_id, path)
+
+    def empty(self) -> VectorIndex:
+        return VectorIndex.build(
+            (), settings.embedding_dimension, embeddings.provider_key()
+        )
+
+    def task_data(self) -> schema.BuildTmEmbeddingsTaskData:
+        return schema.BuildTmEmbeddingsTaskData(task_type="build_tm_embeddings")
+
+
+_index_files = VectorIndexFiles()
+index_path = _index_files.path
+get_index = _index_files.get
+is_in_process = _index_files.is_in_process
+build_index_file = _index_files.build_file
+forget = _index_files.forget
+remove = _index_files.remove
+clear = _index_files.clear
+
+
+def search(
+    db: Session, memory_ids: list[int], query: Vector, count: int
+) -> list[tuple[float, int]]:
+    """
+    Find records of memories nearest to a query vector. Records added after
+    an index was built are scored directly, their vectors are kept with the
+    index. At most settings.tm_index_max_unindexed of them are, an index
+    built in process is rebuilt when there are more, the others are missed
+    until the worker rebuilds the file.
+
+    Returns:
+        (cosine similarity, record ID) of the nearest records
+    """
+    found = []
+    limit = settings.tm_index_max_unindexed
+    for memory_id in memory_ids:
+        index = get_index(db, memory_id)
+        found.extend(index.search(query, count, settings.tm_vector_probes))
+        rows = db.execute(
+            select(TranslationMemoryRecord.id, TranslationMemoryRecord.source)
+            .filter(
+                TranslationMemoryRecord.document_id == memory_id,
+                TranslationMemoryRecord.id > index.max_record_id,
+            )
+            .order_by(TranslationMemoryRecord.id)
+            .limit(limit + 1)
+        ).all()
+        if len(rows) > limit:
+            rows = rows[:limit]
+            if is_in_process(memory_id):
+                forget(memory_id)
+            else:
+                logging.warning(
+                    "Vector index of translation memory %s misses over %s records",
+                    memory_id,
+                    limit,
+                )
+        recent = index.recent
+        missing = [row for row in rows if row.id not in recent]
+        if missing:
+            vectors = embeddings.get_provider().embed([row.source for row in missing])
+            recent = recent | dict(zip((row.id for row in missing), vectors))
+        # vectors of removed records and records over the limit are dropped
+        index.recent = {row.id: recent[row.id] for row in rows}
+        found.extend((dot(query, index.recent[row.id]), row.id) for row in rows)
+    return top(found, count)
@@ -0,0 +1,126 @@
+"""
+Process-wide buffer of segments approved in documents. Approvals are written
+to memories in batches by a background task of the app, when the buffer is
+full or its oldest record waits for tm_write_interval seconds, instead of
+a transaction for every approved segment. Requests only add to the buffer.
+
+Records of a failed write are put back and written again later. Buffered
+records are lost if the process dies before a flush. They stay approved in
+their documents, the flush_approved task writes them again.
+"""
+
+import asyncio
+import logging
+import threading
+import time
+
+from fastapi.concurrency import run_in_threadpool
+from sqlalchemy.orm import Session
+
+from app.db import SessionLocal
+from app.settings import settings
+from app.translation_memory.query import TranslationMemoryQuery
+
+# seconds between checks of the background task whether records are due
+CHECK_INTERVAL = 1.0
+
+# (memory ID, source) -> target, the last approval of a source wins
+_records: dict[tuple[int, str], str] = {}
+_oldest_at: float | None = None
+_lock = threading.Lock()
+
+
+def add(memory_id: int, source: str, target: str) -> None:
+    global _oldest_at
+    with _lock:
+        if not _records:
+            _oldest_at = time.monotonic()
+        _records[(memory_id, source)] = target
+
+
+def take(force: bool = False) -> dict[int, list[tuple[str, str]]]:
+    """
+    Take buffered records grouped by memory ID if they are due to be written,
+    or all of them if forced.
+    """
+    global _oldest_at
+    with _lock:
+        if not _records:
+            return {}
+        if (
+            not force
+            and len(_records) < settings.tm_write_batch_size
+            and _oldest_at is not None
+            and time.monotonic() - _oldest_at < settings.tm_write_interval
+        ):
+            return {}
+        records = dict(_records)
+        _records.clear()
+        _oldest_at = None
+
+    output: dict[int, list[tuple[str, str]]] = {}
+    for (memory_id, source), target in records.items():
+        output.setdefault(memory_id, []).append((source, target))
+    return output
+
+
+def put_back(records: dict[int, list[tuple[str, str]]]) -> None:
+    """Return taken records to the buffer, approvals added since win."""
+    global _oldest_at
+    with _lock:
+        for memory_id, memory_records in records.items():
+            for source, target in memory_records:
+                _records.setdefault((memory_id, source), target)
+        if _records and _oldest_at is None:
+            _oldest_at = time.monotonic()
+
+
+def flush(db: Session, force: bool = False) -> None:
+    """
+    Write buffered records to memories if they are due. Records of memories
+    which are not written are put back if it fails.
+    """
+    records = take(force)
+    if not records:
+        return
+
+    pending = dict(records)
+    try:
+        query = TranslationMemoryQuery(db)
+        # memories deleted since the approval are skipped
+        existing = {memory.id for memory in query.get_memories_by_id(records)}
+        for memory_id, memory_records in records.items():
+            if memory_id in existing:
+                query.upsert_records(memory_id, memory_records)
+            del pending[memory_id]
+    except Exception:
+        db.rollback()
+        put_back(pending)
+        raise
+
+
+def flush_all() -> None:
+    with SessionLocal() as db:
+        flush(db, force=True)
+
+
+async def flush_periodically() -> None:
+    """Flush the buffer when it is due, runs for the app lifetime."""
+    while True:
+        await asyncio.sleep(CHECK_INTERVAL)
+        try:
+            await run_in_threadpool(_flush_due)
+        except Exception:
+            logging.exception("Failed to write approved segments to memories")
+
+
+def _flush_due() -> None:
+    with SessionLocal() as db:
+        flush(db)
+
+
+def clear() -> None:
+    global _oldest_at
+    with _lock:
+        _records.clear()
+        _oldest_at = None
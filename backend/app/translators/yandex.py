@@ -89,12 +89,14 @@ def translate_batch(
     lines: list[LineWithGlossaries],
     iam_token: str,
     folder_id: str,
+    source_language: str = "en",
+    target_language: str = "ru",
 ) -> list[str]:
     output: list[str] = []
     json_data = {
         "folderId": folder_id,
-        "targetLanguageCode": "ru",
-        "sourceLanguageCode": "en",
+        "targetLanguageCode": target_language,
+        "sourceLanguageCode": source_language,
         "texts": [line for line, _ in lines],
     }
 
@@ -138,7 +140,11 @@ def translate_batch(
 
 
 def translate_lines(
-    lines: list[LineWithGlossaries], oauth_token: str, folder_id: str
+    lines: list[LineWithGlossaries],
+    oauth_token: str,
+    folder_id: str,
+    source_language: str = "en",
+    target_language: str = "ru",
 ) -> tuple[list[str], bool]:
     """
     Translate lines of text using machine translation.
@@ -146,6 +152,8 @@ def translate_lines(
     Args:
         lines: A list of strings to be translated.
         settings: An object containing machine translation settings.
+        source_language: Language code of the lines.
+        target_language: Language code to translate to.
 
     Returns:
         A list of translated strings.
@@ -160,7 +168,9 @@ def translate_lines(
             # TODO: make it in a smarter way, currently Yandex rejects
             # requests that are too frequent
             time.sleep(1.0 / 20.0)
-            output += translate_batch(batch, iam_token, folder_id)
+            output += translate_batch(
+                batch, iam_token, folder_id, source_language, target_language
+            )
         except TranslationError as e:
             logging.error("Translation error: %s", str(e))
             return output, True
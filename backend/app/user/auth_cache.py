@@ -0,0 +1,64 @@
+"""
+Process-wide cache of authentication data. API tokens and user roles are
+checked on every request, caching them saves several queries per request.
+
+Entries are invalidated when users and tokens are changed through services,
+the TTL bounds staleness for changes made elsewhere (other processes,
+direct database edits).
+"""
+
+import threading
+from datetime import datetime
+from typing import NamedTuple
+
+from app.cache import TtlCache
+from app.settings import settings
+
+
+class CachedToken(NamedTuple):
+    id: int
+    user_id: int
+    expires_at: datetime | None
+
+
+# token hash -> token
+tokens: TtlCache[str, CachedToken] = TtlCache(
+    settings.auth_cache_size, settings.auth_cache_ttl
+)
+# user ID -> role, missing users are not cached
+roles: TtlCache[int, str] = TtlCache(settings.auth_cache_size, settings.auth_cache_ttl)
+
+# IDs of tokens with last_used_at written within the touch interval
+_token_touches: TtlCache[int, bool] = TtlCache(
+    settings.auth_cache_size, settings.api_token_touch_interval
+)
+_token_touches_lock = threading.Lock()
+
+
+def should_touch_token(token_id: int) -> bool:
+    """
+    Check if last_used_at of a token has to be written. Writes are coalesced
+    to at most one per api_token_touch_interval seconds for each token.
+    """
+    # the lock makes the check and the write atomic
+    with _token_touches_lock:
+        if _token_touches.get(token_id):
+            return False
+        _token_touches.set(token_id, True)
+        return True
+
+
+def invalidate_user(user_id: int) -> None:
+    roles.pop(user_id)
+    tokens.pop_where(lambda _, token: token.user_id == user_id)
+
+
+def invalidate_token(token_id: int) -> None:
+    tokens.pop_where(lambda _, token: token.id == token_id)
+    _token_touches.pop(token_id)
+
+
+def clear() -> None:
+    tokens.clear()
+    roles.clear()
+    _token_touches.clear()
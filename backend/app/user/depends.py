@@ -9,6 +9,7 @@ from sqlalchemy.orm import Session
 from app.api_token.query import ApiTokenQuery
 from app.db import get_db
 from app.settings import settings
+from app.user import auth_cache
 
 
 def get_current_user_id(
@@ -26,7 +27,14 @@ def get_current_user_id(
         query = ApiTokenQuery(db)
         raw_token = authorization[7:]
         token_hash = hashlib.sha256(raw_token.encode()).hexdigest()
-        api_token = query.get_by_hash(token_hash)
+        api_token = auth_cache.tokens.get(token_hash)
+        if not api_token:
+            db_token = query.get_by_hash(token_hash)
+            if db_token:
+                api_token = auth_cache.CachedToken(
+                    db_token.id, db_token.user_id, db_token.expires_at
+                )
+                auth_cache.tokens.set(token_hash, api_token)
         if api_token:
             if api_token.expires_at:
                 exp = api_token.expires_at
@@ -34,7 +42,8 @@ def get_current_user_id(
                     exp = exp.replace(tzinfo=UTC)
                 if exp < datetime.now(UTC):
                     raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED)
-            query.update_last_used(api_token.id)
+            if auth_cache.should_touch_token(api_token.id):
+                query.update_last_used(api_token.id)
             return api_token.user_id
 
     raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED)
@@ -0,0 +1,2 @@
+# Standalone benchmarks, run them as modules, e.g.
+# python -m benchmarks.history_reconstruction
@@ -0,0 +1,91 @@
+"""
+Benchmark of diff engines used for segment history on realistic segments.
+
+Every case is an edit of a segment of a given length: a small fix inside a
+sentence, a few scattered word changes and a complete rewrite. Reported
+numbers are the average time per diff and the size of the encoded diff.
+"""
+
+import random
+import time
+
+from app.documents.diff import DIFF_ENGINES
+from app.documents.utils import apply_diff, compute_encoded_diff
+
+LENGTHS = (50, 200, 1000, 5000)
+REPEATS = 20
+
+WORDS = (
+    "the agreement shall be governed by and construed in accordance with laws "
+    "of party parties hereto any dispute arising out connection this contract "
+    "which notice written consent obligations term termination"
+).split()
+
+
+def make_text(rng: random.Random, length: int) -> str:
+    words: list[str] = []
+    size = 0
+    while size < length:
+        word = rng.choice(WORDS)
+        words.append(word)
+        size += len(word) + 1
+    return " ".join(words)[:length]
+
+
+def small_fix(rng: random.Random, text: str) -> str:
+    pos = rng.randrange(len(text))
+    return text[:pos] + "x" + text[pos + 1 :]
+
+
+def word_changes(rng: random.Random, text: str) -> str:
+    words = text.split(" ")
+    for _ in range(max(1, len(words) // 10)):
+        words[rng.randrange(len(words))] = rng.choice(WORDS)
+    return " ".join(words)
+
+
+def rewrite(rng: random.Random, text: str) -> str:
+    return make_text(rng, len(text))
+
+
+CASES = {
+    "small fix": small_fix,
+    "word changes": word_changes,
+    "rewrite": rewrite,
+}
+
+
+def run(length: int):
+    rng = random.Random(length)
+    pairs = {name: [] for name in CASES}
+    for name, change in CASES.items():
+        for _ in range(REPEATS):
+            text = make_text(rng, length)
+            pairs[name].append((text, change(rng, text)))
+
+    for name, cases in pairs.items():
+        results = []
+        for engine in DIFF_ENGINES:
+            size = 0
+            start = time.perf_counter()
+            for old, new in cases:
+                diff = compute_encoded_diff(old, new, engine)
+                size += len(diff)
+            elapsed = (time.perf_counter() - start) / len(cases)
+            assert all(
+                apply_diff(old, compute_encoded_diff(old, new, engine)) == new
+                for old, new in cases
+            )
+            results.append(
+                f"{engine} {elapsed * 1000:8.2f} ms {size // len(cases):6} B"
+            )
+        print(f"{length:>5} chars, {name:<12}: " + " | ".join(results))
+
+
+def main():
+    for length in LENGTHS:
+        run(length)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,110 @@
+"""
+Benchmark of segment history tracking on heavily edited segments.
+
+Measures the time of a mergeable save (the typical keystroke-save in the
+editor) after a segment has accumulated hundreds of history entries, with
+snapshots and with snapshots removed (which replays the whole diff chain).
+"""
+
+import time
+
+from sqlalchemy import StaticPool, create_engine, update
+from sqlalchemy.orm import Session
+
+from app import models, schema
+from app.db import Base
+from app.documents.models import (
+    Document,
+    DocumentRecord,
+    DocumentRecordHistory,
+    DocumentRecordHistoryChangeType,
+    DocumentType,
+)
+from app.projects.models import Project
+from app.services.record_service import RecordService
+
+EDITS = (100, 300, 1000)
+SAVES = 50
+
+
+def prepare(session: Session, edits: int) -> list[str]:
+    session.add(
+        schema.User(
+            username="bench",
+            password="",
+            email="bench@example.com",
+            role=models.UserRole.USER.value,
+        )
+    )
+    session.add(Project(name="bench", created_by=1))
+    session.add(
+        Document(
+            name="bench.txt",
+            type=DocumentType.txt,
+            records=[DocumentRecord(source="Benchmark segment", target="")],
+            processing_status="done",
+            created_by=1,
+            project_id=1,
+        )
+    )
+    session.commit()
+
+    service = RecordService(session)
+    texts = [
+        f"Paragraph-sized translation of the segment, revision {i}. " * 4
+        for i in range(edits)
+    ]
+    old_text = ""
+    for i, text in enumerate(texts):
+        # alternate change types to prevent merging and grow the chain
+        change_type = (
+            DocumentRecordHistoryChangeType.manual_edit
+            if i % 2
+            else DocumentRecordHistoryChangeType.machine_translation
+        )
+        service.track_history([(1, old_text, text)], 1, change_type)
+        old_text = text
+    return texts
+
+
+def measure_saves(session: Session, text: str) -> float:
+    service = RecordService(session)
+    old_text = text
+    start = time.perf_counter()
+    for i in range(SAVES):
+        new_text = f"{text} keystroke {i}"
+        service.track_history(
+            [(1, old_text, new_text)],
+            1,
+            DocumentRecordHistoryChangeType.manual_edit,
+        )
+        old_text = new_text
+    return (time.perf_counter() - start) / SAVES
+
+
+def run(edits: int):
+    engine = create_engine(
+        "sqlite://", connect_args={"check_same_thread": False}, poolclass=StaticPool
+    )
+    Base.metadata.create_all(bind=engine)
+    with Session(engine) as session:
+        texts = prepare(session, edits)
+        with_snapshots = measure_saves(session, texts[-1])
+
+        session.execute(update(DocumentRecordHistory).values(snapshot=None))
+        session.commit()
+        without_snapshots = measure_saves(session, texts[-1])
+
+    print(
+        f"{edits:>5} edits: save with snapshots {with_snapshots * 1000:8.2f} ms, "
+        f"without snapshots {without_snapshots * 1000:8.2f} ms"
+    )
+
+
+def main():
+    for edits in EDITS:
+        run(edits)
+
+
+if __name__ == "__main__":
+    main()
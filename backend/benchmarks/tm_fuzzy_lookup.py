@@ -0,0 +1,151 @@
+"""
+Benchmark of fuzzy translation memory lookups on large memories.
+
+Needs a PostgreSQL database with pg_trgm, the current schema and a user
+with ID 1. It is taken from DATABASE_URL, use a scratch database. A memory
+with the given number of synthetic records is created and removed at the
+end, with another memory of the same size sharing the trigram index which
+lookups have to skip. Reported numbers are median and p95 latency of
+a substitution lookup, for the previous SET pg_trgm.similarity_threshold + %
+query and for the current KNN query.
+
+    python -m benchmarks.tm_fuzzy_lookup 1000000 10000000
+"""
+
+import random
+import statistics
+import sys
+import time
+
+from sqlalchemy import func, select, text
+from sqlalchemy.orm import Session
+
+from app.db import SessionLocal
+from app.translation_memory.models import TranslationMemory, TranslationMemoryRecord
+from app.translation_memory.query import TranslationMemoryQuery
+
+SIZES = (1_000_000, 10_000_000)
+LOOKUPS = 50
+THRESHOLD = 0.75
+
+WORDS = (
+    "the agreement shall be governed by and construed in accordance with laws "
+    "of party parties hereto any dispute arising out connection this contract "
+    "which notice written consent obligations term termination payment invoice "
+    "delivery goods services warranty liability damages force majeure"
+).split()
+
+
+def fill_memory(session: Session, size: int) -> int:
+    memory = TranslationMemory(name=f"benchmark {size}", created_by=1)
+    session.add(memory)
+    session.commit()
+    # sentences of 6-15 pseudo-random words, generated on the server, sources
+    # may repeat as in real memories
+    session.execute(
+        text(
+            """
+            INSERT INTO translation_memory_record
+                (document_id, source, source_hash, target, creation_date,
+                change_date)
+            SELECT :memory_id, s.sentence, md5(s.sentence), upper(s.sentence),
+                now(), now()
+            FROM (
+                SELECT (
+                    SELECT string_agg(
+                        (:words)[1 + floor(random() * array_length(:words, 1))::int],
+                        ' '
+                    )
+                    FROM generate_series(1, 6 + (i % 10))
+                ) AS sentence
+                FROM generate_series(1, :size) AS i
+            ) AS s
+            """
+        ),
+        {"memory_id": memory.id, "size": size, "words": list(WORDS)},
+    )
+    session.commit()
+    session.execute(text("ANALYZE translation_memory_record"))
+    return memory.id
+
+
+def legacy_lookup(session: Session, source: str, memory_id: int):
+    similarity = func.similarity(TranslationMemoryRecord.source, source)
+    session.execute(
+        text("SET pg_trgm.similarity_threshold TO :threshold"),
+        {"threshold": THRESHOLD},
+    )
+    return session.execute(
+        select(TranslationMemoryRecord.source, similarity)
+        .filter(
+            TranslationMemoryRecord.source.op("%")(source),
+            TranslationMemoryRecord.document_id.in_([memory_id]),
+        )
+        .order_by(similarity.desc())
+        .limit(10)
+    ).all()
+
+
+def knn_lookup(session: Session, source: str, memory_id: int):
+    return TranslationMemoryQuery(session).get_substitutions(
+        source, [memory_id], THRESHOLD, 10
+    )
+
+
+def measure(lookup, session: Session, sources: list[str], memory_id: int):
+    timings = []
+    for source in sources:
+        start = time.perf_counter()
+        lookup(session, source, memory_id)
+        timings.append(time.perf_counter() - start)
+    timings.sort()
+    return statistics.median(timings), timings[int(len(timings) * 0.95)]
+
+
+def run(size: int):
+    rng = random.Random(size)
+    with SessionLocal() as session:
+        memory_id = fill_memory(session, size)
+        other_id = fill_memory(session, size)
+        try:
+            sources = list(
+                session.execute(
+                    select(TranslationMemoryRecord.source)
+                    .filter(TranslationMemoryRecord.document_id == memory_id)
+                    .limit(LOOKUPS)
+                ).scalars()
+            )
+            # small edits of existing sentences to get fuzzy matches
+            sources = [
+                source.replace(rng.choice(WORDS), rng.choice(WORDS), 1)
+                for source in sources
+            ]
+            for name, lookup in (("SET + %", legacy_lookup), ("KNN", knn_lookup)):
+                median, p95 = measure(lookup, session, sources, memory_id)
+                print(
+                    f"{size:>10} records, {name:<8}: median {median * 1000:8.2f} ms, "
+                    f"p95 {p95 * 1000:8.2f} ms"
+                )
+        finally:
+            session.rollback()
+            for id_ in (memory_id, other_id):
+                session.execute(
+                    text(
+                        "DELETE FROM translation_memory_record WHERE document_id = :id"
+                    ),
+                    {"id": id_},
+                )
+                session.execute(
+                    text("DELETE FROM translation_memory WHERE id = :id"), {"id": id_}
+                )
+            session.commit()
+
+
+def main():
+    sizes = [int(arg) for arg in sys.argv[1:]] or SIZES
+    for size in sizes:
+        run(size)
+
+
+if __name__ == "__main__":
+    main()
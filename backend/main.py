@@ -1,4 +1,8 @@
+import asyncio
+from contextlib import asynccontextmanager
+
 from fastapi import FastAPI
+from fastapi.concurrency import run_in_threadpool
 from fastapi.middleware.cors import CORSMiddleware
 
 from app.routers import (
@@ -7,6 +11,7 @@ from app.routers import (
     comments,
     document,
     glossary,
+    metrics,
     projects,
     records,
     registration_tokens,
@@ -15,6 +20,7 @@ from app.routers import (
     users,
 )
 from app.settings import settings
+from app.translation_memory import write_buffer
 
 ROUTERS = (
     api_tokens,
@@ -26,13 +32,22 @@ ROUTERS = (
     user,
     users,
     glossary,
+    metrics,
     projects,
     registration_tokens,
 )
 
 
+@asynccontextmanager
+async def lifespan(_: FastAPI):
+    flusher = asyncio.create_task(write_buffer.flush_periodically())
+    yield
+    flusher.cancel()
+    await run_in_threadpool(write_buffer.flush_all)
+
+
 def create_app():
-    fastapi = FastAPI()
+    fastapi = FastAPI(lifespan=lifespan)
 
     fastapi.add_middleware(
         CORSMiddleware,
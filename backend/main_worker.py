@@ -2,11 +2,12 @@
 # processes files in it.
 # Tasks are stored in document_task table and encoded in JSON.
 
-import json
 import logging
 import time
+from itertools import batched
 from typing import Sequence
 
+from pydantic import TypeAdapter
 from sqlalchemy import select
 from sqlalchemy.orm import Session
 
@@ -17,6 +18,7 @@ from app.documents.models import (
     DocumentRecordHistory,
     DocumentRecordHistoryChangeType,
     DocumentType,
+    TmMode,
     TxtRecord,
     XliffRecord,
 )
@@ -27,12 +29,18 @@ from app.documents.schema import (
     SubstituteSegmentsSettings,
     TranslateSegmentsSettings,
 )
+from app.documents.utils import encode_text_diff
 from app.formats.txt import TxtSegment
 from app.formats.xliff import XliffSegment
 from app.glossary.query import GlossaryQuery
 from app.linguistic.word_count import count_words
 from app.models import DocumentStatus, TaskStatus
 from app.schema import DocumentTask
+from app.services.analysis_service import AnalysisService
+from app.services.match_service import MATCH_CACHE_BATCH, MatchService
+from app.translation_memory import trigram_index, vector_index
+from app.translation_memory.query import TranslationMemoryQuery
+from app.translation_memory.schema import MemorySubstitution, MemoryTaskDescription
 from app.translators import llm, yandex
 from app.translators.common import LineWithGlossaries
 from app.translators.matcher import match_all_segments, segment_text_to_match
@@ -66,6 +74,23 @@ def substitute_segments(
     )
     history_records: list[DocumentRecordHistory] = []
 
+    # best fuzzy matches of all records, precomputed ones if they exist,
+    # candidates of a chunk of records are searched and scored together
+    substitutions: dict[int, list[MemorySubstitution]] | None = None
+    if settings.similarity_threshold < 1.0:
+        substitutions = {}
+        match_service = MatchService(session)
+        for chunk in batched(empty_records, MATCH_CACHE_BATCH):
+            substitutions.update(
+                match_service.get_substitutions(
+                    doc,
+                    [record.id for record in chunk],
+                    tm_ids,
+                    settings.similarity_threshold,
+                    1,
+                )
+            )
+
     for record in empty_records:
         translation = find_segment_translation(
             source=record.source,
@@ -73,6 +98,9 @@ def substitute_segments(
             tm_ids=tm_ids,
             glossary_ids=glossary_ids,
             session=session,
+            substitutions=(
+                substitutions[record.id] if substitutions is not None else None
+            ),
         )
 
         if not translation:
@@ -91,17 +119,13 @@ def substitute_segments(
                 )
             ).scalar_one_or_none()
             if old_history:
-                old_history.diff = json.dumps(
-                    {"ops": [["insert", 0, 0, record.target]], "old_len": 0}
-                )
+                old_history.diff_data = encode_text_diff(record.target)
                 session.commit()
         else:
             history_records.append(
                 DocumentRecordHistory(
                     record_id=record.id,
-                    diff=json.dumps(
-                        {"ops": [["insert", 0, 0, record.target]], "old_len": 0}
-                    ),
+                    diff_data=encode_text_diff(record.target),
                     change_type=convert_segment_src(segment_src),
                 )
             )
@@ -156,6 +180,8 @@ def translate_segments(
             sentences_with_ctx,
             oauth_token=settings.machine_translation_settings.oauth_token,
             folder_id=settings.machine_translation_settings.folder_id,
+            source_language=doc.project.source_language,
+            target_language=doc.project.target_language,
         )
     elif settings.machine_translation_settings.type == "llm":
         translated = llm.translate_lines(
@@ -168,12 +194,7 @@ def translate_segments(
         history_records.append(
             DocumentRecordHistory(
                 record_id=empty_records[idx].id,
-                diff=json.dumps(
-                    {
-                        "ops": [["insert", 0, 0, empty_records[idx].target]],
-                        "old_len": 0,
-                    }
-                ),
+                diff_data=encode_text_diff(empty_records[idx].target),
                 change_type=DocumentRecordHistoryChangeType.machine_translation,
             )
         )
@@ -210,9 +231,7 @@ def create_doc_segments(
         history_records.append(
             DocumentRecordHistory(
                 record_id=record.id,
-                diff=json.dumps(
-                    {"ops": [["insert", 0, 0, record.target]], "old_len": 0}
-                ),
+                diff_data=encode_text_diff(record.target),
                 change_type=DocumentRecordHistoryChangeType.initial_import,
             )
         )
@@ -258,6 +277,33 @@ def finalize_document(doc: Document, session: Session):
     session.commit()
 
 
+def flush_approved_segments(doc: Document, session: Session):
+    tm_id = next(
+        (
+            association.tm_id
+            for association in doc.project.tm_associations
+            if association.mode == TmMode.write
+        ),
+        None,
+    )
+    if tm_id is None:
+        logging.info("No memory to write approved segments to")
+        return
+
+    records = session.execute(
+        select(DocumentRecord.source, DocumentRecord.target)
+        .where(
+            DocumentRecord.document_id == doc.id,
+            DocumentRecord.approved.is_(True),
+        )
+        .order_by(DocumentRecord.id)
+    ).all()
+    TranslationMemoryQuery(session).upsert_records(
+        tm_id, [(record.source, record.target) for record in records]
+    )
+    logging.info("Approved segments written to memory: %d", len(records))
+
+
 def match_segments_handler(
     doc: Document,
     match_settings: MatchSegmentsSettings,
@@ -298,9 +344,7 @@ def match_segments_handler(
             history_records.append(
                 DocumentRecordHistory(
                     record_id=record.id,
-                    diff=json.dumps(
-                        {"ops": [["insert", 0, 0, record.target]], "old_len": 0}
-                    ),
+                    diff_data=encode_text_diff(record.target),
                     change_type=DocumentRecordHistoryChangeType.machine_translation,
                 )
             )
@@ -309,6 +353,30 @@ def match_segments_handler(
     session.commit()
 
 
+TASK_DESCRIPTION = TypeAdapter(DocumentTaskDescription | MemoryTaskDescription)
+
+
+def process_memory_task(session: Session, task_desc: MemoryTaskDescription):
+    memory = TranslationMemoryQuery(session).get_memory(task_desc.memory_id)
+    if not memory:
+        raise RuntimeError("Translation memory not found")
+
+    if task_desc.task_data.task_type == "build_tm_index":
+        task_start_time = time.time()
+        trigram_index.build_index_file(session, memory.id)
+        logging.info(
+            "Trigram index building time: %.2f seconds",
+            time.time() - task_start_time,
+        )
+    elif task_desc.task_data.task_type == "build_tm_embeddings":
+        task_start_time = time.time()
+        vector_index.build_index_file(session, memory.id)
+        logging.info(
+            "Vector index building time: %.2f seconds",
+            time.time() - task_start_time,
+        )
+
+
 def process_task(session: Session, task: DocumentTask) -> bool:
     start_time = time.time()
     doc: Document | None = None
@@ -318,7 +386,11 @@ def process_task(session: Session, task: DocumentTask) -> bool:
 
         logging.info("New task found: %s", task.id)
 
-        task_desc = DocumentTaskDescription.model_validate_json(task.data)
+        task_desc = TASK_DESCRIPTION.validate_json(task.data)
+        if isinstance(task_desc, MemoryTaskDescription):
+            process_memory_task(session, task_desc)
+            return True
+
         doc = GenericDocsQuery(session).get_document(task_desc.document_id)
         if not doc:
             raise RuntimeError("Document not found")
@@ -353,6 +425,31 @@ def process_task(session: Session, task: DocumentTask) -> bool:
                 "Segments substitution time: %.2f seconds",
                 time.time() - task_start_time,
             )
+        elif task_data.task_type == "cache_tm_matches":
+            task_start_time = time.time()
+            MatchService(session).cache_document_matches(
+                doc, [x.id for x in doc.project.translation_memories]
+            )
+            logging.info(
+                "TM matches caching time: %.2f seconds",
+                time.time() - task_start_time,
+            )
+        elif task_data.task_type == "analyze_tm_leverage":
+            task_start_time = time.time()
+            AnalysisService(session).analyze_document(
+                doc, [x.id for x in doc.project.translation_memories]
+            )
+            logging.info(
+                "TM leverage analysis time: %.2f seconds",
+                time.time() - task_start_time,
+            )
+        elif task_data.task_type == "flush_approved":
+            task_start_time = time.time()
+            flush_approved_segments(doc, session)
+            logging.info(
+                "Approved segments writing time: %.2f seconds",
+                time.time() - task_start_time,
+            )
         elif task_data.task_type == "translate_segments":
             task_start_time = time.time()
             translate_segments(
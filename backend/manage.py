@@ -6,6 +6,11 @@ from app.db import get_db
 from app.models import UserRole
 from app.schema import User
 from app.security import hash_password
+from app.translation_memory.partitions import (
+    create_memory_partition,
+    get_memory_partitions,
+    merge_memory_partition,
+)
 
 
 def add_user():
@@ -38,13 +43,62 @@ def add_user():
     print(f"{username} added!")
 
 
+def partition_tm(memory_id: int | None):
+    if memory_id is None:
+        print("Translation memory ID is required!")
+        return
+
+    session = next(get_db())
+    if memory_id in get_memory_partitions(session):
+        print(f"Translation memory {memory_id} already has a partition!")
+        return
+
+    print("Run it in a maintenance window, translation memories are locked until done.")
+    create_memory_partition(session, memory_id)
+    print(f"Translation memory {memory_id} moved to its own partition!")
+
+
+def unpartition_tm(memory_id: int | None):
+    if memory_id is None:
+        print("Translation memory ID is required!")
+        return
+
+    session = next(get_db())
+    if memory_id not in get_memory_partitions(session):
+        print(f"Translation memory {memory_id} has no partition!")
+        return
+
+    print(f"Translation memory {memory_id} cannot be searched until it is done.")
+    merge_memory_partition(session, memory_id)
+    print(f"Translation memory {memory_id} moved to the default partition!")
+
+
+def list_tm_partitions():
+    session = next(get_db())
+    for memory_id, name in sorted(get_memory_partitions(session).items()):
+        print(f"{memory_id}: {name}")
+
+
 def main():
     parser = argparse.ArgumentParser(description="HAT manager script")
-    parser.add_argument("command", help="Command to execute", choices=["add-user"])
+    parser.add_argument(
+        "command",
+        help="Command to execute",
+        choices=["add-user", "partition-tm", "unpartition-tm", "list-tm-partitions"],
+    )
+    parser.add_argument(
+        "tm_id", help="Translation memory ID", type=int, nargs="?", default=None
+    )
     args = parser.parse_args()
 
     if args.command == "add-user":
         add_user()
+    elif args.command == "partition-tm":
+        partition_tm(args.tm_id)
+    elif args.command == "unpartition-tm":
+        unpartition_tm(args.tm_id)
+    elif args.command == "list-tm-partitions":
+        list_tm_partitions()
 
 
 if __name__ == "__main__":
@@ -1,3 +1,5 @@
+import random
+
 import pytest
 from fastapi.testclient import TestClient
 from sqlalchemy import StaticPool, create_engine
@@ -5,6 +7,10 @@ from sqlalchemy.orm import Session, sessionmaker
 
 from app import models, schema
 from app.db import Base, get_db
+from app.records import suggestions_cache
+from app.settings import settings
+from app.translation_memory import trigram_index, vector_index, write_buffer
+from app.user import auth_cache
 from main import app
 
 engine = create_engine(
@@ -18,6 +24,10 @@ db = TestingSessionLocal()
 
 Base.metadata.create_all(bind=engine)
 
+# buffered approvals are due right away unless a test waits, tests flush them
+# as the background task of the app does
+settings.tm_write_interval = 0
+
 
 def override_get_db():
     try:
@@ -33,6 +43,11 @@ app.dependency_overrides[get_db] = override_get_db
 def session():
     Base.metadata.drop_all(bind=engine)
     Base.metadata.create_all(bind=engine)
+    auth_cache.clear()
+    suggestions_cache.clear()
+    write_buffer.clear()
+    trigram_index.clear()
+    vector_index.clear()
 
     try:
         yield db
@@ -40,6 +55,23 @@ def session():
         db.close()
 
 
+WORDS = "the agreement shall be governed by laws of party parties any dispute".split()
+
+
+@pytest.fixture()
+def sentences():
+    """Generate random sentences of a few words, many of them share words."""
+
+    def generate(seed: int, count: int) -> list[str]:
+        rng = random.Random(seed)
+        return [
+            " ".join(rng.choice(WORDS) for _ in range(rng.randint(2, 8)))
+            for _ in range(count)
+        ]
+
+    return generate
+
+
 client = TestClient(app)
 
 
@@ -1,6 +1,6 @@
 from datetime import UTC, datetime, timedelta, timezone
 
-from app.formats.tmx import TmxData, TmxSegment, extract_tmx_content
+from app.formats.tmx import TmxData, TmxSegment, extract_tmx_content, iter_tmx_pairs
 
 # pylint: disable=C0116
 
@@ -137,6 +137,88 @@ def test_can_load_multiple_segments():
     assert data[1].change_date == datetime(2021, 7, 30, 5, 11, 34, tzinfo=UTC)
 
 
+def test_can_load_all_pairs_of_multilingual_tmx():
+    content = """<?xml version="1.0" encoding="utf-8"?>
+<tmx version="1.4">
+  <header srclang="EN-US" datatype="plaintext"/>
+  <body>
+    <tu changedate="20220703T075920Z">
+      <tuv xml:lang="en-US"><seg>Hello</seg></tuv>
+      <tuv xml:lang="de-DE"><seg>Hallo</seg></tuv>
+      <tuv xml:lang="fr-FR"><seg>Bonjour</seg></tuv>
+    </tu>
+    <tu>
+      <tuv xml:lang="en-US"><seg>Bye</seg></tuv>
+      <tuv xml:lang="de-DE"><seg>Tschüss</seg></tuv>
+    </tu>
+    <tu>
+      <tuv xml:lang="de-DE"><seg>Ohne Quelle</seg></tuv>
+    </tu>
+  </body>
+</tmx>
+""".encode()
+
+    data = list(iter_tmx_pairs(content))
+    assert [
+        (pair, segment.original, segment.translation) for pair, segment in data
+    ] == [
+        (("en-us", "de-de"), "Hello", "Hallo"),
+        (("en-us", "fr-fr"), "Hello", "Bonjour"),
+        (("en-us", "de-de"), "Bye", "Tschüss"),
+    ]
+    assert data[0][1].change_date == datetime(2022, 7, 3, 7, 59, 20, tzinfo=UTC)
+
+
+def test_skips_units_missing_a_language():
+    content = """<?xml version="1.0" encoding="utf-8"?>
+<tmx version="1.4">
+  <header srclang="en" datatype="plaintext"/>
+  <body>
+    <tu>
+      <tuv xml:lang="en"><seg>Hello</seg></tuv>
+      <tuv xml:lang="fr"><seg>Bonjour</seg></tuv>
+    </tu>
+    <tu>
+      <tuv xml:lang="en"><seg>Bye</seg></tuv>
+      <tuv xml:lang="de"><seg>Tschüss</seg></tuv>
+    </tu>
+  </body>
+</tmx>
+""".encode()
+
+    data = extract_tmx_content(content, "en", "de")
+    assert [(segment.original, segment.translation) for segment in data] == [
+        ("Bye", "Tschüss")
+    ]
+
+
+def test_matches_languages_ignoring_case():
+    content = """<?xml version="1.0" encoding="utf-8"?>
+<tmx version="1.1">
+  <header srclang="EN-US" datatype="plaintext"/>
+  <body>
+    <tu>
+      <tuv xml:lang="en-US"><seg>Hello</seg></tuv>
+      <tuv lang="DE-de"><seg>Hallo</seg></tuv>
+    </tu>
+  </body>
+</tmx>
+""".encode()
+
+    data = extract_tmx_content(content, "en-us", "de-de")
+    assert [(segment.original, segment.translation) for segment in data] == [
+        ("Hello", "Hallo")
+    ]
+
+
+def test_can_store_tmx_of_language_pair():
+    data = TmxData([TmxSegment("Hi", "Hallo", None, None)], "en", "de")
+    content = data.write().read()
+    assert b'srclang="en"' in content
+    assert b'<tuv xml:lang="en"><seg>Hi</seg></tuv>' in content
+    assert b'<tuv xml:lang="de"><seg>Hallo</seg></tuv>' in content
+
+
 def test_can_store_simplest_tmx():
     data = TmxData([])
     content = data.write().read()
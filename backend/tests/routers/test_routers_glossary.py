@@ -3,7 +3,7 @@ from fastapi import status
 from fastapi.testclient import TestClient
 from sqlalchemy.orm import Session
 
-from app import Glossary
+from app import Glossary, GlossaryRecord
 from app.glossary.query import GlossaryQuery, NotFoundGlossaryRecordExc
 from app.glossary.schema import (
     GlossaryRecordCreate,
@@ -213,6 +213,42 @@ def test_list_glossary_records_paged(user_logged_client: TestClient, session: Se
     assert resp_records["records"][0]["glossary_id"] == record.glossary_id
 
 
+def test_list_glossary_records_after_id(
+    user_logged_client: TestClient, session: Session, monkeypatch
+):
+    monkeypatch.setattr("app.base.query.COUNT_CAP", 120)
+    glossary = GlossaryQuery(session).create_glossary(
+        user_id=1, glossary=GlossarySchema(name="Glossary name")
+    )
+    session.add_all(
+        GlossaryRecord(
+            source=f"Term {i}",
+            target=f"Термин {i}",
+            stemmed_source=f"term {i}",
+            created_by=1,
+            glossary_id=glossary.id,
+        )
+        for i in range(140)
+    )
+    session.commit()
+    path = app.url_path_for("list_records", **{"glossary_id": glossary.id})
+
+    response = user_logged_client.get(path, params={"count_mode": "capped"})
+    resp_records = response.json()
+    assert resp_records["total_rows"] == 120
+    assert resp_records["total_is_estimate"]
+    assert resp_records["next_after_id"] == 100
+
+    response = user_logged_client.get(
+        path, params={"after_id": resp_records["next_after_id"]}
+    )
+    resp_records = response.json()
+    assert [record["id"] for record in resp_records["records"]] == list(range(101, 141))
+    assert resp_records["total_rows"] == 140
+    assert not resp_records["total_is_estimate"]
+    assert resp_records["next_after_id"] is None
+
+
 def test_list_glossary_records_search(user_logged_client: TestClient, session: Session):
     """GET /glossary/{glossary_id}/records/?search=..."""
     glossary = GlossaryQuery(session).create_glossary(
@@ -247,7 +283,12 @@ def test_list_glossary_records_search(user_logged_client: TestClient, session: S
     # Search by nonexistent
     response = user_logged_client.get(path, params={"search": "Delta"})
     resp_records = response.json()
-    assert resp_records == {"total_rows": 0, "records": []}
+    assert resp_records == {
+        "total_rows": 0,
+        "records": [],
+        "total_is_estimate": False,
+        "next_after_id": None,
+    }
 
 
 def test_update_glossary_record(admin_logged_client: TestClient, session: Session):
@@ -8,12 +8,18 @@ from app.comments.models import Comment
 from app.documents.models import (
     Document,
     DocumentRecord,
+    DocumentRecordMatch,
     DocumentType,
 )
 from app.projects.models import ProjectTmAssociation
 from app.projects.query import ProjectQuery
 from app.projects.schema import ProjectCreate
+from app.records import suggestions_cache
+from app.settings import settings
+from app.translation_memory import write_buffer
 from app.translation_memory.models import TranslationMemory, TranslationMemoryRecord
+from app.translation_memory.query import TranslationMemoryQuery
+from app.translation_memory.schema import MemorySubstitution
 
 # pylint: disable=C0116
 
@@ -212,6 +218,79 @@ def test_doc_records_returns_empty_for_too_large_page(
     assert response_data["records"] == []
 
 
+def test_doc_records_after_id(user_logged_client: TestClient, session: Session):
+    with session as s:
+        p = ProjectQuery(s).create_project(1, ProjectCreate(name="test"))
+        s.add(
+            Document(
+                name="test_doc.txt",
+                type=DocumentType.txt,
+                records=[
+                    DocumentRecord(source=f"line{i % 50}", target="")
+                    for i in range(150)
+                ],
+                processing_status="pending",
+                created_by=1,
+                project_id=p.id,
+            )
+        )
+        s.commit()
+
+    response = user_logged_client.get("/document/1/records", params={"after_id": "0"})
+    assert response.status_code == 200
+    response_data = response.json()
+    assert response_data["page"] is None
+    assert response_data["total_records"] == 150
+    assert len(response_data["records"]) == 100
+    assert response_data["next_after_id"] == 100
+
+    response = user_logged_client.get(
+        "/document/1/records", params={"after_id": response_data["next_after_id"]}
+    )
+    assert response.status_code == 200
+    response_data = response.json()
+    assert len(response_data["records"]) == 50
+    assert response_data["next_after_id"] is None
+    assert response_data["records"][0] == {
+        "id": 101,
+        "source": "line0",
+        "target": "",
+        "approved": False,
+        "repetitions_count": 3,
+        "has_comments": False,
+        "row_number": 101,
+    }
+
+
+def test_doc_records_after_id_with_filter(
+    user_logged_client: TestClient, session: Session
+):
+    with session as s:
+        p = ProjectQuery(s).create_project(1, ProjectCreate(name="test"))
+        s.add(
+            Document(
+                name="test_doc.txt",
+                type=DocumentType.txt,
+                records=[
+                    DocumentRecord(source=f"line{i}", target="") for i in range(30)
+                ],
+                processing_status="pending",
+                created_by=1,
+                project_id=p.id,
+            )
+        )
+        s.commit()
+
+    response = user_logged_client.get(
+        "/document/1/records", params={"after_id": "2", "source": "line1"}
+    )
+    assert response.status_code == 200
+    response_data = response.json()
+    assert response_data["total_records"] == 11
+    assert [r["id"] for r in response_data["records"]] == list(range(11, 21))
+    assert [r["row_number"] for r in response_data["records"]] == list(range(11, 21))
+
+
 def test_doc_records_returns_404_for_nonexistent_document(
     user_logged_client: TestClient,
 ):
@@ -312,6 +391,7 @@ def test_record_approving_creates_memory(
     assert response.status_code == 200, response.text
 
     with session as s:
+        write_buffer.flush(s)
         record = (
             s.query(TranslationMemoryRecord)
             .filter(TranslationMemoryRecord.id == 1)
@@ -369,6 +449,7 @@ def test_record_approving_updates_memory(
     assert response.status_code == 200, response.text
 
     with session as s:
+        write_buffer.flush(s)
         record = (
             s.query(TranslationMemoryRecord)
             .filter(TranslationMemoryRecord.id == 1)
@@ -383,6 +464,154 @@ def test_record_approving_updates_memory(
         assert record.change_date.date() == today.date()
 
 
+def test_record_approving_updates_memory_with_variants(
+    user_logged_client: TestClient, session: Session
+):
+    with session as s:
+        p = ProjectQuery(s).create_project(1, ProjectCreate(name="test"))
+        s.add(
+            Document(
+                name="test_doc.txt",
+                type=DocumentType.txt,
+                records=[DocumentRecord(source="Some source", target="")],
+                processing_status="done",
+                created_by=1,
+                project_id=p.id,
+            )
+        )
+        tm_records = [
+            TranslationMemoryRecord(
+                source="Some source",
+                target=target,
+                creation_date=datetime.datetime(2000, 4, 5),
+                change_date=datetime.datetime(2000, 4, day),
+            )
+            for target, day in (("First", 6), ("Second", 7))
+        ]
+        s.add(TranslationMemory(name="test_mem", created_by=1, records=tm_records))
+        s.commit()
+
+        s.add(ProjectTmAssociation(project_id=p.id, tm_id=1, mode="write"))
+        s.commit()
+
+    # the variant with the same target is touched, then the last changed one
+    # gets a new target
+    for target in ("First", "Third"):
+        response = user_logged_client.put(
+            "/records/1",
+            json={"target": target, "approved": True, "update_repetitions": False},
+        )
+        assert response.status_code == 200, response.text
+        with session as s:
+            write_buffer.flush(s)
+
+    with session as s:
+        records = (
+            s.query(TranslationMemoryRecord).order_by(TranslationMemoryRecord.id).all()
+        )
+        assert [(r.source, r.target) for r in records] == [
+            ("Some source", "Third"),
+            ("Some source", "Second"),
+        ]
+        assert records[1].change_date == datetime.datetime(2000, 4, 7)
+
+
+def test_record_approvals_are_written_to_memory_in_batches(
+    user_logged_client: TestClient, session: Session, monkeypatch
+):
+    monkeypatch.setattr(settings, "tm_write_interval", 60)
+    monkeypatch.setattr(settings, "tm_write_batch_size", 2)
+    with session as s:
+        p = ProjectQuery(s).create_project(1, ProjectCreate(name="test"))
+        records = [
+            DocumentRecord(source="First source", target=""),
+            DocumentRecord(source="Second source", target=""),
+        ]
+        s.add(
+            Document(
+                name="test_doc.txt",
+                type=DocumentType.txt,
+                records=records,
+                processing_status="done",
+                created_by=1,
+                project_id=p.id,
+            )
+        )
+        s.add(TranslationMemory(name="test_mem", created_by=1))
+        s.commit()
+
+        s.add(ProjectTmAssociation(project_id=p.id, tm_id=1, mode="write"))
+        s.commit()
+
+    for record_id, target in ((1, "First"), (1, "First updated")):
+        response = user_logged_client.put(
+            f"/records/{record_id}",
+            json={"target": target, "approved": True, "update_repetitions": False},
+        )
+        assert response.status_code == 200, response.text
+    with session as s:
+        # the buffer is not due yet
+        write_buffer.flush(s)
+        assert s.query(TranslationMemoryRecord).count() == 0
+
+    response = user_logged_client.put(
+        "/records/2",
+        json={"target": "Second", "approved": True, "update_repetitions": False},
+    )
+    assert response.status_code == 200, response.text
+    with session as s:
+        # the buffer is full
+        write_buffer.flush(s)
+        records = (
+            s.query(TranslationMemoryRecord).order_by(TranslationMemoryRecord.id).all()
+        )
+        assert [(r.source, r.target) for r in records] == [
+            ("First source", "First updated"),
+            ("Second source", "Second"),
+        ]
+
+
+def test_record_approvals_are_kept_if_memory_write_fails(
+    user_logged_client: TestClient, session: Session, monkeypatch
+):
+    with session as s:
+        p = ProjectQuery(s).create_project(1, ProjectCreate(name="test"))
+        s.add(
+            Document(
+                name="test_doc.txt",
+                type=DocumentType.txt,
+                records=[DocumentRecord(source="Some source", target="")],
+                processing_status="done",
+                created_by=1,
+                project_id=p.id,
+            )
+        )
+        s.add(TranslationMemory(name="test_mem", created_by=1))
+        s.commit()
+        s.add(ProjectTmAssociation(project_id=p.id, tm_id=1, mode="write"))
+        s.commit()
+
+    def fail(*_):
+        raise RuntimeError("Database is gone")
+
+    with monkeypatch.context() as patch:
+        patch.setattr(TranslationMemoryQuery, "upsert_records", fail)
+        response = user_logged_client.put(
+            "/records/1",
+            json={"target": "Updated", "approved": True, "update_repetitions": False},
+        )
+        # requests do not write to memories
+        assert response.status_code == 200, response.text
+        with session as s, pytest.raises(RuntimeError):
+            write_buffer.flush(s)
+
+    with session as s:
+        write_buffer.flush(s)
+        assert [(r.source, r.target) for r in s.query(TranslationMemoryRecord)] == [
+            ("Some source", "Updated")
+        ]
+
+
 def test_returns_404_for_nonexistent_doc_when_updating_record(
     user_logged_client: TestClient,
 ):
@@ -1084,3 +1313,193 @@ def test_record_page_with_pagination(user_logged_client: TestClient, session: Se
     )
     assert response.status_code == 200
     assert response.json()["page"] == 1
+
+
+def create_doc_with_records(s: Session, sources: list[str]) -> int:
+    p = ProjectQuery(s).create_project(1, ProjectCreate(name="test"))
+    doc = Document(
+        name="test_doc.txt",
+        type=DocumentType.txt,
+        records=[DocumentRecord(source=source, target="") for source in sources],
+        processing_status="pending",
+        created_by=1,
+        project_id=p.id,
+    )
+    s.add(doc)
+    s.commit()
+    return p.id
+
+
+def test_records_suggestions_without_resources(
+    user_logged_client: TestClient, session: Session
+):
+    with session as s:
+        create_doc_with_records(s, ["Regional Effects", "User Interface"])
+
+    response = user_logged_client.get(
+        "/document/1/records/suggestions", params={"record_id": [2, 1, 2]}
+    )
+    assert response.status_code == 200
+    assert response.json() == {
+        "records": [
+            {"record_id": 2, "substitutions": [], "glossary_records": []},
+            {"record_id": 1, "substitutions": [], "glossary_records": []},
+        ]
+    }
+
+
+def test_records_suggestions_uses_cache(
+    user_logged_client: TestClient, session: Session
+):
+    with session as s:
+        project_id = create_doc_with_records(s, ["Regional Effects", "Hello"])
+        s.add(TranslationMemory(name="test_mem", created_by=1))
+        s.commit()
+        s.add(ProjectTmAssociation(project_id=project_id, tm_id=1, mode="read"))
+        s.commit()
+
+    cached = [
+        MemorySubstitution(
+            source="Regional Effect", target="Региональный эффект", similarity=0.8
+        )
+    ]
+    for source in ("Regional Effects", "Hello"):
+        suggestions_cache.substitutions.set(suggestions_cache.key(source, [1]), cached)
+
+    response = user_logged_client.get(
+        "/document/1/records/suggestions", params={"record_id": [1, 2]}
+    )
+    assert response.status_code == 200
+    records = response.json()["records"]
+    assert [record["substitutions"] for record in records] == [
+        [
+            {
+                "source": "Regional Effect",
+                "target": "Региональный эффект",
+                "similarity": 0.8,
+            }
+        ]
+    ] * 2
+
+    response = user_logged_client.get("/records/1/substitutions")
+    assert response.status_code == 200
+    assert response.json()[0]["source"] == "Regional Effect"
+
+    with session as s:
+        TranslationMemoryQuery(s).add_or_update_record(1, "Hello", "Привет")
+    assert len(suggestions_cache.substitutions) == 0
+
+
+def test_records_suggestions_returns_404_for_record_of_other_doc(
+    user_logged_client: TestClient, session: Session
+):
+    with session as s:
+        create_doc_with_records(s, ["Regional Effects"])
+        create_doc_with_records(s, ["User Interface"])
+
+    response = user_logged_client.get(
+        "/document/1/records/suggestions", params={"record_id": [1, 2]}
+    )
+    assert response.status_code == 404
+
+    response = user_logged_client.get(
+        "/document/3/records/suggestions", params={"record_id": [1]}
+    )
+    assert response.status_code == 404
+
+
+def test_record_substitutions_from_precomputed_matches(
+    user_logged_client: TestClient, session: Session
+):
+    with session as s:
+        project_id = create_doc_with_records(s, ["Regional Effects"])
+        s.add_all(
+            [
+                TranslationMemory(
+                    name="project_mem",
+                    created_by=1,
+                    records=[
+                        TranslationMemoryRecord(source="Regional Effect", target="A"),
+                        TranslationMemoryRecord(source="Regional Affects", target="B"),
+                        TranslationMemoryRecord(source="Regions", target="C"),
+                    ],
+                ),
+                TranslationMemory(
+                    name="other_mem",
+                    created_by=1,
+                    records=[
+                        TranslationMemoryRecord(source="Regional Effects", target="D")
+                    ],
+                ),
+            ]
+        )
+        s.commit()
+        s.add(ProjectTmAssociation(project_id=project_id, tm_id=1, mode="read"))
+        s.add_all(
+            [
+                DocumentRecordMatch(record_id=1, tm_record_id=2, similarity=0.8),
+                DocumentRecordMatch(record_id=1, tm_record_id=1, similarity=0.9),
+                DocumentRecordMatch(record_id=1, tm_record_id=3, similarity=0.5),
+                DocumentRecordMatch(record_id=1, tm_record_id=4, similarity=1.0),
+            ]
+        )
+        s.query(Document).filter_by(
+            id=1
+        ).one().matches_updated_at = datetime.datetime.now(datetime.UTC)
+        s.commit()
+
+    response = user_logged_client.get("/records/1/substitutions")
+    assert response.status_code == 200
+    assert response.json() == [
+        {"source": "Regional Effect", "target": "A", "similarity": 0.9},
+        {"source": "Regional Affects", "target": "B", "similarity": 0.8},
+    ]
+
+
+def test_record_substitutions_merge_new_records_in_id_order(
+    user_logged_client: TestClient, session: Session
+):
+    with session as s:
+        project_id = create_doc_with_records(s, ["Regional Effects"])
+        matched_at = datetime.datetime.now(datetime.UTC)
+        s.add(
+            TranslationMemory(
+                name="project_mem",
+                created_by=1,
+                records=[
+                    TranslationMemoryRecord(
+                        source="Regional Effects",
+                        target="A",
+                        creation_date=matched_at + datetime.timedelta(minutes=1),
+                    ),
+                    TranslationMemoryRecord(
+                        source="Regional Effects",
+                        target="B",
+                        creation_date=matched_at - datetime.timedelta(minutes=1),
+                    ),
+                ],
+            )
+        )
+        s.commit()
+        s.add(ProjectTmAssociation(project_id=project_id, tm_id=1, mode="read"))
+        s.add(DocumentRecordMatch(record_id=1, tm_record_id=2, similarity=1.0))
+        s.query(Document).filter_by(id=1).one().matches_updated_at = matched_at
+        s.commit()
+
+    # the new record ties with the stored match, ties go by TM record ID
+    response = user_logged_client.get("/records/1/substitutions")
+    assert response.status_code == 200
+    assert response.json() == [
+        {"source": "Regional Effects", "target": "A", "similarity": 1.0},
+        {"source": "Regional Effects", "target": "B", "similarity": 1.0},
+    ]
+
+
+def test_record_repetition_group_follows_source(session: Session):
+    with session as s:
+        create_doc_with_records(s, ["Regional Effects", "User Interface"])
+        s.get_one(DocumentRecord, 2).source = "Regional Effects"
+        s.commit()
+
+        first, second = s.query(DocumentRecord).order_by(DocumentRecord.id).all()
+        assert second.repetition_group == first.repetition_group
@@ -16,10 +16,11 @@ from app.documents.models import (
     XliffRecord,
 )
 from app.models import DocumentStatus
-from app.projects.models import Project
+from app.projects.models import Project, ProjectTmAssociation
 from app.projects.query import ProjectQuery
 from app.projects.schema import ProjectCreate
 from app.schema import DocumentTask
+from app.translation_memory.models import TranslationMemory
 
 # pylint: disable=C0116
 
@@ -344,7 +345,7 @@ def test_process_creates_task_for_xliff(
     with session as s:
         tasks = s.query(DocumentTask).all()
         assert all([task.status == "pending" for task in tasks])
-        assert len(tasks) == 3
+        assert len(tasks) == 4
         assert json.loads(tasks[0].data) == {
             "document_id": 1,
             "task_data": {
@@ -352,6 +353,12 @@ def test_process_creates_task_for_xliff(
             },
         }
         assert json.loads(tasks[1].data) == {
+            "document_id": 1,
+            "task_data": {
+                "task_type": "cache_tm_matches",
+            },
+        }
+        assert json.loads(tasks[2].data) == {
             "document_id": 1,
             "task_data": {
                 "task_type": "substitute_segments",
@@ -360,7 +367,7 @@ def test_process_creates_task_for_xliff(
                 },
             },
         }
-        assert json.loads(tasks[2].data) == {
+        assert json.loads(tasks[3].data) == {
             "document_id": 1,
             "task_data": {
                 "task_type": "finalize_document",
@@ -391,7 +398,7 @@ def test_process_creates_task_for_txt(
     with session as s:
         tasks = s.query(DocumentTask).all()
         assert all([task.status == "pending" for task in tasks])
-        assert len(tasks) == 3
+        assert len(tasks) == 4
         assert json.loads(tasks[0].data) == {
             "document_id": 1,
             "task_data": {
@@ -399,6 +406,12 @@ def test_process_creates_task_for_txt(
             },
         }
         assert json.loads(tasks[1].data) == {
+            "document_id": 1,
+            "task_data": {
+                "task_type": "cache_tm_matches",
+            },
+        }
+        assert json.loads(tasks[2].data) == {
             "document_id": 1,
             "task_data": {
                 "task_type": "substitute_segments",
@@ -407,7 +420,7 @@ def test_process_creates_task_for_txt(
                 },
             },
         }
-        assert json.loads(tasks[2].data) == {
+        assert json.loads(tasks[3].data) == {
             "document_id": 1,
             "task_data": {
                 "task_type": "finalize_document",
@@ -427,6 +440,99 @@ def test_returns_404_when_processing_nonexistent_doc(
     assert response.status_code == 404
 
 
+def test_request_document_analysis(admin_logged_client: TestClient, session: Session):
+    with session as s:
+        p = ProjectQuery(s).create_project(1, ProjectCreate(name="test"))
+        s.add(
+            Document(
+                name="test_doc.txt",
+                type=DocumentType.txt,
+                processing_status=DocumentStatus.DONE.value,
+                created_by=1,
+                project_id=p.id,
+            )
+        )
+        s.commit()
+
+    response = admin_logged_client.get("/document/1/analysis")
+    assert response.status_code == 404
+
+    response = admin_logged_client.post("/document/1/analysis")
+    assert response.status_code == 200
+    response_json = response.json()
+    assert response_json["status"] == "pending"
+    assert response_json["processed_records"] == 0
+    assert response_json["bands"]["exact"] == {"segments": 0, "words": 0}
+
+    response = admin_logged_client.get("/document/1/analysis")
+    assert response.status_code == 200
+    assert response.json()["status"] == "pending"
+
+    with session as s:
+        tasks = s.query(DocumentTask).all()
+        assert [json.loads(task.data) for task in tasks] == [
+            {"document_id": 1, "task_data": {"task_type": "analyze_tm_leverage"}}
+        ]
+
+
+def test_request_document_analysis_of_unprocessed_doc(
+    admin_logged_client: TestClient, session: Session
+):
+    with session as s:
+        p = ProjectQuery(s).create_project(1, ProjectCreate(name="test"))
+        s.add(
+            Document(
+                name="test_doc.txt",
+                type=DocumentType.txt,
+                processing_status=DocumentStatus.UPLOADED.value,
+                created_by=1,
+                project_id=p.id,
+            )
+        )
+        s.commit()
+
+    response = admin_logged_client.post("/document/1/analysis")
+    assert response.status_code == 400
+    response = admin_logged_client.post("/document/2/analysis")
+    assert response.status_code == 404
+
+
+def test_flush_approved_creates_task(admin_logged_client: TestClient, session: Session):
+    with session as s:
+        p = ProjectQuery(s).create_project(1, ProjectCreate(name="test"))
+        s.add(
+            Document(
+                name="test_doc.txt",
+                type=DocumentType.txt,
+                processing_status=DocumentStatus.DONE.value,
+                created_by=1,
+                project_id=p.id,
+            )
+        )
+        s.add(TranslationMemory(name="test_mem", created_by=1))
+        s.commit()
+
+    # the project has no memory to write to
+    response = admin_logged_client.post("/document/1/flush_approved")
+    assert response.status_code == 400
+
+    with session as s:
+        s.add(ProjectTmAssociation(project_id=1, tm_id=1, mode="write"))
+        s.commit()
+
+    response = admin_logged_client.post("/document/1/flush_approved")
+    assert response.status_code == 200
+
+    with session as s:
+        tasks = s.query(DocumentTask).all()
+        assert [json.loads(task.data) for task in tasks] == [
+            {"document_id": 1, "task_data": {"task_type": "flush_approved"}}
+        ]
+
+    response = admin_logged_client.post("/document/2/flush_approved")
+    assert response.status_code == 404
+
+
 def test_download_xliff_doc(admin_logged_client: TestClient, session: Session):
     with session as s:
         ProjectQuery(s).create_project(1, ProjectCreate(name="test"))
@@ -488,6 +594,37 @@ def test_download_xliff_doc(admin_logged_client: TestClient, session: Session):
     assert "final" in data
 
 
+def test_download_xliff_doc_uses_own_segments(
+    admin_logged_client: TestClient, session: Session
+):
+    with session as s:
+        ProjectQuery(s).create_project(1, ProjectCreate(name="test"))
+
+    for _ in range(2):
+        with open("tests/fixtures/small.xliff", "rb") as fp:
+            admin_logged_client.post(
+                "/document/", files={"file": fp}, data={"project_id": "1"}
+            )
+
+    with session as s:
+        s.add_all(
+            [
+                DocumentRecord(document_id=1, source="Regional Effects", target="Один"),
+                DocumentRecord(document_id=2, source="Regional Effects", target="Два"),
+                XliffRecord(parent_id=1, segment_id=675606, document_id=1),
+                XliffRecord(parent_id=2, segment_id=675606, document_id=2),
+            ]
+        )
+        s.commit()
+
+    response = admin_logged_client.get("/document/2/download")
+    assert response.status_code == 200
+
+    data = response.read().decode("utf-8")
+    assert "Два" in data
+    assert "Один" not in data
+
+
 def test_download_txt_doc(admin_logged_client: TestClient, session: Session):
     with session as s:
         ProjectQuery(s).create_project(1, ProjectCreate(name="test"))
@@ -0,0 +1,49 @@
+from typing import cast
+
+import pytest
+from fastapi.testclient import TestClient
+from sqlalchemy.exc import OperationalError
+from sqlalchemy.exc import TimeoutError as PoolTimeoutError
+
+from app.db import MeasuredQueuePool, create_db_engine
+from app.settings import Settings
+
+
+def test_admin_can_get_db_pool_metrics(admin_logged_client: TestClient):
+    response = admin_logged_client.get("/metrics/db_pool")
+    assert response.status_code == 200
+    data = response.json()
+    assert data["size"] >= 1
+    assert data["checked_out"] >= 0
+    assert data["timeouts"] >= 0
+
+
+def test_user_cannot_get_db_pool_metrics(user_logged_client: TestClient):
+    response = user_logged_client.get("/metrics/db_pool")
+    assert response.status_code == 403
+
+
+def test_pool_counts_only_timeouts(tmp_path):
+    db_engine = create_db_engine(
+        Settings(
+            database_url=f"sqlite:///{tmp_path / 'pool.db'}",
+            db_pool_size=1,
+            db_max_overflow=0,
+            db_pool_timeout=0.01,
+        )
+    )
+    pool = cast(MeasuredQueuePool, db_engine.pool)
+    with db_engine.connect():
+        with pytest.raises(PoolTimeoutError):
+            db_engine.connect()
+    assert pool.metrics()["timeouts"] == 1
+
+    failing = create_db_engine(
+        Settings(
+            database_url=f"sqlite:///{tmp_path / 'missing' / 'pool.db'}",
+            db_pool_size=1,
+        )
+    )
+    with pytest.raises(OperationalError):
+        failing.connect()
+    assert cast(MeasuredQueuePool, failing.pool).metrics()["timeouts"] == 0
@@ -1,8 +1,17 @@
+import json
+from datetime import UTC, datetime
+
 from fastapi import status
 from fastapi.testclient import TestClient
 from sqlalchemy.orm import Session
 
-from app.documents.models import Document, DocumentRecord, DocumentType
+from app.documents.models import (
+    Document,
+    DocumentRecord,
+    DocumentTmAnalysis,
+    DocumentType,
+    TmAnalysisStatus,
+)
 from app.glossary.models import Glossary, ProcessingStatuses
 from app.glossary.query import GlossaryQuery
 from app.glossary.schema import GlossaryRecordCreate
@@ -13,6 +22,7 @@ from app.projects.models import (
 )
 from app.projects.query import ProjectQuery
 from app.projects.schema import ProjectCreate
+from app.schema import DocumentTask
 from app.translation_memory.models import TranslationMemory
 from main import app
 
@@ -27,11 +37,28 @@ def test_create_project(admin_logged_client: TestClient, session: Session):
     assert response.status_code == status.HTTP_201_CREATED
     assert response_json["name"] == expected_name
     assert response_json["created_by"] == 2
+    assert response_json["source_language"] == "en"
+    assert response_json["target_language"] == "ru"
     assert "id" in response_json
     assert "created_at" in response_json
     assert "updated_at" in response_json
 
 
+def test_create_project_with_language_pair(admin_logged_client: TestClient):
+    path = app.url_path_for("create_project")
+    response = admin_logged_client.post(
+        url=path,
+        json={"name": "Test", "source_language": "en", "target_language": "pt-BR"},
+    )
+    assert response.status_code == status.HTTP_201_CREATED
+    assert response.json()["target_language"] == "pt-br"
+
+    response = admin_logged_client.post(
+        url=path, json={"name": "Test", "target_language": "not a language"}
+    )
+    assert response.status_code == status.HTTP_422_UNPROCESSABLE_CONTENT
+
+
 def test_create_project_validation_error(admin_logged_client: TestClient):
     path = app.url_path_for("create_project")
     response = admin_logged_client.post(url=path, json={"name": ""})
@@ -679,6 +706,31 @@ def test_set_project_translation_memories(
         assert associations[1].mode.value == "write"
 
 
+def test_set_project_translation_memories_of_other_language_pair(
+    admin_logged_client: TestClient, session: Session
+):
+    with session as s:
+        s.add(
+            Project(
+                created_by=1,
+                name="Test Project",
+                source_language="en",
+                target_language="de",
+            )
+        )
+        s.add(TranslationMemory(name="en-ru.tmx", created_by=1))
+        s.commit()
+
+    response = admin_logged_client.post(
+        "/projects/1/translation_memories",
+        json={"translation_memories": [{"id": 1, "mode": "read"}]},
+    )
+    assert response.status_code == status.HTTP_400_BAD_REQUEST
+
+    with session as s:
+        assert s.query(ProjectTmAssociation).count() == 0
+
+
 def test_set_project_translation_memories_multiple(
     admin_logged_client: TestClient, session: Session
 ):
@@ -748,6 +800,59 @@ def test_set_project_translation_memories_replaces_existing(
         assert associations[0].mode.value == "write"
 
 
+def test_set_project_translation_memories_refreshes_document_matches(
+    admin_logged_client: TestClient, session: Session
+):
+    with session as s:
+        project = Project(created_by=1, name="Test Project")
+        s.add(project)
+        s.flush()
+        s.add_all(
+            [
+                TranslationMemory(name="test_tm.tmx", created_by=1),
+                Document(
+                    name="matched.txt",
+                    type=DocumentType.txt,
+                    processing_status="done",
+                    created_by=1,
+                    project_id=project.id,
+                    matches_updated_at=datetime.now(UTC),
+                ),
+                Document(
+                    name="not_matched.txt",
+                    type=DocumentType.txt,
+                    processing_status="uploaded",
+                    created_by=1,
+                    project_id=project.id,
+                ),
+            ]
+        )
+        s.commit()
+        project_id = project.id
+
+    response = admin_logged_client.post(
+        f"/projects/{project_id}/translation_memories",
+        json={"translation_memories": [{"id": 1, "mode": "read"}]},
+    )
+    assert response.status_code == status.HTTP_200_OK
+
+    with session as s:
+        assert s.query(Document).filter_by(id=1).one().matches_updated_at is None
+        tasks = s.query(DocumentTask).all()
+        assert [json.loads(task.data) for task in tasks] == [
+            {"document_id": 1, "task_data": {"task_type": "cache_tm_matches"}}
+        ]
+
+    # nothing to refresh if memories stay the same
+    response = admin_logged_client.post(
+        f"/projects/{project_id}/translation_memories",
+        json={"translation_memories": [{"id": 1, "mode": "write"}]},
+    )
+    assert response.status_code == status.HTTP_200_OK
+    with session as s:
+        assert s.query(DocumentTask).count() == 1
+
+
 def test_set_project_translation_memories_project_not_found(
     admin_logged_client: TestClient, session: Session
 ):
@@ -813,3 +918,61 @@ def test_set_project_translation_memories_multiple_writes(
         "Only one translation memory can be set to write mode"
         in response.json()["detail"]
     )
+
+
+def test_get_project_analysis_sums_finished_documents(
+    user_logged_client: TestClient, session: Session
+):
+    with session as s:
+        project = ProjectQuery(s).create_project(1, ProjectCreate(name="test"))
+        for name in ("first.txt", "second.txt", "third.txt"):
+            s.add(
+                Document(
+                    name=name,
+                    type=DocumentType.txt,
+                    processing_status="done",
+                    created_by=1,
+                    project_id=project.id,
+                )
+            )
+        s.commit()
+        s.add_all(
+            [
+                DocumentTmAnalysis(
+                    document_id=1,
+                    status=TmAnalysisStatus.done,
+                    exact_segments=2,
+                    exact_words=10,
+                    no_match_segments=1,
+                    no_match_words=3,
+                ),
+                DocumentTmAnalysis(
+                    document_id=2,
+                    status=TmAnalysisStatus.done,
+                    exact_segments=1,
+                    exact_words=4,
+                ),
+                DocumentTmAnalysis(
+                    document_id=3,
+                    status=TmAnalysisStatus.processing,
+                    exact_segments=5,
+                    exact_words=50,
+                ),
+            ]
+        )
+        s.commit()
+
+    response = user_logged_client.get("/projects/1/analysis")
+    assert response.status_code == status.HTTP_200_OK
+    response_json = response.json()
+    assert [doc["status"] for doc in response_json["documents"]] == [
+        "done",
+        "done",
+        "processing",
+    ]
+    assert response_json["bands"]["exact"] == {"segments": 3, "words": 14}
+    assert response_json["bands"]["no_match"] == {"segments": 1, "words": 3}
+    assert response_json["bands"]["repetitions"] == {"segments": 0, "words": 0}
+
+    response = user_logged_client.get("/projects/999/analysis")
+    assert response.status_code == status.HTTP_404_NOT_FOUND
@@ -4,6 +4,7 @@ import json
 from datetime import UTC, datetime, timedelta
 from time import sleep
 
+import pytest
 from fastapi.testclient import TestClient
 from sqlalchemy.orm import Session
 
@@ -14,9 +15,11 @@ from app.documents.models import (
     DocumentRecordHistoryChangeType,
     DocumentType,
 )
-from app.documents.utils import apply_diff, compute_diff
+from app.documents.schema import DocumentRecordUpdate
+from app.documents.utils import apply_diff, compute_diff, reconstruct_from_diffs
 from app.projects.query import ProjectQuery
 from app.projects.schema import ProjectCreate
+from app.services.record_service import HISTORY_SNAPSHOT_INTERVAL, RecordService
 
 
 def test_get_segment_history_empty(user_logged_client: TestClient, session: Session):
@@ -121,6 +124,107 @@ def test_get_segment_history_404_for_nonexistent_record(
     assert response.status_code == 404
 
 
+def create_records_with_history(session: Session):
+    with session as s:
+        p = ProjectQuery(s).create_project(1, ProjectCreate(name="test"))
+        records = [
+            DocumentRecord(source="Hello", target="Привет"),
+            DocumentRecord(source="World", target="Мир"),
+            DocumentRecord(source="Bye", target=""),
+        ]
+        s.add(
+            Document(
+                name="test_doc.txt",
+                type=DocumentType.txt,
+                records=records,
+                processing_status="pending",
+                created_by=1,
+                project_id=p.id,
+            )
+        )
+        s.flush()
+
+        for record in records[:2]:
+            s.add_all(
+                [
+                    DocumentRecordHistory(
+                        record_id=record.id,
+                        diff=compute_diff("", record.target),
+                        change_type=DocumentRecordHistoryChangeType.initial_import,
+                        timestamp=datetime.now(UTC) - timedelta(minutes=5),
+                    ),
+                    DocumentRecordHistory(
+                        record_id=record.id,
+                        diff=compute_diff(record.target, record.target + "!"),
+                        author_id=1,
+                        change_type=DocumentRecordHistoryChangeType.manual_edit,
+                    ),
+                ]
+            )
+        s.commit()
+
+
+def test_get_records_history(user_logged_client: TestClient, session: Session):
+    create_records_with_history(session)
+
+    response = user_logged_client.get(
+        "/records/history", params={"record_id": [3, 2, 1, 2]}
+    )
+    assert response.status_code == 200
+    records = response.json()["records"]
+    assert [record["record_id"] for record in records] == [3, 2, 1]
+    assert records[0]["history"] == []
+    for record in records[1:]:
+        assert [entry["change_type"] for entry in record["history"]] == [
+            "manual_edit",
+            "initial_import",
+        ]
+        assert record["history"][0]["author"]["username"] == "test"
+        assert record["history"][1]["author"] is None
+
+    assert (
+        reconstruct_from_diffs(
+            entry["diff"] for entry in reversed(records[1]["history"])
+        )
+        == "Мир!"
+    )
+
+
+def test_get_records_history_404_for_nonexistent_record(
+    user_logged_client: TestClient, session: Session
+):
+    create_records_with_history(session)
+
+    response = user_logged_client.get(
+        "/records/history", params={"record_id": [1, 999]}
+    )
+    assert response.status_code == 404
+
+
+def test_get_records_history_requires_ids(user_logged_client: TestClient):
+    response = user_logged_client.get("/records/history")
+    assert response.status_code == 422
+
+
+def test_get_doc_records_history(user_logged_client: TestClient, session: Session):
+    create_records_with_history(session)
+
+    response = user_logged_client.get("/document/1/records/history")
+    assert response.status_code == 200
+    records = response.json()["records"]
+    assert [record["record_id"] for record in records] == [1, 2, 3]
+    assert [len(record["history"]) for record in records] == [2, 2, 0]
+
+    response = user_logged_client.get(
+        "/document/1/records/history", params={"after_id": 1, "source": "Bye"}
+    )
+    assert response.status_code == 200
+    assert [record["record_id"] for record in response.json()["records"]] == [3]
+
+    response = user_logged_client.get("/document/2/records/history")
+    assert response.status_code == 404
+
+
 def test_update_record_creates_history(
     user_logged_client: TestClient, session: Session
 ):
@@ -221,6 +325,47 @@ def test_update_record_with_repetitions_creates_history(
         assert history == []
 
 
+def test_repeated_repetition_updates_merge_history(
+    user_logged_client: TestClient, session: Session
+):
+    with session as s:
+        p = ProjectQuery(s).create_project(1, ProjectCreate(name="test"))
+        s.add(
+            Document(
+                name="test_doc.txt",
+                type=DocumentType.txt,
+                records=[
+                    DocumentRecord(source="Hello World", target="") for _ in range(5)
+                ],
+                processing_status="pending",
+                created_by=1,
+                project_id=p.id,
+            )
+        )
+        s.commit()
+
+    for target in ("First", "Second"):
+        response = user_logged_client.put(
+            "/records/1",
+            json={"target": target, "approved": True, "update_repetitions": True},
+        )
+        assert response.status_code == 200
+
+    with session as s:
+        for record_id in range(2, 6):
+            record = s.query(DocumentRecord).filter_by(id=record_id).one()
+            assert record.target == "Second"
+            assert record.approved is True
+
+            history = (
+                s.query(DocumentRecordHistory)
+                .filter(DocumentRecordHistory.record_id == record_id)
+                .one()
+            )
+            assert history.change_type == DocumentRecordHistoryChangeType.repetition
+            assert apply_diff("", history.diff) == "Second"
+
+
 def test_update_same_type_updates_in_place(
     user_logged_client: TestClient, session: Session
 ):
@@ -721,3 +866,96 @@ def test_merge_diffs_with_multiple_history_records(
         # Apply the diff to the original text should give us the final text
         result = apply_diff("Replacement", history[0].diff)
         assert result == "Hello World!"
+
+
+def test_history_snapshots_bound_reconstruction(session: Session):
+    with session as s:
+        p = ProjectQuery(s).create_project(1, ProjectCreate(name="test"))
+        s.add(
+            Document(
+                name="test_doc.txt",
+                type=DocumentType.txt,
+                records=[DocumentRecord(source="Hello World", target="")],
+                processing_status="pending",
+                created_by=1,
+                project_id=p.id,
+            )
+        )
+        s.commit()
+
+        # alternate change types so every edit creates a new history entry
+        service = RecordService(s)
+        texts = [f"Edit number {i}" for i in range(3 * HISTORY_SNAPSHOT_INTERVAL)]
+        old_text = ""
+        for i, text in enumerate(texts):
+            change_type = (
+                DocumentRecordHistoryChangeType.manual_edit
+                if i % 2
+                else DocumentRecordHistoryChangeType.machine_translation
+            )
+            service.track_history([(1, old_text, text)], 1, change_type)
+            old_text = text
+
+        history = (
+            s.query(DocumentRecordHistory)
+            .filter(DocumentRecordHistory.record_id == 1)
+            .order_by(DocumentRecordHistory.id)
+            .all()
+        )
+        assert len(history) == len(texts)
+        since_snapshot = 0
+        for entry, text in zip(history, texts):
+            since_snapshot = 0 if entry.snapshot is not None else since_snapshot + 1
+            assert since_snapshot < HISTORY_SNAPSHOT_INTERVAL
+            if entry.snapshot is not None:
+                assert entry.snapshot == text
+
+        # merge into the latest entry uses the nearest snapshot
+        service.track_history(
+            [(1, texts[-1], "Final text")],
+            1,
+            DocumentRecordHistoryChangeType.manual_edit,
+        )
+        s.expire_all()
+        history = (
+            s.query(DocumentRecordHistory)
+            .filter(DocumentRecordHistory.record_id == 1)
+            .order_by(DocumentRecordHistory.id)
+            .all()
+        )
+        assert len(history) == len(texts)
+        assert apply_diff(texts[-2], history[-1].diff) == "Final text"
+        assert reconstruct_from_diffs(entry.diff for entry in history) == "Final text"
+
+
+def test_update_is_not_committed_without_history(session: Session, monkeypatch):
+    with session as s:
+        p = ProjectQuery(s).create_project(1, ProjectCreate(name="test"))
+        s.add(
+            Document(
+                name="test_doc.txt",
+                type=DocumentType.txt,
+                records=[DocumentRecord(source="Hello World", target="Old")],
+                processing_status="pending",
+                created_by=1,
+                project_id=p.id,
+            )
+        )
+        s.commit()
+
+        def fail(*_args):
+            raise RuntimeError("history failed")
+
+        monkeypatch.setattr(RecordService, "track_history", fail)
+        with pytest.raises(RuntimeError):
+            RecordService(s).update_record(
+                1,
+                DocumentRecordUpdate(
+                    target="New", approved=True, update_repetitions=False
+                ),
+                1,
+                DocumentRecordHistoryChangeType.manual_edit,
+            )
+        s.rollback()
+
+        assert s.query(DocumentRecord).one().target == "Old"
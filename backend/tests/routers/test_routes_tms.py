@@ -1,9 +1,12 @@
 from datetime import datetime
 
+import pytest
 from fastapi.testclient import TestClient
 from sqlalchemy.orm import Session
 
+from app.settings import settings
 from app.translation_memory.models import TranslationMemory, TranslationMemoryRecord
+from app.translation_memory.utils import source_hash
 
 # pylint: disable=C0116
 
@@ -21,15 +24,42 @@ def test_can_return_list_of_tm_docs(user_logged_client: TestClient, session: Ses
             "id": 1,
             "name": "first_doc.tmx",
             "created_by": 1,
+            "source_language": "en",
+            "target_language": "ru",
         },
         {
             "id": 2,
             "name": "another_doc.tmx",
             "created_by": 1,
+            "source_language": "en",
+            "target_language": "ru",
         },
     ]
 
 
+def test_can_filter_tm_docs_by_language_pair(
+    user_logged_client: TestClient, session: Session
+):
+    with session as s:
+        s.add(TranslationMemory(name="en-ru.tmx", created_by=1))
+        s.add(
+            TranslationMemory(
+                name="en-de.tmx",
+                created_by=1,
+                source_language="en",
+                target_language="de",
+            )
+        )
+        s.commit()
+
+    response = user_logged_client.get(
+        "/translation_memory/",
+        params={"source_language": "en", "target_language": "de"},
+    )
+    assert response.status_code == 200
+    assert [tm["name"] for tm in response.json()] == ["en-de.tmx"]
+
+
 def test_can_get_tm_file(user_logged_client: TestClient, session: Session):
     tm_records = [
         TranslationMemoryRecord(source="Regional Effects", target="Translation"),
@@ -44,6 +74,8 @@ def test_can_get_tm_file(user_logged_client: TestClient, session: Session):
         "id": 1,
         "name": "test_doc.tmx",
         "created_by": 1,
+        "source_language": "en",
+        "target_language": "ru",
         "records_count": 2,
     }
 
@@ -70,6 +102,8 @@ def test_can_get_tm_records(user_logged_client: TestClient, session: Session):
         ],
         "page": 0,
         "total_records": 2,
+        "total_is_estimate": False,
+        "next_after_id": None,
     }
 
 
@@ -95,6 +129,46 @@ def test_can_get_tm_records_with_page(user_logged_client: TestClient, session: S
     assert json["records"][0] == {"id": 101, "source": "line100", "target": "line100"}
 
 
+def test_can_get_tm_records_after_id(
+    user_logged_client: TestClient, session: Session, monkeypatch
+):
+    monkeypatch.setattr("app.base.query.COUNT_CAP", 120)
+    with session as s:
+        s.add(
+            TranslationMemory(
+                name="test_doc.tmx",
+                records=[
+                    TranslationMemoryRecord(source=f"Source {i}", target=f"Target {i}")
+                    for i in range(150)
+                ],
+                created_by=1,
+            )
+        )
+        s.commit()
+
+    response = user_logged_client.get(
+        "/translation_memory/1/records", params={"count_mode": "capped"}
+    )
+    assert response.status_code == 200
+    json = response.json()
+    assert len(json["records"]) == 100
+    assert json["total_records"] == 120
+    assert json["total_is_estimate"]
+    assert json["next_after_id"] == 100
+
+    response = user_logged_client.get(
+        "/translation_memory/1/records",
+        params={"after_id": 100, "query": "Source 1", "count_mode": "estimate"},
+    )
+    json = response.json()
+    # Source 1, Source 10-19 and Source 100-149, estimates are counted in SQLite
+    assert [r["id"] for r in json["records"]] == list(range(101, 151))
+    assert json["page"] is None
+    assert json["total_records"] == 61
+    assert not json["total_is_estimate"]
+    assert json["next_after_id"] is None
+
+
 def test_tm_records_are_empty_for_too_large_page(
     user_logged_client: TestClient, session: Session
 ):
@@ -173,6 +247,52 @@ def test_search_no_results(user_logged_client: TestClient, session: Session):
     assert len(results) == 0
 
 
+def test_tm_records_similar(user_logged_client: TestClient, session: Session):
+    tm_records = [
+        TranslationMemoryRecord(source="Hello world", target="Hola mundo"),
+        TranslationMemoryRecord(source="Hello worlds", target="Hola mundos"),
+        TranslationMemoryRecord(source="Welcome home", target="Bienvenido a casa"),
+    ]
+    with session as s:
+        s.add(TranslationMemory(name="test_doc.tmx", records=tm_records, created_by=1))
+        s.commit()
+
+    response = user_logged_client.get(
+        "/translation_memory/1/records/similar", params={"query": "hello world"}
+    )
+    assert response.status_code == 200
+    records = response.json()["records"]
+    assert [(r["id"], r["similarity"]) for r in records] == [
+        (1, 1.0),
+        (2, pytest.approx(11 / 14)),
+    ]
+
+    # records added after the memory was indexed are found too
+    with session as s:
+        s.add(
+            TranslationMemoryRecord(document_id=1, source="hello, world!", target="!")
+        )
+        s.commit()
+    response = user_logged_client.get(
+        "/translation_memory/1/records/similar", params={"query": "hello world"}
+    )
+    assert [(r["id"], r["similarity"]) for r in response.json()["records"]][:2] == [
+        (1, 1.0),
+        (4, 1.0),
+    ]
+
+
+def test_build_tm_index_needs_index_files(admin_logged_client: TestClient, session):
+    with session as s:
+        s.add(TranslationMemory(name="test_doc.tmx", created_by=1))
+        s.commit()
+
+    response = admin_logged_client.post("/translation_memory/1/build_index")
+    assert response.status_code == 400
+    response = admin_logged_client.post("/translation_memory/2/build_index")
+    assert response.status_code == 404
+
+
 def test_tm_records_returns_404_for_nonexistent_document(
     user_logged_client: TestClient,
 ):
@@ -223,6 +343,270 @@ def test_can_upload_tm(admin_logged_client: TestClient, session: Session):
         assert "Handbook" in doc.records[0].source
         assert doc.records[0].creation_date == datetime(2022, 7, 3, 7, 59, 19)
         assert doc.records[0].change_date == datetime(2022, 7, 3, 7, 59, 20)
+        assert doc.records[0].source_hash == source_hash(doc.records[0].source)
+
+
+def make_tmx(units: list[tuple[str, str, str]]) -> bytes:
+    tus = "".join(
+        f"""
+    <tu changedate="{change_date}">
+      <tuv xml:lang="en"><seg>{source}</seg></tuv>
+      <tuv xml:lang="ru"><seg>{target}</seg></tuv>
+    </tu>"""
+        for source, target, change_date in units
+    )
+    return f"""<?xml version="1.0" encoding="utf-8"?>
+<tmx version="1.4">
+  <header srclang="en" datatype="plaintext"/>
+  <body>{tus}
+  </body>
+</tmx>""".encode()
+
+
+@pytest.mark.parametrize(
+    "deduplication, expected",
+    [
+        ("newest", [("Hello world", "B"), ("Bye", "C")]),
+        (
+            "all_variants",
+            [
+                ("Hello  world", "A"),
+                ("Hello world", "B"),
+                ("Hello world", "Old B"),
+                ("Bye", "C"),
+            ],
+        ),
+    ],
+)
+def test_upload_tm_drops_duplicates(
+    admin_logged_client: TestClient,
+    session: Session,
+    deduplication: str,
+    expected: list[tuple[str, str]],
+):
+    content = make_tmx(
+        [
+            ("Hello  world", "A", "20220703T075920Z"),
+            ("Hello world", "B", "20230703T075920Z"),
+            ("Hello world", "Old B", "20210703T075920Z"),
+            ("Bye", "C", "20220703T075920Z"),
+        ]
+    )
+    response = admin_logged_client.post(
+        "/translation_memory/upload",
+        params={"deduplication": deduplication},
+        files={"file": ("test.tmx", content)},
+    )
+    assert response.status_code == 200
+
+    with session as s:
+        records = (
+            s.query(TranslationMemoryRecord).order_by(TranslationMemoryRecord.id).all()
+        )
+        assert sorted((r.source, r.target) for r in records) == sorted(expected)
+
+
+def test_can_append_tm_file(admin_logged_client: TestClient, session: Session):
+    with session as s:
+        s.add(
+            TranslationMemory(
+                name="test",
+                created_by=1,
+                records=[
+                    TranslationMemoryRecord(
+                        source="Hello world",
+                        target="Old",
+                        creation_date=datetime(2000, 1, 1),
+                        change_date=datetime(2000, 1, 1),
+                    ),
+                    TranslationMemoryRecord(
+                        source="Newer in memory",
+                        target="Kept",
+                        creation_date=datetime(2030, 1, 1),
+                        change_date=datetime(2030, 1, 1),
+                    ),
+                    TranslationMemoryRecord(source="Same", target="S"),
+                ],
+            )
+        )
+        s.commit()
+
+    content = make_tmx(
+        [
+            ("Hello world", "New", "20220703T075920Z"),
+            ("Newer in memory", "Ignored", "20220703T075920Z"),
+            ("Same", "S", "20220703T075920Z"),
+            ("Added", "A", "20220703T075920Z"),
+            ("Added", "A", "20210703T075920Z"),
+        ]
+    )
+    response = admin_logged_client.post(
+        "/translation_memory/1/upload", files={"file": ("test.tmx", content)}
+    )
+    assert response.status_code == 200
+    assert response.json() == {"inserted": 1, "updated": 1, "skipped": 3}
+
+    with session as s:
+        records = (
+            s.query(TranslationMemoryRecord).order_by(TranslationMemoryRecord.id).all()
+        )
+        assert [(r.source, r.target) for r in records] == [
+            ("Hello world", "New"),
+            ("Newer in memory", "Kept"),
+            ("Same", "S"),
+            ("Added", "A"),
+        ]
+        assert records[0].creation_date == datetime(2000, 1, 1)
+        assert records[0].change_date == datetime(2022, 7, 3, 7, 59, 20)
+
+
+def test_can_append_tm_file_keeping_variants(
+    admin_logged_client: TestClient, session: Session
+):
+    with session as s:
+        s.add(
+            TranslationMemory(
+                name="test",
+                created_by=1,
+                records=[TranslationMemoryRecord(source="Hello world", target="A")],
+            )
+        )
+        s.commit()
+
+    content = make_tmx(
+        [
+            ("Hello world", "A", "20220703T075920Z"),
+            ("Hello world", "B", "20220703T075920Z"),
+            ("Hello world", "B", "20210703T075920Z"),
+        ]
+    )
+    response = admin_logged_client.post(
+        "/translation_memory/1/upload",
+        params={"deduplication": "all_variants"},
+        files={"file": ("test.tmx", content)},
+    )
+    assert response.status_code == 200
+    assert response.json() == {"inserted": 1, "updated": 0, "skipped": 2}
+
+    with session as s:
+        records = (
+            s.query(TranslationMemoryRecord).order_by(TranslationMemoryRecord.id).all()
+        )
+        assert [(r.source, r.target) for r in records] == [
+            ("Hello world", "A"),
+            ("Hello world", "B"),
+        ]
+
+
+def test_append_tm_file_returns_404_for_nonexistent_tm(
+    admin_logged_client: TestClient,
+):
+    response = admin_logged_client.post(
+        "/translation_memory/1/upload",
+        files={
+            "file": ("test.tmx", make_tmx([("Hello", "Привет", "20220703T075920Z")]))
+        },
+    )
+    assert response.status_code == 404
+
+
+def test_can_upload_multilingual_tm(admin_logged_client: TestClient, session: Session):
+    content = b"""<?xml version="1.0" encoding="utf-8"?>
+<tmx version="1.4">
+  <header srclang="en" datatype="plaintext"/>
+  <body>
+    <tu>
+      <tuv xml:lang="en"><seg>Hello</seg></tuv>
+      <tuv xml:lang="de"><seg>Hallo</seg></tuv>
+      <tuv xml:lang="fr"><seg>Bonjour</seg></tuv>
+    </tu>
+    <tu>
+      <tuv xml:lang="en"><seg>Bye</seg></tuv>
+      <tuv xml:lang="de"><seg>Tschuss</seg></tuv>
+    </tu>
+  </body>
+</tmx>"""
+    response = admin_logged_client.post(
+        "/translation_memory/upload_multilingual",
+        files={"file": ("multi.tmx", content)},
+    )
+    assert response.status_code == 200
+    assert [
+        (tm["name"], tm["source_language"], tm["target_language"])
+        for tm in response.json()
+    ] == [("multi.tmx (en-de)", "en", "de"), ("multi.tmx (en-fr)", "en", "fr")]
+
+    with session as s:
+        records = (
+            s.query(TranslationMemoryRecord).order_by(TranslationMemoryRecord.id).all()
+        )
+        assert [(r.document_id, r.source, r.target) for r in records] == [
+            (1, "Hello", "Hallo"),
+            (1, "Bye", "Tschuss"),
+            (2, "Hello", "Bonjour"),
+        ]
+
+    response = admin_logged_client.get("/translation_memory/2/download")
+    assert response.status_code == 200
+    assert b'<tuv xml:lang="fr"><seg>Bonjour</seg></tuv>' in response.content
+
+
+def test_can_append_multilingual_tm_to_its_memory(
+    admin_logged_client: TestClient, session: Session
+):
+    content = b"""<?xml version="1.0" encoding="utf-8"?>
+<tmx version="1.4">
+  <header srclang="en-US" datatype="plaintext"/>
+  <body>
+    <tu>
+      <tuv xml:lang="en-US"><seg>Hello</seg></tuv>
+      <tuv xml:lang="de-DE"><seg>Hallo</seg></tuv>
+      <tuv xml:lang="fr-FR"><seg>Bonjour</seg></tuv>
+    </tu>
+    <tu>
+      <tuv xml:lang="en-US"><seg>Bye</seg></tuv>
+      <tuv xml:lang="de-DE"><seg>Tschuss</seg></tuv>
+    </tu>
+  </body>
+</tmx>"""
+    response = admin_logged_client.post(
+        "/translation_memory/upload_multilingual",
+        files={"file": ("multi.tmx", content)},
+    )
+    assert response.status_code == 200
+
+    # the unit without fr-FR is skipped
+    response = admin_logged_client.post(
+        "/translation_memory/2/upload", files={"file": ("multi.tmx", content)}
+    )
+    assert response.status_code == 200
+    assert response.json() == {"inserted": 0, "updated": 0, "skipped": 1}
+
+
+def test_can_upload_tm_of_language_pair(
+    admin_logged_client: TestClient, session: Session
+):
+    content = b"""<?xml version="1.0" encoding="utf-8"?>
+<tmx version="1.4">
+  <header srclang="en" datatype="plaintext"/>
+  <body>
+    <tu>
+      <tuv xml:lang="en"><seg>Hello</seg></tuv>
+      <tuv xml:lang="de"><seg>Hallo</seg></tuv>
+    </tu>
+  </body>
+</tmx>"""
+    response = admin_logged_client.post(
+        "/translation_memory/upload",
+        params={"source_language": "en", "target_language": "DE"},
+        files={"file": ("test.tmx", content)},
+    )
+    assert response.status_code == 200
+    assert response.json()["target_language"] == "de"
+
+    with session as s:
+        record = s.query(TranslationMemoryRecord).one()
+        assert (record.source, record.target) == ("Hello", "Hallo")
 
 
 def test_shows_422_when_no_file_uploaded(admin_logged_client: TestClient):
@@ -267,3 +651,53 @@ def test_can_download_document(admin_logged_client: TestClient, session: Session
 def test_download_returns_404_for_non_existing_tm(admin_logged_client: TestClient):
     response = admin_logged_client.get("/translation_memory/999/download")
     assert response.status_code == 404
+
+
+def test_tm_records_similar_semantic(
+    user_logged_client: TestClient, session: Session, monkeypatch
+):
+    tm_records = [
+        TranslationMemoryRecord(source="Hello world", target="Hola mundo"),
+        TranslationMemoryRecord(source="World, hello", target="Mundo, hola"),
+        TranslationMemoryRecord(source="Welcome home", target="Bienvenido a casa"),
+    ]
+    with session as s:
+        s.add(TranslationMemory(name="test_doc.tmx", records=tm_records, created_by=1))
+        s.commit()
+
+    params = {"query": "hello world", "mode": "semantic"}
+    response = user_logged_client.get(
+        "/translation_memory/1/records/similar", params=params
+    )
+    assert response.status_code == 400
+
+    monkeypatch.setattr(settings, "semantic_search", True)
+    response = user_logged_client.get(
+        "/translation_memory/1/records/similar", params=params
+    )
+    assert response.status_code == 200
+    records = response.json()["records"]
+    # word order does not matter to embeddings
+    assert [(r["id"], r["similarity"]) for r in records][:2] == [
+        (1, pytest.approx(1.0)),
+        (2, pytest.approx(1.0)),
+    ]
+
+    response = user_logged_client.get(
+        "/translation_memory/1/records/similar",
+        params={"query": "hello world", "mode": "hybrid"},
+    )
+    records = response.json()["records"]
+    # trigram similarity of the reordered sentence is 1 as well
+    assert [(r["id"], r["similarity"]) for r in records][:2] == [
+        (1, pytest.approx(1.0)),
+        (2, pytest.approx(1.0)),
+    ]
+
+    monkeypatch.setattr(settings, "semantic_search_weight", 0.0)
+    response = user_logged_client.get(
+        "/translation_memory/1/records/similar",
+        params={"query": "hello worlds", "mode": "hybrid"},
+    )
+    records = response.json()["records"]
+    assert records[0]["similarity"] == pytest.approx(11 / 14)
@@ -7,6 +7,8 @@ from sqlalchemy.orm import Session
 
 from app.api_token.models import ApiToken
 from app.schema import User
+from app.settings import settings
+from app.user import auth_cache
 
 
 def _seed_users(session: Session):
@@ -126,3 +128,61 @@ class TestBearerTokenAuth:
                 select(ApiToken).where(ApiToken.token_hash == token_hash)
             ).scalar_one()
             assert result.last_used_at is not None
+
+    def test_last_used_at_written_once_per_interval(
+        self, fastapi_client: TestClient, session: Session
+    ):
+        fastapi_client.cookies.clear()
+        _seed_users(session)
+        raw_token = _create_token_in_db(session, user_id=2)
+        headers = {"Authorization": f"Bearer {raw_token}"}
+
+        assert fastapi_client.get("/api_tokens/", headers=headers).status_code == 200
+        with session as s:
+            first_used_at = s.execute(select(ApiToken.last_used_at)).scalar_one()
+
+        assert fastapi_client.get("/api_tokens/", headers=headers).status_code == 200
+        with session as s:
+            assert s.execute(select(ApiToken.last_used_at)).scalar_one() == (
+                first_used_at
+            )
+
+    def test_deleted_token_rejected(self, fastapi_client: TestClient, session: Session):
+        fastapi_client.cookies.clear()
+        _seed_users(session)
+        raw_token = _create_token_in_db(session, user_id=2)
+        headers = {"Authorization": f"Bearer {raw_token}"}
+
+        assert fastapi_client.get("/api_tokens/", headers=headers).status_code == 200
+        response = fastapi_client.delete("/api_tokens/1", headers=headers)
+        assert response.status_code == 200
+
+        assert fastapi_client.get("/api_tokens/", headers=headers).status_code == 401
+
+    def test_role_change_applied(self, fastapi_client: TestClient, session: Session):
+        fastapi_client.cookies.clear()
+        _seed_users(session)
+        raw_token = _create_token_in_db(session, user_id=2)
+        headers = {"Authorization": f"Bearer {raw_token}"}
+
+        assert fastapi_client.get("/api_tokens/", headers=headers).status_code == 200
+        response = fastapi_client.post(
+            "/users/2",
+            headers=headers,
+            json={
+                "username": "test-admin",
+                "email": "admin@test.com",
+                "role": "user",
+                "disabled": False,
+            },
+        )
+        assert response.status_code == 200
+
+        assert fastapi_client.get("/api_tokens/", headers=headers).status_code == 403
+
+
+def test_token_touches_are_bounded(session: Session):
+    tokens = range(settings.auth_cache_size + 10)
+    assert all(auth_cache.should_touch_token(token_id) for token_id in tokens)
+    assert not auth_cache.should_touch_token(tokens[-1])
+    assert len(auth_cache._token_touches) == settings.auth_cache_size
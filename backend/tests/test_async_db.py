@@ -0,0 +1,120 @@
+import threading
+
+import pytest
+from fastapi.testclient import TestClient
+from sqlalchemy import create_engine, func, select
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker, create_async_engine
+from sqlalchemy.orm import Session
+
+from app import db as app_db
+from app.db import Base, DbRunner, get_async_db, run_cpu_bound
+from app.documents.models import Document, DocumentRecord, DocumentType, TmMode
+from app.projects.query import ProjectQuery
+from app.projects.schema import ProjectCreate
+from app.translation_memory.models import TranslationMemory, TranslationMemoryRecord
+from main import app
+
+
+@pytest.fixture()
+def async_sessions(tmp_path):
+    """Sessions of a file database, seeded through a sync engine."""
+    path = tmp_path / "async.db"
+    sync_engine = create_engine(f"sqlite:///{path}")
+    Base.metadata.create_all(bind=sync_engine)
+    with Session(sync_engine, autoflush=False) as s:
+        project = ProjectQuery(s).create_project(1, ProjectCreate(name="test"))
+        s.add(
+            Document(
+                name="async.txt",
+                type=DocumentType.txt,
+                records=[DocumentRecord(source="Async", target="Асинхронно")],
+                processing_status="done",
+                created_by=1,
+                project_id=project.id,
+            )
+        )
+        memory = TranslationMemory(
+            name="async",
+            records=[TranslationMemoryRecord(source="Async", target="Асинхронно")],
+            created_by=1,
+        )
+        s.add(memory)
+        s.commit()
+        ProjectQuery(s).set_project_translation_memories(
+            project, [(memory, TmMode.read)]
+        )
+    sync_engine.dispose()
+
+    async_engine = create_async_engine(f"sqlite+aiosqlite:///{path}")
+    yield async_sessionmaker(async_engine, autoflush=False, expire_on_commit=False)
+
+
+async def test_async_db_is_optional():
+    sessions = [db async for db in get_async_db()]
+    assert sessions == [None]
+
+
+async def test_async_db_yields_session(async_sessions, monkeypatch):
+    monkeypatch.setattr(app_db, "AsyncSessionLocal", async_sessions)
+    sessions = [db async for db in get_async_db()]
+    assert len(sessions) == 1
+    assert isinstance(sessions[0], AsyncSession)
+
+
+async def test_runner_uses_async_session(async_sessions):
+    async with async_sessions() as async_db:
+        # the sync session would fail if it were used
+        runner = DbRunner(None, async_db)  # type: ignore[arg-type]
+        count = await runner.run(
+            lambda session: session.execute(
+                select(func.count()).select_from(DocumentRecord)
+            ).scalar_one()
+        )
+    assert count == 1
+
+
+async def test_cpu_bound_code_runs_off_event_loop(async_sessions):
+    def cpu_bound():
+        return threading.get_ident()
+
+    async with async_sessions() as async_db:
+        runner = DbRunner(None, async_db)  # type: ignore[arg-type]
+        thread = await runner.run(lambda session: run_cpu_bound(cpu_bound))
+    assert thread != threading.get_ident()
+    # sync code calls it directly, it runs in the threadpool already
+    assert run_cpu_bound(cpu_bound) == threading.get_ident()
+
+
+@pytest.fixture()
+def async_db_override(async_sessions):
+    async def override_get_async_db():
+        async with async_sessions() as async_db:
+            yield async_db
+
+    app.dependency_overrides[get_async_db] = override_get_async_db
+    yield
+    del app.dependency_overrides[get_async_db]
+
+
+@pytest.mark.usefixtures("async_db_override")
+def test_records_are_read_from_async_db(user_logged_client: TestClient):
+    response = user_logged_client.get("/document/1/records")
+    assert response.status_code == 200
+    # the document exists in the async database only
+    assert [record["source"] for record in response.json()["records"]] == ["Async"]
+
+
+@pytest.mark.usefixtures("async_db_override")
+def test_suggestions_are_read_from_async_db(user_logged_client: TestClient):
+    response = user_logged_client.get("/records/1/substitutions")
+    assert response.status_code == 200
+    assert response.json() == [
+        {"source": "Async", "target": "Асинхронно", "similarity": 1.0}
+    ]
+
+    response = user_logged_client.get("/document/1/records/suggestions?record_id=1")
+    assert response.status_code == 200
+
+    response = user_logged_client.get("/projects/1/tm_search?query=Async")
+    assert response.status_code == 200
+    assert [record["source"] for record in response.json()["records"]] == ["Async"]
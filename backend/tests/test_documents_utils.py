@@ -4,7 +4,19 @@ import json
 
 import pytest
 
-from app.documents.utils import apply_diff, compute_diff
+from app.documents.diff import DIFF_ENGINES, MYERS_MAX_COST, word_opcodes
+from app.documents.utils import (
+    apply_diff,
+    compress_document,
+    compute_diff,
+    compute_encoded_diff,
+    decode_diff,
+    decompress_document,
+    encode_diff,
+    encode_text_diff,
+    iter_decompressed,
+    repetition_group,
+)
 
 
 class TestComputeDiff:
@@ -284,3 +296,149 @@ class TestApplyDiff:
         # Verify reconstruction works
         reconstructed = apply_diff(old, diff)
         assert reconstructed == new
+
+
+class TestDiffEngines:
+    """Tests for pluggable diff engines."""
+
+    @pytest.mark.parametrize("engine", DIFF_ENGINES)
+    @pytest.mark.parametrize(
+        "old,new",
+        [
+            ("", ""),
+            ("", "Hello"),
+            ("Hello", ""),
+            ("Hello World", "Hello World"),
+            ("The quick brown fox", "A quick red fox!"),
+            ("Привет, мир!", "Привет, дорогой мир!"),
+            ("Line 1\nLine 2\n" * 50, "Line 1\nLine 3\n" * 50),
+        ],
+    )
+    def test_roundtrip(self, engine, old, new):
+        """Test that every engine produces diffs apply_diff understands."""
+        diff = compute_diff(old, new, engine)
+
+        assert apply_diff(old, diff) == new
+        assert apply_diff(old, compute_encoded_diff(old, new, engine)) == new
+
+    @pytest.mark.parametrize("engine", ["char", "word"])
+    def test_common_prefix_and_suffix(self, engine):
+        """Test that unchanged start and end of a segment stay equal ops."""
+        old = "Start of a segment. Middle. End of a segment."
+        new = "Start of a segment. Top. End of a segment."
+
+        ops = json.loads(compute_diff(old, new, engine))["ops"]
+
+        assert ops[0] == ["equal", 0, 20]
+        assert ops[-1] == ["equal", 26, len(old)]
+
+    def test_word_level(self):
+        """Test that the word engine replaces whole words."""
+        assert word_opcodes("Hello big world", "Hello small world") == [
+            ("equal", 0, 6, 0, 6),
+            ("replace", 6, 9, 6, 11),
+            ("equal", 9, 15, 11, 17),
+        ]
+
+    def test_rewrite_over_cost_limit(self):
+        """Test that texts too different to match are replaced as a whole."""
+        old = "ab" * MYERS_MAX_COST
+        new = "cd" * MYERS_MAX_COST
+
+        ops = json.loads(compute_diff(old, new, "char"))["ops"]
+
+        assert ops == [["replace", 0, len(old), new]]
+
+
+class TestEncodedDiff:
+    """Tests for the binary diff format."""
+
+    @pytest.mark.parametrize(
+        "old,new",
+        [
+            ("", ""),
+            ("", "Hello"),
+            ("Hello", ""),
+            ("Hello World", "Hello Python"),
+            ("Привет, мир!", "Привет, дорогой мир! 👋"),
+            ("Line 1\nLine 2\n" * 50, "Line 1\nLine 3\n" * 50),
+        ],
+    )
+    def test_roundtrip(self, old, new):
+        """Test that encoded diffs apply and convert back to the same JSON."""
+        json_diff = compute_diff(old, new)
+        encoded = compute_encoded_diff(old, new)
+
+        assert apply_diff(old, encoded) == new
+        assert decode_diff(encoded) == json_diff
+        assert encode_diff(json_diff) == encoded
+
+    def test_smaller_than_json(self):
+        """Test that encoded diffs are more compact than JSON ones."""
+        old = "Lorem ipsum dolor sit amet, consectetur adipiscing elit. " * 100
+        new = old.replace("dolor", "dolorem")
+
+        assert len(compute_encoded_diff(old, new)) < len(compute_diff(old, new)) / 4
+
+    def test_text_diff(self):
+        """Test that initial text rows are stored as plain text."""
+        encoded = encode_text_diff("Привет")
+
+        assert encoded[1:] == "Привет".encode()
+        assert apply_diff("", encoded) == "Привет"
+        assert json.loads(decode_diff(encoded)) == {
+            "ops": [["insert", 0, 0, "Привет"]],
+            "old_len": 0,
+        }
+
+    def test_non_sequential_ops(self):
+        """Test that diffs not covering the old text in order are rejected."""
+        diff = json.dumps({"ops": [["equal", 2, 4]], "old_len": 4})
+
+        with pytest.raises(ValueError):
+            encode_diff(diff)
+
+
+class TestDocumentCompression:
+    """Tests for original document compression helpers."""
+
+    def test_roundtrip(self):
+        """Test that compressed document is restored as is."""
+        data = "Привет, мир! Hello World!\n".encode() * 1000
+        blob = compress_document(data)
+        assert len(blob) < len(data)
+        assert decompress_document(blob) == data
+
+    def test_streaming_decompression(self):
+        """Test that chunked decompression yields the same content."""
+        data = bytes(range(256)) * 4096
+        blob = compress_document(data)
+        chunks = list(iter_decompressed(blob, chunk_size=1024))
+        assert len(chunks) > 1
+        assert all(len(chunk) <= 1024 for chunk in chunks)
+        assert b"".join(chunks) == data
+
+    def test_empty_document(self):
+        """Test that empty documents are supported."""
+        blob = compress_document(b"")
+        assert decompress_document(blob) == b""
+        assert b"".join(iter_decompressed(blob)) == b""
+
+
+class TestRepetitionGroup:
+    """Tests for repetition_group function."""
+
+    def test_same_source_same_group(self):
+        """Test that equal sources share a group."""
+        assert repetition_group("Hello World") == repetition_group("Hello World")
+
+    def test_different_sources_different_groups(self):
+        """Test that different sources get different groups."""
+        assert repetition_group("Hello World") != repetition_group("Hello world")
+
+    def test_unicode_normalization(self):
+        """Test that canonically equal sources share a group."""
+        composed = "Caf\u00e9"
+        decomposed = "Cafe\u0301"
+        assert composed != decomposed
+        assert repetition_group(composed) == repetition_group(decomposed)
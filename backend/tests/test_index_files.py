@@ -0,0 +1,100 @@
+import json
+import os
+from array import array
+
+import pytest
+
+from app.schema import DocumentTask
+from app.settings import settings
+from app.translation_memory import trigram_index, vector_index
+from app.translation_memory.index_files import IndexFileReader, write_index_file
+from app.translation_memory.models import TranslationMemory, TranslationMemoryRecord
+
+MODULES = pytest.mark.parametrize(
+    "module, task_type",
+    [(trigram_index, "build_tm_index"), (vector_index, "build_tm_embeddings")],
+)
+
+
+def add_memory(session, *sources: str) -> None:
+    session.add(
+        TranslationMemory(
+            name="test",
+            records=[
+                TranslationMemoryRecord(source=source, target="") for source in sources
+            ],
+            created_by=1,
+        )
+    )
+    session.commit()
+
+
+def test_index_file_is_read(tmp_path):
+    path = str(tmp_path / "1.idx")
+    # IDs do not fit 4 bytes
+    write_index_file(
+        path,
+        b"TEST0001",
+        {"records": 2, "name": "x"},
+        (array("q", [2**40, 7]), array("f", [0.5, 1.5])),
+    )
+
+    reader = IndexFileReader(path, b"TEST0001")
+    assert reader.header == {"records": 2, "name": "x"}
+    assert list(reader.take("q", 2)) == [2**40, 7]
+    assert list(reader.take("f", 2)) == [0.5, 1.5]
+    with pytest.raises(ValueError):
+        IndexFileReader(path, b"TEST0002")
+
+
+@MODULES
+def test_index_file_is_reloaded(session, tmp_path, monkeypatch, module, task_type):
+    monkeypatch.setattr(settings, "tm_index_dir", str(tmp_path))
+    with session as s:
+        add_memory(s, "Hello world")
+
+        # no file yet, SQLite has no worker, so the memory is indexed in process
+        assert module.get_index(s, 1).max_record_id == 1
+        assert module.is_in_process(1)
+
+        s.add(TranslationMemoryRecord(document_id=1, source="Good bye", target="B"))
+        s.commit()
+        module.build_index_file(s, 1)
+        assert os.path.exists(module.index_path(1))
+        assert list(module.get_index(s, 1).ids) == [1, 2]
+        assert not module.is_in_process(1)
+        assert not s.query(DocumentTask).all()
+
+        module.remove(1)
+        assert not os.path.exists(module.index_path(1))
+
+
+@MODULES
+def test_index_build_is_enqueued_outside_sqlite(
+    session, tmp_path, monkeypatch, module, task_type
+):
+    monkeypatch.setattr(settings, "tm_index_dir", str(tmp_path))
+    with session as s:
+        add_memory(s, "Hello world")
+        monkeypatch.setattr(s.get_bind().dialect, "name", "postgresql")
+
+        assert not module.get_index(s, 1).ids
+        assert not module.is_in_process(1)
+        # a pending task is not added again
+        module.forget(1)
+        module.get_index(s, 1)
+        assert [json.loads(task.data) for task in s.query(DocumentTask)] == [
+            {"memory_id": 1, "task_data": {"task_type": task_type}}
+        ]
+
+        module.build_index_file(s, 1)
+        assert module.get_index(s, 1).max_record_id == 1
+
+
+def test_index_is_built_in_process_without_directory(session):
+    with session as s:
+        add_memory(s, "Hello world")
+        assert trigram_index.get_index(s, 1).max_record_id == 1
+        assert trigram_index.is_in_process(1)
+        with pytest.raises(RuntimeError):
+            trigram_index.build_index_file(s, 1)
@@ -0,0 +1,30 @@
+from sqlalchemy import select, true
+from sqlalchemy.dialects import postgresql
+
+from app.documents.models import DocumentRecord
+from app.translation_memory.matcher import PgTrgmMatcher
+
+
+def compile_pg(statement) -> str:
+    return str(
+        statement.compile(
+            dialect=postgresql.dialect(), compile_kwargs={"literal_binds": True}
+        )
+    )
+
+
+def test_knn_scans_every_memory_by_equality():
+    sql = compile_pg(select(PgTrgmMatcher._nearest("hello", [1, 2], 10).subquery()))
+    # equality keeps each scan on records of its memory in the index
+    assert "translation_memory_record.document_id = 1 " in sql
+    assert "translation_memory_record.document_id = 2 " in sql
+    assert " IN (" not in sql
+    assert sql.count("LIMIT 10") == 3
+
+
+def test_lateral_knn_is_correlated():
+    nearest = PgTrgmMatcher._nearest(DocumentRecord.source, [1, 2], 10).lateral()
+    sql = compile_pg(select(DocumentRecord.id, nearest.c.id).join(nearest, true()))
+    assert "source <-> document_record.source" in sql
+    # document records are not joined again inside the scans
+    assert "FROM translation_memory_record, document_record" not in sql
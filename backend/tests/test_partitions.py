@@ -0,0 +1,38 @@
+import pytest
+
+from app.translation_memory.partitions import (
+    create_partition_sql,
+    merge_partition_sql,
+    partition_name,
+)
+
+
+def test_partition_name_takes_integers_only():
+    assert partition_name(12) == "translation_memory_record_tm_12"
+    with pytest.raises(ValueError):
+        partition_name("1; DROP TABLE users")  # type: ignore
+
+
+def test_create_partition_sql():
+    assert create_partition_sql(12) == [
+        "CREATE TABLE translation_memory_record_tm_12 "
+        "(LIKE translation_memory_record INCLUDING DEFAULTS)",
+        "ALTER TABLE translation_memory_record_tm_12 ADD CONSTRAINT "
+        "translation_memory_record_tm_12_document_id_check CHECK (document_id = 12)",
+        "INSERT INTO translation_memory_record_tm_12 "
+        "SELECT * FROM translation_memory_record_default WHERE document_id = 12",
+        "DELETE FROM translation_memory_record_default WHERE document_id = 12",
+        "ALTER TABLE translation_memory_record ATTACH PARTITION "
+        "translation_memory_record_tm_12 FOR VALUES IN (12)",
+        "ANALYZE translation_memory_record_tm_12",
+    ]
+
+
+def test_merge_partition_sql():
+    assert merge_partition_sql(12) == [
+        "ALTER TABLE translation_memory_record DETACH PARTITION "
+        "translation_memory_record_tm_12",
+        "INSERT INTO translation_memory_record "
+        "SELECT * FROM translation_memory_record_tm_12",
+        "DROP TABLE translation_memory_record_tm_12",
+    ]
@@ -0,0 +1,77 @@
+import pytest
+
+from app.settings import settings
+from app.translation_memory import trigram_index
+from app.translation_memory.models import TranslationMemory, TranslationMemoryRecord
+from app.translation_memory.trigram_index import TrigramIndex, similarity, trigrams
+
+
+def test_trigrams_follow_pg_trgm():
+    assert trigrams("word") == {"  w", " wo", "wor", "ord", "rd "}
+    assert trigrams("Word, word!") == trigrams("word")
+    assert trigrams("snake_case") == trigrams("snake case")
+    assert trigrams("...") == frozenset()
+    # SELECT similarity('word', 'two words') = 0.36363637
+    assert similarity(trigrams("word"), trigrams("two words")) == pytest.approx(
+        0.363636, abs=1e-6
+    )
+
+
+@pytest.mark.parametrize("threshold", [0.25, 0.5, 0.75, 1.0])
+def test_index_search_equals_full_scan(threshold: float, sentences):
+    sources = sentences(42, 300)
+    index = TrigramIndex.build(enumerate(sources, start=1))
+
+    for query in sources[:30]:
+        grams = trigrams(query)
+        expected = sorted(
+            (
+                (score, record_id)
+                for record_id, source in enumerate(sources, start=1)
+                if (score := similarity(grams, trigrams(source))) >= threshold
+            ),
+            key=lambda item: (-item[0], item[1]),
+        )[:10]
+        assert index.search(grams, threshold, 10) == pytest.approx(expected)
+
+
+def test_similarity_is_single_precision():
+    # pg_trgm returns real, 11/14 is 0.78571427 there
+    score = similarity(trigrams("hello world"), trigrams("hello worlds"))
+    assert score == trigram_index.float4(11 / 14)
+    assert score != 11 / 14
+
+
+def test_batch_search_equals_single_searches(sentences):
+    sources = sentences(7, 200)
+    index = TrigramIndex.build(enumerate(sources, start=1))
+    queries = [trigrams(source) for source in sources[:40]] + [frozenset()]
+
+    assert index.search_many(queries, 0.5, 5) == [
+        index.search(grams, 0.5, 5) for grams in queries
+    ]
+
+
+def test_batch_search_in_processes(session, tmp_path, monkeypatch, sentences):
+    monkeypatch.setattr(settings, "tm_index_dir", str(tmp_path))
+    monkeypatch.setattr(settings, "tm_search_processes", 2)
+    sources = sentences(3, 200)
+    with session as s:
+        s.add(
+            TranslationMemory(
+                name="test",
+                records=[
+                    TranslationMemoryRecord(source=source, target="")
+                    for source in sources
+                ],
+                created_by=1,
+            )
+        )
+        s.commit()
+        trigram_index.build_index_file(s, 1)
+
+        queries = [trigrams(source) for source in sources[:120]]
+        index = trigram_index.get_index(s, 1)
+        assert trigram_index.search_many(index, 1, queries, 0.5, 3) == (
+            index.search_many(queries, 0.5, 3)
+        )
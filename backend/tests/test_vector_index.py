@@ -0,0 +1,149 @@
+import os
+
+import pytest
+
+from app.settings import settings
+from app.translation_memory import embeddings, vector_index
+from app.translation_memory.embeddings import HashingEmbeddingProvider, Vector, dot
+from app.translation_memory.models import TranslationMemory, TranslationMemoryRecord
+from app.translation_memory.vector_index import VectorIndex
+
+
+def test_hashing_embeddings():
+    provider = HashingEmbeddingProvider(64)
+    first, reordered, other = provider.embed(
+        [
+            "The agreement is governed by law",
+            "By law the agreement is governed",
+            "Welcome home",
+        ]
+    )
+    assert dot(first, first) == pytest.approx(1.0)
+    assert dot(first, reordered) == pytest.approx(1.0)
+    assert dot(first, other) < 0.5
+    assert provider.embed(["The agreement is governed by law"])[0] == first
+    assert list(provider.embed(["..."])[0]) == [0.0] * 64
+
+
+def test_index_search_equals_full_scan(sentences):
+    provider = HashingEmbeddingProvider(32)
+    sources = sentences(42, 2500)
+    rows = list(enumerate(provider.embed(sources), start=1))
+    index = VectorIndex.build(rows, 32, "hashing:32")
+    assert len(index.starts) - 1 == 2
+
+    for query in provider.embed(sources[:10]):
+        expected = sorted(
+            ((dot(query, vector), record_id) for record_id, vector in rows),
+            key=lambda item: (-item[0], item[1]),
+        )[:5]
+        # every list is probed
+        assert index.search(query, 5, 2) == pytest.approx(expected)
+        # the nearest list has the query itself
+        assert index.search(query, 1, 1)[0][0] == pytest.approx(1.0)
+
+
+def test_index_file_of_another_provider_is_ignored(session, tmp_path, monkeypatch):
+    monkeypatch.setattr(settings, "tm_index_dir", str(tmp_path))
+    with session as s:
+        s.add(
+            TranslationMemory(
+                name="test",
+                records=[TranslationMemoryRecord(source="Hello world", target="A")],
+                created_by=1,
+            )
+        )
+        s.commit()
+
+        vector_index.build_index_file(s, 1)
+        assert os.path.exists(os.path.join(tmp_path, "1.vec"))
+        assert vector_index.get_index(s, 1).dimension == 256
+
+        # the provider is changed by a restart
+        monkeypatch.setattr(settings, "embedding_dimension", 32)
+        vector_index.forget(1)
+        assert vector_index.get_index(s, 1).dimension == 32
+
+        vector_index.remove(1)
+        assert not os.path.exists(os.path.join(tmp_path, "1.vec"))
+
+
+def test_records_added_after_build_are_embedded_once(session, tmp_path, monkeypatch):
+    monkeypatch.setattr(settings, "tm_index_dir", str(tmp_path))
+    embedded = []
+
+    class CountingProvider(HashingEmbeddingProvider):
+        def embed(self, texts: list[str]) -> list[Vector]:
+            embedded.extend(texts)
+            return super().embed(texts)
+
+    monkeypatch.setattr(
+        embeddings,
+        "get_provider",
+        lambda: CountingProvider(settings.embedding_dimension),
+    )
+    with session as s:
+        s.add(
+            TranslationMemory(
+                name="test",
+                records=[TranslationMemoryRecord(source="Hello world", target="A")],
+                created_by=1,
+            )
+        )
+        s.commit()
+        vector_index.build_index_file(s, 1)
+        s.add_all(
+            [
+                TranslationMemoryRecord(
+                    document_id=1, source="Hello world!", target="B"
+                ),
+                TranslationMemoryRecord(document_id=1, source="Good bye", target="C"),
+            ]
+        )
+        s.commit()
+        embedded.clear()
+
+        query = embeddings.get_provider().embed(["Hello world"])[0]
+        for _ in range(2):
+            found = vector_index.search(s, [1], query, 3)
+            assert [record_id for _, record_id in found] == [1, 2, 3]
+        assert embedded == ["Hello world", "Hello world!", "Good bye"]
+
+        # records over the limit are missed until the file is rebuilt
+        monkeypatch.setattr(settings, "tm_index_max_unindexed", 1)
+        found = vector_index.search(s, [1], query, 3)
+        assert [record_id for _, record_id in found] == [1, 2]
+        assert list(vector_index.get_index(s, 1).recent) == [2]
+
+
+def test_index_file_equals_index_built_in_process(
+    session, tmp_path, monkeypatch, sentences
+):
+    monkeypatch.setattr(settings, "tm_index_dir", str(tmp_path))
+    with session as s:
+        s.add(
+            TranslationMemory(
+                name="test",
+                # distinct sources, so the nearest record of a vector is itself
+                records=[
+                    TranslationMemoryRecord(source=f"{source} {i}", target="")
+                    for i, source in enumerate(sentences(5, 2100))
+                ],
+                created_by=1,
+            )
+        )
+        s.commit()
+
+        built = VectorIndex.build_for_memory(s, 1)
+        assert len(built.starts) - 1 == 2
+        vector_index.build_index_file(s, 1)
+        loaded = VectorIndex.load(str(tmp_path / "1.vec"))
+        assert list(loaded.ids) == list(built.ids)
+        assert sorted(loaded.ids) == list(range(1, 2101))
+        assert list(loaded.starts) == list(built.starts)
+        assert list(loaded.centroids) == list(built.centroids)
+        assert list(loaded.vectors) == list(built.vectors)
+        assert loaded.max_record_id == 2100
+        # records are grouped by their nearest centroid
+        query = built.vector(0)
+        assert loaded.search(query, 1, 1) == [(pytest.approx(1.0), built.ids[0])]
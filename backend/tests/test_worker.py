@@ -1,5 +1,5 @@
 import json
-from datetime import datetime
+from datetime import UTC, datetime
 
 import pytest
 from sqlalchemy.orm import Session
@@ -9,16 +9,22 @@ from app.documents.models import (
     Document,
     DocumentRecord,
     DocumentRecordHistoryChangeType,
+    DocumentRecordMatch,
+    DocumentTmAnalysis,
     DocumentType,
+    TmAnalysisStatus,
     TxtDocument,
     TxtRecord,
     XliffDocument,
     XliffRecord,
 )
 from app.documents.schema import (
+    AnalyzeTmLeverageTaskData,
+    CacheTmMatchesTaskData,
     CreateSegmentsTaskData,
     DocumentTaskDescription,
     FinalizeDocumentTaskData,
+    FlushApprovedTaskData,
     MatchSegmentsSettings,
     MatchSegmentsTaskData,
     SubstituteSegmentsSettings,
@@ -37,7 +43,14 @@ from app.projects.models import (
     ProjectTmAssociation,
 )
 from app.schema import DocumentTask
+from app.settings import settings
+from app.translation_memory import trigram_index, vector_index
 from app.translation_memory.models import TranslationMemory, TranslationMemoryRecord
+from app.translation_memory.schema import (
+    BuildTmEmbeddingsTaskData,
+    BuildTmIndexTaskData,
+    MemoryTaskDescription,
+)
 from main_worker import process_task
 
 
@@ -647,3 +660,266 @@ def test_process_task_match_segments(session: Session):
         assert doc.records[2].source == "The end"
         assert doc.records[2].target == ru_segments[2]
         assert len(doc.records[2].history) == 1
+
+
+def test_process_task_cache_tm_matches(session: Session):
+    with session as s:
+        s.add_all(
+            [
+                Project(name="test", created_by=1),
+                create_doc(name="test.txt", type_=DocumentType.txt),
+            ]
+        )
+        s.commit()
+        s.add(DocumentRecord(document_id=1, source="Hello world", target=""))
+        s.add(DocumentRecordMatch(record_id=1, tm_record_id=1, similarity=0.9))
+        task = DocumentTask(
+            data=DocumentTaskDescription(
+                document_id=1,
+                task_data=CacheTmMatchesTaskData(task_type="cache_tm_matches"),
+            ).model_dump_json(),
+            status="pending",
+        )
+        s.add(task)
+        s.commit()
+
+        assert process_task(s, task)
+
+        # the project has no memories, so there are no matches left
+        doc = s.query(Document).filter_by(id=1).one()
+        assert doc.matches_updated_at is not None
+        assert s.query(DocumentRecordMatch).count() == 0
+
+
+def test_process_task_analyze_tm_leverage(session: Session):
+    with session as s:
+        s.add_all(
+            [
+                TranslationMemory(
+                    name="test",
+                    records=[
+                        # a variant scoring 1.0 with a lower ID than the source
+                        TranslationMemoryRecord(source="hello world", target="V"),
+                        TranslationMemoryRecord(source="Hello worlds", target="B"),
+                        TranslationMemoryRecord(source="Good bye", target="C"),
+                        TranslationMemoryRecord(source="Hello world", target="A"),
+                    ],
+                    created_by=1,
+                ),
+                Project(name="test", created_by=1),
+                create_doc(name="test.txt", type_=DocumentType.txt),
+                ProjectTmAssociation(project_id=1, tm_id=1, mode="read"),
+            ]
+        )
+        s.commit()
+        s.add_all(
+            [
+                DocumentRecord(
+                    document_id=1, source="Hello world", target="", word_count=2
+                ),
+                DocumentRecord(
+                    document_id=1, source="Hello world!", target="", word_count=2
+                ),
+                DocumentRecord(
+                    document_id=1, source="Hello world", target="", word_count=2
+                ),
+                DocumentRecord(
+                    document_id=1, source="Good bye now", target="", word_count=3
+                ),
+                DocumentRecord(
+                    document_id=1, source="Nothing", target="", word_count=1
+                ),
+                DocumentRecordMatch(record_id=1, tm_record_id=1, similarity=1.0),
+                DocumentRecordMatch(record_id=1, tm_record_id=4, similarity=1.0),
+                DocumentRecordMatch(record_id=2, tm_record_id=1, similarity=1.0),
+                DocumentRecordMatch(record_id=2, tm_record_id=4, similarity=1.0),
+                DocumentRecordMatch(record_id=3, tm_record_id=1, similarity=1.0),
+                DocumentRecordMatch(record_id=4, tm_record_id=3, similarity=0.8),
+                DocumentRecordMatch(record_id=5, tm_record_id=3, similarity=0.6),
+            ]
+        )
+        s.query(Document).filter_by(id=1).one().matches_updated_at = datetime.now(UTC)
+        task = DocumentTask(
+            data=DocumentTaskDescription(
+                document_id=1,
+                task_data=AnalyzeTmLeverageTaskData(task_type="analyze_tm_leverage"),
+            ).model_dump_json(),
+            status="pending",
+        )
+        s.add(task)
+        s.commit()
+
+        assert process_task(s, task)
+
+        analysis = s.query(DocumentTmAnalysis).filter_by(document_id=1).one()
+        assert analysis.status == TmAnalysisStatus.done
+        assert analysis.processed_records == analysis.total_records == 5
+        assert (analysis.repetitions_segments, analysis.repetitions_words) == (1, 2)
+        assert (analysis.exact_segments, analysis.exact_words) == (1, 2)
+        # "Hello world!" only has variants ignoring punctuation
+        assert (analysis.fuzzy_95_segments, analysis.fuzzy_95_words) == (1, 2)
+        assert (analysis.fuzzy_85_segments, analysis.fuzzy_85_words) == (0, 0)
+        assert (analysis.fuzzy_75_segments, analysis.fuzzy_75_words) == (1, 3)
+        assert (analysis.no_match_segments, analysis.no_match_words) == (1, 1)
+
+
+def test_process_task_flush_approved(session: Session):
+    with session as s:
+        s.add_all(
+            [
+                TranslationMemory(
+                    name="test",
+                    records=[
+                        TranslationMemoryRecord(
+                            source="Hello world",
+                            target="Old",
+                            creation_date=datetime(2000, 1, 1),
+                            change_date=datetime(2000, 1, 1),
+                        ),
+                    ],
+                    created_by=1,
+                ),
+                Project(name="test", created_by=1),
+                create_doc(name="test.txt", type_=DocumentType.txt),
+                ProjectTmAssociation(project_id=1, tm_id=1, mode="write"),
+            ]
+        )
+        s.commit()
+        s.add_all(
+            [
+                DocumentRecord(
+                    document_id=1, source="Hello world", target="New", approved=True
+                ),
+                DocumentRecord(
+                    document_id=1, source="Good bye", target="Bye", approved=True
+                ),
+                DocumentRecord(
+                    document_id=1, source="Draft", target="Not yet", approved=False
+                ),
+            ]
+        )
+        task = DocumentTask(
+            data=DocumentTaskDescription(
+                document_id=1,
+                task_data=FlushApprovedTaskData(task_type="flush_approved"),
+            ).model_dump_json(),
+            status="pending",
+        )
+        s.add(task)
+        s.commit()
+
+        assert process_task(s, task)
+
+        records = (
+            s.query(TranslationMemoryRecord).order_by(TranslationMemoryRecord.id).all()
+        )
+        assert [(r.source, r.target) for r in records] == [
+            ("Hello world", "New"),
+            ("Good bye", "Bye"),
+        ]
+        assert records[0].creation_date == datetime(2000, 1, 1)
+        assert records[0].change_date.date() == datetime.now(UTC).date()
+
+
+def test_process_task_build_tm_index(session: Session, tmp_path, monkeypatch):
+    monkeypatch.setattr(settings, "tm_index_dir", str(tmp_path))
+    with session as s:
+        s.add(
+            TranslationMemory(
+                name="test",
+                records=[TranslationMemoryRecord(source="Hello world", target="A")],
+                created_by=1,
+            )
+        )
+        task = DocumentTask(
+            data=MemoryTaskDescription(
+                memory_id=1,
+                task_data=BuildTmIndexTaskData(task_type="build_tm_index"),
+            ).model_dump_json(),
+            status="pending",
+        )
+        s.add(task)
+        s.commit()
+
+        assert process_task(s, task)
+
+        assert (tmp_path / "1.trgm").exists()
+        assert trigram_index.get_index(s, 1).max_record_id == 1
+        assert s.query(DocumentTask).count() == 0
+
+
+def test_process_task_build_tm_embeddings(session: Session, tmp_path, monkeypatch):
+    monkeypatch.setattr(settings, "tm_index_dir", str(tmp_path))
+    with session as s:
+        s.add(
+            TranslationMemory(
+                name="test",
+                records=[TranslationMemoryRecord(source="Hello world", target="A")],
+                created_by=1,
+            )
+        )
+        task = DocumentTask(
+            data=MemoryTaskDescription(
+                memory_id=1,
+                task_data=BuildTmEmbeddingsTaskData(task_type="build_tm_embeddings"),
+            ).model_dump_json(),
+            status="pending",
+        )
+        s.add(task)
+        s.commit()
+
+        assert process_task(s, task)
+
+        assert (tmp_path / "1.vec").exists()
+        assert vector_index.get_index(s, 1).max_record_id == 1
+        assert s.query(DocumentTask).count() == 0
+
+
+def test_process_task_substitutes_fuzzy_matches(session: Session):
+    with session as s:
+        s.add_all(
+            [
+                TranslationMemory(
+                    name="test",
+                    records=[
+                        TranslationMemoryRecord(source="Hello worlds", target="A"),
+                        TranslationMemoryRecord(source="Hello world!", target="B"),
+                    ],
+                    created_by=1,
+                ),
+                Project(name="test", created_by=1),
+                create_doc(name="test.txt", type_=DocumentType.txt),
+                ProjectTmAssociation(project_id=1, tm_id=1, mode="read"),
+            ]
+        )
+        s.commit()
+        s.add_all(
+            [
+                DocumentRecord(document_id=1, source="Hello world", target=""),
+                DocumentRecord(document_id=1, source="Hello world.", target=""),
+                DocumentRecord(document_id=1, source="Something else", target=""),
+            ]
+        )
+        task = DocumentTask(
+            data=DocumentTaskDescription(
+                document_id=1,
+                task_data=SubstituteSegmentsTaskData(
+                    task_type="substitute_segments",
+                    settings=SubstituteSegmentsSettings(similarity_threshold=0.75),
+                ),
+            ).model_dump_json(),
+            status="pending",
+        )
+        s.add(task)
+        s.commit()
+
+        assert process_task(s, task)
+
+        records = s.query(DocumentRecord).order_by(DocumentRecord.id).all()
+        # punctuation is not a part of trigrams, the best match is exact
+        assert [record.target for record in records] == ["B", "B", ""]
+        assert not records[0].approved
+        assert (
+            records[0].history[-1].change_type
+            == DocumentRecordHistoryChangeType.tm_substitution
+        )
@@ -10,13 +10,15 @@ from app.formats.xliff import extract_xliff_content
 from app.glossary.models import GlossaryRecord
 from app.translation_memory.models import TranslationMemoryRecord
 from app.translation_memory.query import TranslationMemoryQuery
+from app.translation_memory.schema import MemorySubstitution
+from app.translation_memory.utils import source_hash
 from worker.types import RecordSource, WorkerSegment
 
 
 def extract_segments_from_file(doc: Document) -> Sequence[WorkerSegment]:
     if doc.type == DocumentType.xliff:
         xliff_document = doc.xliff
-        xliff_data = extract_xliff_content(xliff_document.original_document.encode())
+        xliff_data = extract_xliff_content(xliff_document.original_bytes)
         return [
             WorkerSegment(type_="xliff", original_segment=segment)
             for segment in xliff_data.segments
@@ -39,6 +41,7 @@ def find_segment_translation(
     tm_ids: list[int],
     glossary_ids: list[int],
     session: Session,
+    substitutions: list[MemorySubstitution] | None = None,
 ) -> tuple[str, RecordSource | None] | None:
     # TODO: this would be nice to have batching for all segments to reduce amounts of requests to DB
     if source.isdigit():
@@ -56,16 +59,20 @@ def find_segment_translation(
         return glossary_record.target, RecordSource.glossary
 
     if threshold < 1.0:
-        substitutions = TranslationMemoryQuery(session).get_substitutions(
-            source, tm_ids, threshold, 1
-        )
+        if substitutions is None:
+            substitutions = TranslationMemoryQuery(session).get_substitutions(
+                source, tm_ids, threshold, 1
+            )
         if substitutions:
             return substitutions[0].target, RecordSource.translation_memory
     else:
         selector = (
             select(TranslationMemoryRecord.source, TranslationMemoryRecord.target)
-            .where(TranslationMemoryRecord.source == source)
-            .where(TranslationMemoryRecord.document_id.in_(tm_ids))
+            .where(
+                TranslationMemoryRecord.document_id.in_(tm_ids),
+                TranslationMemoryRecord.source_hash == source_hash(source),
+                TranslationMemoryRecord.source == source,
+            )
             .order_by(TranslationMemoryRecord.change_date.desc())
         )
         tm_data = session.execute(selector.limit(1)).first()